@@ -0,0 +1,45 @@
+import os
+import tarfile
+
+# Extensions of the TED daily packages
+ARCHIVES = ('.tar.gz', '.tgz', '.tar')
+
+
+def is_archive(path):
+    """
+    Check if a file is a TED package
+    :param path:
+    :return: True for tar archives, compressed or not
+    """
+
+    return path.lower().endswith(ARCHIVES)
+
+
+def iter_archive(path):
+    """
+    Read the notices of a TED package without unpacking it.
+    Members are streamed out of the archive in order: the archive is read
+    once, sequentially, and nothing is written to disk
+    :param path: tar.gz package, e.g. 20160103_001.tar.gz
+    :return: generator of (member name, file-like object). The file object
+             is only valid until the next member is read
+    """
+
+    with tarfile.open(path, mode='r|*') as tar:
+        for member in tar:
+            if member.isfile() and member.name.lower().endswith('.xml'):
+                yield member.name, tar.extractfile(member)
+
+
+def source(path, member):
+    """
+    Origin of a notice read from a TED package, carried into its record
+    :param path: tar.gz package
+    :param member: name of the notice in the package
+    :return: dictionary:
+        - ARCHIVE: file name of the package
+        - MEMBER: name of the notice in the package
+    """
+
+    return {'ARCHIVE': os.path.basename(path),
+            'MEMBER': member}
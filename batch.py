@@ -0,0 +1,687 @@
+import os
+import sys
+import json
+import signal
+import argparse
+import resource
+import threading
+import traceback
+from contextlib import contextmanager
+from collections import deque, Counter
+from multiprocessing import Pool, cpu_count
+
+from lxml import etree
+
+import lookups
+from extractor import extract, extract_tree
+from validator import schema, prune, validate_batch, vectorized
+from fused import extract_valid
+from archive import is_archive, iter_archive, source
+from manifest import Manifest, version
+from deadletter import DeadLetters
+from interning import intern_record
+from prefilter import DOCUMENT_TYPES, Skipped, parse as parse_notice
+import profiling
+
+
+def iter_notices(paths):
+    """
+    List the xml files and TED packages to process, as the paths are read
+    :param paths: iterable of files and/or folders (e.g. monthly YYYY-MM
+                  folders)
+    :return: generator of xml files and tar.gz packages. Folders are
+             listed non-recursively and sorted, files are kept as given
+    """
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(os.path.join(path, f)
+                              for f in os.listdir(path)
+                              if f.lower().endswith('.xml') or
+                              is_archive(f))
+        else:
+            yield path
+
+
+def list_notices(paths):
+    """
+    List the xml files and TED packages to process
+    :param paths: files and/or folders (e.g. monthly YYYY-MM folders)
+    :return: sorted list of xml files and tar.gz packages, see
+             iter_notices()
+    """
+
+    return list(iter_notices(paths))
+
+
+def failure(path, stage, exc):
+    """
+    Build an entry of the error report
+    :param path: file that failed, or archive:member for packages
+    :param stage: 'read', 'extract', 'validate', or 'prefilter' for the
+                  skipped notices
+    :param exc: exception raised
+    :return: dictionary describing the failure
+    """
+
+    # Skipped notices are frequent and not errors: no traceback to format
+    trace = None if stage == 'prefilter' else exc.__traceback__
+    return {'path': path,
+            'stage': stage,
+            'error': type(exc).__name__,
+            'message': str(exc),
+            'traceback': ''.join(traceback.format_exception(
+                type(exc), exc, trace))}
+
+
+class Timeout(Exception):
+    """
+    A notice took longer than the time limit of process()
+    """
+
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raise Timeout in the block once the time limit is reached. Relies on
+    SIGALRM: it has no effect outside the main thread, and a long call in
+    lxml is only interrupted when it returns
+    :param seconds: time limit, None for no limit
+    """
+
+    if not seconds or threading.current_thread() is not \
+            threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise Timeout('Time limit of {}s exceeded'.format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@contextmanager
+def memory_limit(megabytes):
+    """
+    Limit the address space of the process in the block: allocations above
+    the limit raise MemoryError, in the notice which needs them, instead of
+    swapping or getting the worker killed. Only used in worker processes,
+    around a single notice, after preload()
+    :param megabytes: maximum size of the address space, None for no limit
+    """
+
+    if not megabytes:
+        yield
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = megabytes * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def preload():
+    """
+    Load the lookups and import pandas before a memory limit is set. They
+    are loaded once per process: under the limit, the first notice would
+    fail with MemoryError, or a library abort the process (e.g. OpenBLAS)
+    """
+
+    lookups.get()
+    vectorized()
+
+
+def process(path, validate=True, name=None, origin=None, languages=None,
+            fused=False, timeout=None, prefilter=None, memory=None):
+    """
+    Extract, validate and prune a single notice. Failures are isolated: any
+    error, including a Timeout or a MemoryError, is returned for this
+    notice only
+    :param path: xml file, or file-like object
+    :param validate: run the validation schema and prune the result
+    :param name: name of the notice in the error report, defaults to path
+    :param origin: SOURCE of the record, for notices read from a package
+    :param languages: preferred translations, see extractor.extract()
+    :param fused: extract, validate and prune in a single traversal (see
+                  fused.py). Notices it does not handle go through the
+                  three steps, on the same parsed document
+    :param timeout: time limit of each stage, in seconds. None for no limit
+    :param memory: memory limit of each stage in MB, see memory_limit().
+                   None for no limit
+    :param prefilter: TD_DOCUMENT_TYPE codes to extract: the head of the
+                      notice is read first, and the other notices are
+                      skipped (see prefilter.py). None reads every notice
+    :return: tuple (record, error). record is None when the notice failed,
+             error is None when it succeeded. A skipped notice is an error
+             of the 'prefilter' stage
+    """
+
+    if name is None:
+        name = path
+
+    try:
+        with time_limit(timeout), memory_limit(memory):
+            root = None
+            if prefilter is not None:
+                root, _ = parse_notice(path, prefilter)
+            elif validate and fused:
+                root = etree.parse(path).getroot()
+
+            if root is not None and validate and fused:
+                try:
+                    return extract_valid(root, languages, origin), None
+                except (Timeout, MemoryError):
+                    raise
+                except Exception:
+                    pass  # The three steps give the output or the error
+
+            if root is not None:
+                data = extract_tree(root, languages)
+            else:
+                data = extract(path, languages=languages)
+    except Skipped as e:
+        return None, failure(name, 'prefilter', e)
+    except Exception as e:
+        return None, failure(name, 'extract', e)
+
+    if origin is not None:
+        data['SOURCE'] = origin
+
+    if validate:
+        try:
+            with time_limit(timeout), memory_limit(memory):
+                data = schema(data)
+        except Exception as e:
+            return None, failure(name, 'validate', e)
+        prune(data)
+
+    return data, None
+
+
+def validate_chunk(results, timeout=None, memory=None):
+    """
+    Validate and prune the records of a unit of work at once. If the batch
+    validation fails as a whole (e.g. MemoryError), the records are
+    validated one by one, and only the notices which fail are reported
+    :param results: list of (path, record, error) of extracted notices
+    :param timeout: time limit of each record when they are validated one
+                    by one, in seconds
+    :param memory: memory limit of the batch, and of each record when they
+                   are validated one by one, in MB
+    :return: list of (path, record, error), with the records validated
+    """
+
+    done = [n for n, (_, _, error) in enumerate(results) if error is None]
+    try:
+        with memory_limit(memory):
+            data, errors = validate_batch([results[n][1] for n in done])
+    except Exception:
+        return validate_each(results, timeout, memory)
+
+    results = list(results)
+    for n, record in zip(done, data):
+        results[n] = (results[n][0], record, None)
+    for i, e in errors:
+        path = results[done[i]][0]
+        results[done[i]] = (path, None, failure(path, 'validate', e))
+
+    for _, record, _ in results:
+        if record is not None:
+            prune(record)
+    return results
+
+
+def validate_each(results, timeout=None, memory=None):
+    """
+    Validate and prune the records of a unit of work one by one, with the
+    schema
+    :param results: list of (path, record, error) of extracted notices
+    :param timeout: time limit of a record, in seconds
+    :param memory: memory limit of a record, in MB
+    :return: list of (path, record, error), with the records validated
+    """
+
+    validated = []
+    for path, record, error in results:
+        if error is None:
+            try:
+                with time_limit(timeout), memory_limit(memory):
+                    record = schema(record)
+                prune(record)
+            except Exception as e:
+                record, error = None, failure(path, 'validate', e)
+        validated.append((path, record, error))
+    return validated
+
+
+def process_chunk(args):
+    """
+    Process a unit of work in a worker process.
+    Notices are extracted one by one, then validated in a single batch
+    :param args: tuple (paths, options), options are passed to process(),
+                 except intern: share one copy of each name across the
+                 records, see interning.intern_record()
+    :return: list of (path, record, error) in the same order as paths.
+             Notices of packages are named archive:member
+    """
+
+    paths, options = args
+    options = dict(options)
+    validate = options.pop('validate', True)
+    intern = options.pop('intern', False)
+    fused = options.get('fused', False)  # Validated one by one
+    if options.get('memory'):
+        preload()
+
+    results = []
+    for path in paths:
+        if not is_archive(path):
+            results.append((path,) + process(path, validate=fused,
+                                             **options))
+            continue
+
+        try:
+            for member, f in iter_archive(path):
+                name = path + ':' + member
+                results.append((name,) + process(
+                    f, validate=fused, name=name,
+                    origin=source(path, member), **options))
+        except Exception as e:  # Corrupted or truncated package
+            results.append((path, None, failure(path, 'read', e)))
+
+    if validate and not fused:
+        results = validate_chunk(results, options.get('timeout'),
+                                 options.get('memory'))
+
+    if intern:
+        pool = {}
+        for _, record, _ in results:
+            if record is not None:
+                intern_record(record, pool)
+    return results
+
+
+def profile_chunk(args):
+    """
+    Process a unit of work with the instrumentation enabled
+    :param args: see process_chunk()
+    :return: tuple (results, snapshot): results of process_chunk() and
+             counters of the worker, see profiling.Profile.snapshot()
+    """
+
+    with profiling.enabled(batch=sys.modules[__name__]) as profile:
+        results = process_chunk(args)
+    return results, profile.snapshot()
+
+
+def chunked(files, size):
+    """
+    Split files into units of work
+    :param files: xml files and packages
+    :param size: number of xml files in a unit
+    :return: generator of lists of up to size xml files, or of a single
+             package
+    """
+
+    chunk = []
+    for path in files:
+        if is_archive(path):
+            if chunk:
+                yield chunk
+                chunk = []
+            yield [path]
+        else:
+            chunk.append(path)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def record_chunk(manifest, chunk, results, commit=True):
+    """
+    Record the files of a processed unit of work in the manifest
+    :param manifest: Manifest
+    :param chunk: files of the unit of work
+    :param results: list of (path, record, error) of the unit of work
+    :param commit: save the manifest, with the units recorded before
+    """
+
+    for path in chunk:
+        errors = sum(1 for name, _, error in results
+                     if error is not None and
+                     (name == path or name.startswith(path + ':')))
+        manifest.done(path, errors)
+    if commit:
+        manifest.commit()
+
+
+def is_oth_not(record):
+    """
+    :param record: record, validated (OTH_NOT is 'YES' or 'NO') or only
+                   extracted (['YES'] or ['NO'])
+    :return: whether the form of the notice is an OTH_NOT form
+    """
+
+    value = record['CONTRACT'].get('OTH_NOT')
+    if isinstance(value, list):
+        value = value[0] if len(value) == 1 else None
+    return value == 'YES'
+
+
+def route(results, skipped=None):
+    """
+    Leave out the notices skipped by the prefilter of a unit of work
+    :param results: list of (path, record, error)
+    :param skipped: collections.Counter updated with the number of skipped
+                    notices by reason, and of OTH_NOT notices (read from
+                    their head only). None to only leave them out
+    :return: list of (path, record, error) of the other notices
+    """
+
+    kept = []
+    for path, record, error in results:
+        if error is not None and error['stage'] == 'prefilter':
+            if skipped is not None:
+                skipped[error['message']] += 1
+            continue
+        if skipped is not None and record is not None and \
+                is_oth_not(record):
+            skipped['OTH_NOT (head only)'] += 1
+        kept.append((path, record, error))
+    return kept
+
+
+def bounded_imap(pool, function, iterable, window):
+    """
+    Ordered pool.imap with a bounded number of units of work in flight.
+    pool.imap submits every task at once and keeps the results until they
+    are consumed: with a slow consumer, memory grows with the input. Here a
+    new unit is only submitted when the oldest one is consumed, so workers
+    wait for the consumer (backpressure)
+    :param pool: multiprocessing Pool
+    :param function: function to apply
+    :param iterable: arguments of the function
+    :param window: maximum number of units submitted and not consumed
+    :return: generator of results, in the order of iterable
+    """
+
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_extract(paths, workers=None, chunksize=64, validate=True,
+                 manifest=None, profile=None, languages=None, window=None,
+                 fused=False, timeout=None, memory=None, dead_letters=None,
+                 intern=False, prefilter=None, skipped=None, flush=None):
+    """
+    Process notices over a pool of worker processes
+    :param paths: files and/or folders of xml notices or TED packages. An
+                  iterator is read as the units of work are submitted, e.g.
+                  packages as their download finishes (see fetcher.py)
+    :param workers: number of processes. Defaults to the number of cores,
+                    1 processes the files in the current process
+    :param chunksize: number of files sent to a worker at once
+    :param validate: run the validation schema and prune the records
+    :param manifest: Manifest of an incremental run: only new or changed
+                     files are processed, and they are recorded once their
+                     unit of work is consumed. None processes all files
+    :param profile: profiling.Profile updated with the counters of the
+                    workers, None to run without instrumentation
+    :param languages: preferred translations, see extractor.extract()
+    :param window: maximum number of units of work processed ahead of the
+                   consumer, defaults to twice the number of workers. Bounds
+                   the memory whatever the number of files
+    :param fused: extract, validate and prune in a single traversal, see
+                  process()
+    :param timeout: time limit of a notice in seconds, see process()
+    :param memory: memory limit of each notice in MB, see memory_limit().
+                   It is only set in worker processes: with a limit, a
+                   single worker does not run in the current process
+    :param dead_letters: deadletter.DeadLetters storing the failed notices
+                         for replay, None to only report them
+    :param intern: share one copy of the repeated names (authority,
+                   contractor name, town, address) across the records of a
+                   unit of work, which is then sent once per unit
+    :param prefilter: TD_DOCUMENT_TYPE codes to extract, the other notices
+                      are skipped from their head (see prefilter.py). None
+                      reads every notice
+    :param skipped: collections.Counter updated with the number of notices
+                    skipped by reason, and of OTH_NOT notices read from
+                    their head only. Skipped notices are not yielded
+    :param flush: with a manifest, function called once the records of a
+                  unit of work are consumed. It writes out the records the
+                  consumer keeps in memory and returns True, so that the
+                  manifest is saved, or returns False to save it with a
+                  later unit. None saves the manifest after each unit: the
+                  consumer must have written the records
+    :return: generator of (path, record, error), in the order of the input
+             files whatever the number of workers
+    """
+
+    files = iter_notices(paths)
+    if manifest is not None:
+        files = manifest.stale(list(files))
+
+    options = {'validate': validate, 'languages': languages, 'fused': fused,
+               'timeout': timeout, 'memory': memory, 'intern': intern,
+               'prefilter': prefilter}
+    chunks = deque()  # Units of work submitted, and not consumed yet
+
+    def work():
+        for chunk in chunked(files, chunksize):
+            chunks.append(chunk)
+            yield chunk, options
+
+    function = process_chunk if profile is None else profile_chunk
+
+    if workers is None:
+        workers = cpu_count()
+
+    pool = None
+    if workers <= 1 and not memory:
+        outputs = map(function, work())
+    else:
+        pool = Pool(max(workers, 1))
+        # Results are in the order of the chunks, they are deterministic
+        outputs = bounded_imap(pool, function, work(), window or 2 * workers)
+
+    try:
+        for results in outputs:
+            chunk = chunks.popleft()
+            if profile is not None:
+                results, snapshot = results
+                profile.merge(snapshot)
+            if prefilter is not None:
+                results = route(results, skipped)
+            yield from results
+            if dead_letters is not None:
+                dead_letters.record(results)
+            if manifest is not None:
+                record_chunk(manifest, chunk, results,
+                             flush is None or flush())
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def extract_dir(paths, workers=None, chunksize=64, validate=True):
+    """
+    Main function to extract a batch of notices in parallel. The records
+    are kept in memory: incremental runs go through iter_extract() (or
+    pipeline.run()), so that the manifest is saved once they are written
+    :param paths: files and/or folders of xml notices or TED packages
+    :param workers: number of processes. Defaults to the number of cores
+    :param chunksize: number of files sent to a worker at once
+    :param validate: run the validation schema and prune the records
+    :return: tuple (records, errors):
+        - records: list of extracted records, in input order. Failed
+                   notices are left out
+        - errors: list of failures, see failure()
+    """
+
+    records = []
+    errors = []
+    for path, record, error in iter_extract(paths, workers, chunksize,
+                                            validate):
+        if error is None:
+            records.append(record)
+        else:
+            errors.append(error)
+
+    return records, errors
+
+
+def month_folders(root, years, months=None):
+    """
+    List the monthly folders of a TED dump, e.g. /Volumes/WD/S8/2015-01
+    :param root: folder containing the YYYY-MM folders
+    :param years: list of years
+    :param months: list of months, defaults to the whole year
+    :return: list of existing monthly folders
+    """
+
+    if months is None:
+        months = ['{:02d}'.format(m) for m in range(1, 13)]
+
+    folders = [os.path.join(root, Y + '-' + M) for Y in years for M in months]
+    return [folder for folder in folders if os.path.isdir(folder)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract TED Contract award notices in parallel')
+    parser.add_argument('paths', nargs='*',
+                        help='xml files, tar.gz packages or folders')
+    parser.add_argument('--root', help='folder with YYYY-MM sub-folders')
+    parser.add_argument('--years', nargs='+', default=[],
+                        help='years to process under --root')
+    parser.add_argument('--months', nargs='+',
+                        help='months to process under --root')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=64,
+                        help='files sent to a worker at once')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='only extract, skip validation and pruning')
+    parser.add_argument('--fused', action='store_true',
+                        help='extract, validate and prune each notice in a '
+                             'single traversal')
+    parser.add_argument('--languages', nargs='+',
+                        help='preferred translations, in order of preference '
+                             '(default: EN FR DE)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='JSON lines output file (default: stdout)')
+    parser.add_argument('-e', '--errors',
+                        help='JSON file for the error report')
+    parser.add_argument('-p', '--profile',
+                        help='time the extractor functions and the stages, '
+                             'write the counters to this file in the '
+                             'Prometheus text format and print a summary')
+    parser.add_argument('-m', '--manifest',
+                        help='SQLite manifest: only process the files which '
+                             'are new or changed since the previous runs')
+    parser.add_argument('--timeout', type=float,
+                        help='time limit of a notice, in seconds')
+    parser.add_argument('--memory-limit', type=int,
+                        help='memory limit of a worker process while '
+                             'it processes a notice, in MB')
+    parser.add_argument('-d', '--dead-letters',
+                        help='folder storing the failed notices for replay '
+                             '(see deadletter.py)')
+    parser.add_argument('--intern', action='store_true',
+                        help='send one copy of the repeated names per unit '
+                             'of work (see interning.py)')
+    parser.add_argument('--prefilter', nargs='*', metavar='CODE',
+                        help='only extract these TD_DOCUMENT_TYPE codes '
+                             '(default: 7, Contract award), skipping the '
+                             'other notices from their head')
+    args = parser.parse_args(argv)
+
+    if args.prefilter == []:
+        args.prefilter = DOCUMENT_TYPES
+
+    paths = list(args.paths)
+    if args.root:
+        paths += month_folders(args.root, args.years, args.months)
+
+    profile = profiling.Profile() if args.profile else None
+
+    manifest = None
+    if args.manifest:
+        manifest = Manifest(args.manifest, version(not args.no_validate,
+                                                   args.prefilter))
+
+    dead_letters = None
+    if args.dead_letters:
+        dead_letters = DeadLetters(args.dead_letters)
+
+    skipped = Counter()
+    out = sys.stdout if args.output == '-' else open(args.output, 'w',
+                                                       encoding='utf-8')
+    errors = []
+    count = 0
+
+    def flush():
+        # The manifest records the files once their records are written
+        out.flush()
+        return True
+
+    try:
+        for path, record, error in iter_extract(paths, args.workers,
+                                                args.chunksize,
+                                                not args.no_validate,
+                                                manifest, profile,
+                                                args.languages,
+                                                fused=args.fused,
+                                                timeout=args.timeout,
+                                                memory=args.memory_limit,
+                                                dead_letters=dead_letters,
+                                                intern=args.intern,
+                                                prefilter=args.prefilter,
+                                                skipped=skipped,
+                                                flush=flush):
+            if error is None:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+            else:
+                errors.append(error)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if manifest is not None:
+            manifest.close()
+
+    if args.errors:
+        with open(args.errors, 'w', encoding='utf-8') as f:
+            json.dump(errors, f, indent=2, ensure_ascii=False)
+
+    print('{} notices extracted, {} failed'.format(count, len(errors)),
+          file=sys.stderr)
+    for reason, number in sorted(skipped.items()):
+        print('prefilter: {} {}'.format(number, reason), file=sys.stderr)
+
+    if profile is not None:
+        profile.write_prometheus(args.profile)
+        print(profile.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
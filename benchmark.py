@@ -0,0 +1,618 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+import argparse
+import resource
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import export
+import currency
+import extractor
+import records
+import validator
+import prefilter
+import synthetic
+from batch import list_notices, chunked, process_chunk, route
+
+# Maximum time to import the validator, in milliseconds: lookups and pandas
+# must not be loaded at import
+IMPORT_BUDGET = 200
+
+# Stages of the pipeline benchmark. export is the normalisation of a record
+# into table rows, without writing files
+STAGES = ['extract', 'validate', 'prune', 'export']
+
+
+def interpreted():
+    """
+    Registry of queries evaluated from their string, as xml.xpath() does.
+    Used as the baseline of the compiled XPATH registry
+    :return: dictionary with the same keys as extractor.XPATH
+    """
+
+    def query(expression):
+        def evaluate(xml, **variables):
+            return xml.xpath(expression, namespaces=extractor.NMSP,
+                             **variables)
+        return evaluate
+
+    return {key: query(expression)
+            for key, expression in extractor.QUERIES.items()}
+
+
+@contextmanager
+def registry(xpath):
+    """
+    Temporarily replace the XPath registry of the extractor
+    :param xpath: dictionary of queries
+    """
+
+    compiled = extractor.XPATH
+    extractor.XPATH = xpath
+    try:
+        yield
+    finally:
+        extractor.XPATH = compiled
+
+
+def time_extract(files, repeat=5):
+    """
+    Time extract() over a list of notices
+    :param files: xml files
+    :param repeat: number of runs, the best one is kept
+    :return: best time per notice, in seconds
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in files:
+            extractor.extract(path)
+        best = min(best, time.perf_counter() - start)
+    return best / len(files)
+
+
+def bench_xpath(files, repeat=5):
+    """
+    Compare extract() with compiled and string XPath queries
+    :param files: xml files
+    :param repeat: number of runs
+    :return: dictionary with the time per notice (microseconds) of each
+             registry and the speedup
+    """
+
+    compiled = time_extract(files, repeat)
+    with registry(interpreted()):
+        strings = time_extract(files, repeat)
+
+    return {'notices': len(files),
+            'compiled_us': compiled * 1e6,
+            'strings_us': strings * 1e6,
+            'speedup': strings / compiled}
+
+
+def bench_validate(files, repeat=5):
+    """
+    Compare the per-document schema with the batch validation: check that
+    both give the same records and errors, and time them
+    :param files: xml files
+    :param repeat: number of runs
+    :return: dictionary with the notices that differ, the number of invalid
+             notices and the time per notice (microseconds) of each path
+    """
+
+    raw = [extractor.extract(path) for path in files]
+
+    def per_document():
+        data, errors = [], []
+        for i, record in enumerate(raw):
+            try:
+                data.append(validator.schema(record))
+            except Exception as e:
+                data.append(record)
+                errors.append((i, e))
+        return data, errors
+
+    def best(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times) / len(raw)
+
+    data, errors = per_document()
+    batch_data, batch_errors = validator.validate_batch(raw)
+    mismatches = [files[i] for i in range(len(raw))
+                  if data[i] != batch_data[i]]
+    if [(i, str(e)) for i, e in errors] != \
+            [(i, str(e)) for i, e in batch_errors]:
+        mismatches.append('errors')
+
+    return {'notices': len(files),
+            'invalid': len(errors),
+            'mismatches': mismatches,
+            'schema_us': best(per_document) * 1e6,
+            'batch_us': best(lambda: validator.validate_batch(raw)) * 1e6}
+
+
+def held(files, typed=False):
+    """
+    Extract notices and keep all the records, as a collection does
+    :param files: xml files
+    :param typed: keep typed records, see records.py
+    :return: tuple (memory allocated by Python for the records, peak
+             resident set size), in kilobytes. Smart strings keep their
+             parsed document alive, outside of the Python allocations
+    """
+
+    extract = records.extract if typed else extractor.extract
+    tracemalloc.start()
+    collection = [extract(path) for path in files]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del collection
+    return size // 1024, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_records(files, repeat=5):
+    """
+    Compare the dictionary records with the typed records: check that
+    to_dict() gives the dictionary records, and measure the time per notice
+    and the memory of a collection of records
+    :param files: xml files
+    :param repeat: number of runs, the best one is kept
+    :return: dictionary with the notices that differ, the time per notice
+             (microseconds) of each extraction and of to_dict(), and the
+             memory (kilobytes) of each collection
+    """
+
+    typed = [records.extract(path) for path in files]
+    mismatches = [path for path, record in zip(files, typed)
+                  if extractor.extract(path) != record.to_dict()]
+
+    def best(function, items):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                function(item)
+            times.append(time.perf_counter() - start)
+        return min(times) / len(items) * 1e6
+
+    result = {'notices': len(files),
+              'mismatches': mismatches,
+              'dict_us': best(extractor.extract, files),
+              'typed_us': best(records.extract, files),
+              'to_dict_us': best(records.Record.to_dict, typed)}
+
+    # Memory is measured in a fresh process for each kind of record
+    for kind, flag in [('dict', False), ('typed', True)]:
+        with Pool(1) as pool:
+            result[kind + '_kb'], result[kind + '_rss_kb'] = pool.apply(
+                held, (files, flag))
+
+    return result
+
+
+def bench_fused(files, repeat=5, chunksize=64):
+    """
+    Compare the three steps (extract, batch validation, prune) with the
+    fused single traversal, by units of work as batch.py processes them:
+    check that both give the same records and errors, and time them
+    :param files: xml files
+    :param repeat: number of runs, the best one is kept
+    :param chunksize: number of files of a unit of work
+    :return: dictionary with the notices that differ, the number of failed
+             notices and the time per notice (microseconds) of each path
+    """
+
+    chunks = list(chunked(files, chunksize))
+
+    def process(fused):
+        options = {'fused': fused}
+        return [result for chunk in chunks
+                for result in process_chunk((chunk, options))]
+
+    def best(fused):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process(fused)
+            times.append(time.perf_counter() - start)
+        return min(times) / len(files) * 1e6
+
+    mismatches = []
+    failed = 0
+    for (path, record, error), (_, fused_record, fused_error) in zip(
+            process(False), process(True)):
+        failed += error is not None
+        if json.dumps(record) != json.dumps(fused_record) or \
+                (error is None) != (fused_error is None) or \
+                (error is not None and
+                 (error['stage'], error['message']) !=
+                 (fused_error['stage'], fused_error['message'])):
+            mismatches.append(path)
+
+    return {'notices': len(files),
+            'failed': failed,
+            'mismatches': mismatches,
+            'three_steps_us': best(False),
+            'fused_us': best(True)}
+
+
+def bench_currency(files, repeat=5, rates=None):
+    """
+    Compare the conversion of the amounts to EUR of currency.to_eur, with
+    one lookup per currency and month and a division by column, with a loop
+    converting them row by row: check that both give the same amounts, and
+    time them on the award table of the corpus
+    :param files: xml files
+    :param repeat: number of runs, the best one is kept
+    :param rates: csv files of rates, see currency.Rates
+    :return: dictionary with the number of awards, the number of amounts
+             that differ and converted, and the time per award
+             (microseconds) of each conversion
+    """
+
+    results = process_chunk((files, {}))
+    valid = [record for _, record, error in results if error is None]
+    awards = export.tables(valid)['awards']
+    prefixes = export.currency_prefixes(export.COLUMNS['awards'])
+    columns = [column for prefix in prefixes
+               for column, _ in currency.eur_columns(prefix)]
+
+    def loop(df):
+        table = currency.Rates(rates)
+        for prefix in prefixes:
+            for field in currency.AMOUNTS:
+                df[prefix + '_' + field + '_EUR'] = [
+                    amount / table.lookup(unit, year + month)
+                    for unit, year, month, amount in zip(
+                        df[prefix + '_CURRENCY'], df['YEAR'], df['MONTH'],
+                        df[prefix + '_' + field])]
+        return df
+
+    def by_column(df):
+        return currency.to_eur(df, prefixes, currency.Rates(rates))
+
+    def best(function):
+        times = []
+        for _ in range(repeat):
+            df = awards.copy()
+            start = time.perf_counter()
+            function(df)
+            times.append(time.perf_counter() - start)
+        return min(times) / max(len(awards), 1) * 1e6
+
+    expected = loop(awards.copy())[columns]
+    converted = by_column(awards.copy())[columns]
+    same = (expected == converted) | (expected.isna() & converted.isna())
+
+    return {'awards': len(awards),
+            'mismatches': int((~same).to_numpy().sum()),
+            'converted': int(converted.notna().to_numpy().sum()),
+            'loop_us': best(loop),
+            'to_eur_us': best(by_column)}
+
+
+def bench_prefilter(files, repeat=5, document_types=None):
+    """
+    Compare the full parse of every notice with the pre-filter, which skips
+    the notices of other types and reads the OTH_NOT forms from their head:
+    check that the kept notices give the same records and errors, and that
+    only the notices of other types are skipped, and time both
+    :param files: xml files
+    :param repeat: number of runs, the best one is kept
+    :param document_types: TD_DOCUMENT_TYPE codes kept, defaults to
+                           prefilter.DOCUMENT_TYPES
+    :return: dictionary with the notices that differ, the number of skipped
+             notices by reason, and the time per notice (microseconds) of
+             each path
+    """
+
+    if document_types is None:
+        document_types = prefilter.DOCUMENT_TYPES
+
+    def process(filtered):
+        options = {'prefilter': document_types if filtered else None}
+        return process_chunk((files, options))
+
+    def best(filtered):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process(filtered)
+            times.append(time.perf_counter() - start)
+        return min(times) / len(files) * 1e6
+
+    skipped = Counter()
+    kept = {path: (record, error)
+            for path, record, error in route(process(True), skipped)}
+
+    mismatches = []
+    for path, record, error in process(False):
+        if path not in kept:
+            # Only notices of other types are skipped. The type of a
+            # failed notice is unknown: it may be skipped or fail again
+            if record is not None and record['CODED_DATA']['CODIF_DATA'] \
+                    .get('TD_DOCUMENT_TYPE') in document_types:
+                mismatches.append(path)
+            continue
+        filtered_record, filtered_error = kept[path]
+        if json.dumps(record) != json.dumps(filtered_record) or \
+                (error is None) != (filtered_error is None) or \
+                (error is not None and
+                 (error['stage'], error['message']) !=
+                 (filtered_error['stage'], filtered_error['message'])):
+            mismatches.append(path)
+
+    return {'notices': len(files),
+            'skipped': dict(skipped),
+            'mismatches': mismatches,
+            'full_us': best(False),
+            'prefilter_us': best(True)}
+
+
+def bench_import(module='validator', repeat=5):
+    """
+    Time the import of a module in a fresh interpreter, as a worker process
+    or a short-lived job does
+    :param module: module name
+    :param repeat: number of runs, the best one is kept
+    :return: best import time, in milliseconds
+    """
+
+    code = ('import time; start = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - start)'.format(module))
+    folder = os.path.dirname(os.path.abspath(__file__))
+
+    best = float('inf')
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=folder)
+        best = min(best, float(out))
+    return best * 1e3
+
+
+def percentiles(values):
+    """
+    Summarise latencies
+    :param values: list of durations, in seconds
+    :return: dictionary of the mean, 50th, 90th and 99th percentiles and
+             maximum, in microseconds
+    """
+
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {'mean_us': sum(ordered) / len(ordered) * 1e6,
+               'max_us': ordered[-1] * 1e6}
+    for p in (50, 90, 99):
+        n = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        summary['p{}_us'.format(p)] = ordered[n] * 1e6
+    return summary
+
+
+def run_pipeline(files):
+    """
+    Run the stages of the pipeline on each notice and time them. Notices
+    which fail a stage skip the next ones
+    :param files: xml files
+    :return: dictionary with the latencies of each stage (see percentiles),
+             the number of failed notices, notices per second and peak
+             memory (kilobytes) of the process
+    """
+
+    latencies = {stage: [] for stage in STAGES}
+    failed = 0
+
+    start = time.perf_counter()
+    for path in files:
+        data = path
+        for stage in STAGES:
+            begin = time.perf_counter()
+            try:
+                if stage == 'extract':
+                    data = extractor.extract(data)
+                elif stage == 'validate':
+                    data = validator.schema(data)
+                elif stage == 'prune':
+                    validator.prune(data)
+                else:
+                    export.normalise(data)
+            except Exception:
+                failed += 1
+                break
+            finally:
+                latencies[stage].append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+
+    return {'notices': len(files),
+            'failed': failed,
+            'files_per_sec': len(files) / elapsed,
+            'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'stages': {stage: percentiles(latencies[stage])
+                       for stage in STAGES}}
+
+
+def bench_pipeline(files):
+    """
+    Time extract, validate, prune and export on a corpus, in a fresh process
+    so that the peak memory is the one of the pipeline
+    :param files: xml files
+    :return: see run_pipeline()
+    """
+
+    with Pool(1) as pool:
+        return pool.apply(run_pipeline, (files,))
+
+
+def environment():
+    """
+    Describe the run, to compare results between commits
+    :return: dictionary with the git commit, Python and lxml versions and
+             the date
+    """
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'lxml': '.'.join(map(str, extractor.etree.LXML_VERSION)),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the extraction of TED notices')
+    parser.add_argument('benchmark',
+                        choices=['xpath', 'validate', 'import',
+                                 'pipeline', 'records', 'fused', 'currency',
+                                 'prefilter'],
+                        help='xpath: compiled vs string XPath queries, '
+                             'validate: schema vs batch validation, '
+                             'import: import time of the validator, '
+                             'pipeline: latency of each stage, '
+                             'records: dictionary vs typed records, '
+                             'fused: three steps vs single traversal, '
+                             'currency: row by row vs to_eur EUR '
+                             'conversion, '
+                             'prefilter: full parse vs head pre-filter')
+    parser.add_argument('paths', nargs='*',
+                        help='xml files or folders of xml files')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of runs, the best one is kept')
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET,
+                        help='import: maximum import time in milliseconds, '
+                             'the exit status is 1 above it')
+    parser.add_argument('-s', '--synthetic', type=int, default=0,
+                        help='number of synthetic notices added to the '
+                             'corpus, see synthetic.py')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed of the synthetic notices')
+    parser.add_argument('--others', type=float, default=0,
+                        help='share of synthetic notices which are not '
+                             'Contract awards, e.g. 0.6 for prefilter')
+    parser.add_argument('--rates', nargs='+',
+                        help='currency: csv files of rates to the euro')
+    parser.add_argument('--json',
+                        help='file to write the results as JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        files = list_notices(args.paths)
+        if args.synthetic:
+            files += synthetic.generate(folder, args.synthetic, args.seed,
+                                        args.others)
+        if not files and args.benchmark != 'import':
+            sys.exit('No notices found')
+
+        result = run(args, files)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': args.benchmark,
+                       'environment': environment(),
+                       'result': result}, f, indent=2)
+
+    if args.benchmark == 'import' and result['import_ms'] > args.budget:
+        sys.exit(1)
+
+
+def run(args, files):
+    """
+    Run a benchmark and print its results
+    :param args: command line arguments
+    :param files: xml files
+    :return: results of the benchmark
+    """
+
+    if args.benchmark == 'import':
+        result = {'import_ms': bench_import(repeat=args.repeat),
+                  'budget_ms': args.budget}
+        print('import validator: {import_ms:.0f} ms '
+              '(budget {budget_ms:.0f} ms)'.format(**result))
+
+    elif args.benchmark == 'xpath':
+        result = bench_xpath(files, args.repeat)
+        print('{notices} notices: compiled {compiled_us:.0f} us/notice, '
+              'strings {strings_us:.0f} us/notice, '
+              'speedup x{speedup:.2f}'.format(**result))
+
+    elif args.benchmark == 'validate':
+        result = bench_validate(files, args.repeat)
+        print('{notices} notices ({invalid} invalid), {0} differ: '
+              'schema {schema_us:.0f} us/notice, '
+              'batch {batch_us:.0f} us/notice'
+              .format(len(result['mismatches']), **result))
+        for path in result['mismatches']:
+            print('differ: ' + path)
+
+    elif args.benchmark == 'pipeline':
+        result = bench_pipeline(files)
+        print('{notices} notices ({failed} failed): '
+              '{files_per_sec:.0f} files/sec, {rss_kb} kB peak'
+              .format(**result))
+        for stage in STAGES:
+            print('{:>8}: p50 {p50_us:.0f} us, p90 {p90_us:.0f} us, '
+                  'p99 {p99_us:.0f} us, max {max_us:.0f} us'
+                  .format(stage, **result['stages'][stage]))
+
+    elif args.benchmark == 'records':
+        result = bench_records(files, args.repeat)
+        print('{notices} notices, {0} differ: '
+              'dict {dict_us:.0f} us/notice, {dict_kb} kB held, '
+              '{dict_rss_kb} kB peak; '
+              'typed {typed_us:.0f} us/notice, {typed_kb} kB held, '
+              '{typed_rss_kb} kB peak; to_dict {to_dict_us:.0f} us/notice'
+              .format(len(result['mismatches']), **result))
+        for path in result['mismatches']:
+            print('differ: ' + path)
+
+    elif args.benchmark == 'fused':
+        result = bench_fused(files, args.repeat)
+        print('{notices} notices ({failed} failed), {0} differ: '
+              'three steps {three_steps_us:.0f} us/notice, '
+              'fused {fused_us:.0f} us/notice'
+              .format(len(result['mismatches']), **result))
+        for path in result['mismatches']:
+            print('differ: ' + path)
+
+    elif args.benchmark == 'currency':
+        result = bench_currency(files, args.repeat, args.rates)
+        print('{awards} awards, {converted} amounts converted, '
+              '{mismatches} differ: loop {loop_us:.1f} us/award, '
+              'to_eur {to_eur_us:.1f} us/award'.format(**result))
+
+    elif args.benchmark == 'prefilter':
+        result = bench_prefilter(files, args.repeat)
+        print('{notices} notices, {0} skipped, {1} differ: '
+              'full {full_us:.0f} us/notice, '
+              'prefilter {prefilter_us:.0f} us/notice'
+              .format(sum(number for reason, number in
+                          result['skipped'].items()
+                          if reason.startswith('TD_DOCUMENT_TYPE')),
+                      len(result['mismatches']), **result))
+        for reason, number in sorted(result['skipped'].items()):
+            print('{:>8} {}'.format(number, reason))
+        for path in result['mismatches']:
+            print('differ: ' + path)
+
+    return result
+
+
+if __name__ == "__main__":
+    main()
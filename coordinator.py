@@ -0,0 +1,491 @@
+import os
+import sys
+import json
+import time
+import zlib
+import uuid
+import socket
+import sqlite3
+import argparse
+from collections import Counter
+from multiprocessing import Process
+
+from batch import list_notices, chunked, process_chunk, route, month_folders
+from deadletter import DeadLetters
+from prefilter import DOCUMENT_TYPES
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        paths TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        errors INTEGER NOT NULL DEFAULT 0,
+        updated REAL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)',
+    'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, task INTEGER)',
+    'CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT)',
+]
+
+# Number of leases of a task before it is given up: a task whose worker
+# dies every time (e.g. killed for its memory) is marked failed
+MAX_ATTEMPTS = 3
+
+
+class Queue(object):
+    """
+    Durable work queue of a distributed extraction, in a SQLite file shared
+    by the coordinator and the workers (on one host, or on a shared file
+    system with working locks). Files are grouped in tasks, leased by the
+    workers for a limited time: a task whose worker dies is leased again
+    once its lease expires, so every task is processed at least once
+    """
+
+    def __init__(self, path):
+        """
+        :param path: SQLite file, created if it does not exist
+        """
+
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        for statement in TABLES:
+            self.db.execute(statement)
+
+    def configure(self, job):
+        """
+        Set the job of the queue, if it is not set yet: the workers all
+        write the same output with the same options
+        :param job: dictionary with output (folder), partitions (number of
+                    partitions), options (see batch.process_chunk) and
+                    dead_letters (folder, or None)
+        :return: the job of the queue, the one set before if any
+        """
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if self.job() is None:
+                self.db.executemany('INSERT INTO job VALUES (?, ?)',
+                                    [(key, json.dumps(value))
+                                     for key, value in job.items()])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return self.job()
+
+    def job(self):
+        """
+        :return: the job of the queue, see configure(). None if not set
+        """
+
+        job = {key: json.loads(value)
+               for key, value in self.db.execute('SELECT * FROM job')}
+        return job or None
+
+    def add(self, files, size=64):
+        """
+        Enqueue files, grouped in tasks. Files already in the queue are
+        left out
+        :param files: xml files and packages
+        :param size: number of xml files in a task, a package is a task
+        :return: number of tasks added
+        """
+
+        known = set(row[0] for row in self.db.execute('SELECT path '
+                                                      'FROM files'))
+        files = [os.path.abspath(path) for path in files]
+        files = [path for path in files if path not in known]
+
+        count = 0
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            for chunk in chunked(files, size):
+                task = self.db.execute(
+                    'INSERT INTO tasks (paths, updated) VALUES (?, ?)',
+                    (json.dumps(chunk), time.time())).lastrowid
+                self.db.executemany('INSERT OR IGNORE INTO files '
+                                    'VALUES (?, ?)',
+                                    [(path, task) for path in chunk])
+                count += 1
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return count
+
+    def lease(self, worker, count=1, duration=600):
+        """
+        Lease pending tasks, or tasks whose lease expired
+        :param worker: name of the worker
+        :param count: maximum number of tasks
+        :param duration: duration of the lease, in seconds
+        :return: list of (task, paths), empty if no task is available
+        """
+
+        now = time.time()
+        leased = []
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.db.execute(
+                "SELECT id, paths, attempts FROM tasks "
+                "WHERE status = 'pending' OR "
+                "(status = 'leased' AND expires < ?) "
+                "ORDER BY id LIMIT ?", (now, count)).fetchall()
+            for task, paths, attempts in rows:
+                if attempts >= MAX_ATTEMPTS:
+                    self.db.execute(
+                        "UPDATE tasks SET status = 'failed', expires = NULL, "
+                        "updated = ? WHERE id = ?", (now, task))
+                    continue
+                self.db.execute(
+                    "UPDATE tasks SET status = 'leased', worker = ?, "
+                    "expires = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?", (worker, now + duration, now, task))
+                leased.append((task, json.loads(paths)))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return leased
+
+    def complete(self, task, worker, errors=0):
+        """
+        Record a processed task, once its output is written
+        :param task: task returned by lease()
+        :param worker: name of the worker
+        :param errors: number of notices of the task which failed
+        """
+
+        self.db.execute(
+            "UPDATE tasks SET status = 'done', worker = ?, expires = NULL, "
+            "errors = ?, updated = ? WHERE id = ?",
+            (worker, errors, time.time(), task))
+
+    def active(self):
+        """
+        :return: number of tasks pending or leased
+        """
+
+        return self.db.execute("SELECT COUNT(*) FROM tasks WHERE status "
+                               "IN ('pending', 'leased')").fetchone()[0]
+
+    def retry(self):
+        """
+        Put the failed tasks back in the queue
+        :return: number of tasks
+        """
+
+        return self.db.execute(
+            "UPDATE tasks SET status = 'pending', attempts = 0, "
+            "updated = ? WHERE status = 'failed'", (time.time(),)).rowcount
+
+    def status(self):
+        """
+        :return: dictionary with the number of tasks by status, the number
+                 of expired leases and of failed notices
+        """
+
+        counts = dict.fromkeys(['pending', 'leased', 'done', 'failed'], 0)
+        counts.update(self.db.execute('SELECT status, COUNT(*) FROM tasks '
+                                      'GROUP BY status'))
+        counts['expired'] = self.db.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status = 'leased' "
+            "AND expires < ?", (time.time(),)).fetchone()[0]
+        counts['errors'] = self.db.execute(
+            'SELECT COALESCE(SUM(errors), 0) FROM tasks').fetchone()[0]
+        return counts
+
+    def close(self):
+        self.db.close()
+
+
+class Partitions(object):
+    """
+    Output folder of a distributed extraction. Records are partitioned by a
+    hash of their DOC_ID, and each task writes one file per partition,
+    PARTITION/task-ID.jsonl, replaced atomically: a task processed again
+    replaces its files, and a notice found by several tasks is always in
+    the same partition, where collect() keeps one record per DOC_ID
+    """
+
+    def __init__(self, folder, count=16):
+        """
+        :param folder: output folder, created if it does not exist
+        :param count: number of partitions
+        """
+
+        self.folder = folder
+        self.count = count
+        os.makedirs(os.path.join(folder, 'errors'), exist_ok=True)
+
+    def partition(self, doc_id):
+        return 'part-{:03d}'.format(zlib.crc32(doc_id.encode('utf-8')) %
+                                    self.count)
+
+    def replace(self, path, lines):
+        """
+        Write a file atomically, or remove it if there are no lines
+        """
+
+        if not lines:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(temp, path)
+
+    def write(self, task, results):
+        """
+        Write the output of a task: its records and its failures
+        :param task: ID of the task
+        :param results: list of (path, record, error), see
+                        batch.process_chunk()
+        """
+
+        name = 'task-{:06d}.jsonl'.format(task)
+        partitions = {'part-{:03d}'.format(n): [] for n in range(self.count)}
+        errors = []
+        for _, record, error in results:
+            if error is None:
+                partitions[self.partition(record['DOC_ID'])].append(
+                    json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                errors.append(json.dumps(error, ensure_ascii=False) + '\n')
+
+        for partition, lines in partitions.items():
+            self.replace(os.path.join(self.folder, partition, name), lines)
+        self.replace(os.path.join(self.folder, 'errors', name), errors)
+
+
+def collect(folder):
+    """
+    Main function to read the output of a distributed extraction, one
+    partition at a time
+    :param folder: output folder, see Partitions
+    :return: generator of records, one per DOC_ID: the record of the last
+             task, i.e. of the file enqueued last
+    """
+
+    for partition in sorted(os.listdir(folder)):
+        if not partition.startswith('part-'):
+            continue
+        records = {}
+        path = os.path.join(folder, partition)
+        for name in sorted(os.listdir(path)):
+            if not name.endswith('.jsonl'):
+                continue  # Temporary file of a task being written
+            with open(os.path.join(path, name), encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    records[record['DOC_ID']] = record
+        yield from records.values()
+
+
+def work(queue_path, worker=None, count=1, duration=600, poll=5):
+    """
+    Main function of a worker: lease tasks and process them until the queue
+    is empty. Tasks leased by other workers are waited for, and processed
+    again if their lease expires
+    :param queue_path: SQLite file of the Queue
+    :param worker: name of the worker, defaults to host:pid
+    :param count: number of tasks leased at once
+    :param duration: duration of a lease in seconds: more than the time to
+                     process count tasks
+    :param poll: seconds between two attempts when no task is available
+    :return: collections.Counter with the number of tasks, records, failed
+             and skipped notices
+    """
+
+    if worker is None:
+        worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    queue = Queue(queue_path)
+    counts = Counter(tasks=0, records=0, failed=0, skipped=0)
+    try:
+        job = queue.job()
+        if job is None:
+            raise ValueError('No job in the queue: ' + queue_path)
+        options = job['options']
+        prefilter = options.get('prefilter')
+        partitions = Partitions(job['output'], job['partitions'])
+        dead_letters = None
+        if job.get('dead_letters'):
+            dead_letters = DeadLetters(job['dead_letters'])
+
+        while True:
+            leased = queue.lease(worker, count, duration)
+            if not leased:
+                if not queue.active():
+                    break
+                time.sleep(poll)
+                continue
+
+            for task, paths in leased:
+                results = process_chunk((paths, options))
+                if prefilter is not None:
+                    skipped = Counter()
+                    results = route(results, skipped)
+                    counts['skipped'] += sum(
+                        number for reason, number in skipped.items()
+                        if reason.startswith('TD_DOCUMENT_TYPE'))
+                failed = sum(error is not None for _, _, error in results)
+
+                # Step 1: Output, replacing the one of a previous lease
+                partitions.write(task, results)
+                if dead_letters is not None:
+                    dead_letters.record(results)
+
+                # Step 2: Task done, once its output is complete
+                queue.complete(task, worker, failed)
+                counts['tasks'] += 1
+                counts['records'] += len(results) - failed
+                counts['failed'] += failed
+    finally:
+        queue.close()
+    return counts
+
+
+def run_worker(queue_path, count, duration, poll):
+    counts = work(queue_path, count=count, duration=duration, poll=poll)
+    print('worker {}: {tasks} tasks, {records} notices extracted, '
+          '{failed} failed, {skipped} skipped'.format(os.getpid(), **counts),
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract TED notices over several hosts with a shared '
+                    'work queue')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    enqueue = commands.add_parser(
+        'enqueue', help='add notices to the queue, setting the job with the '
+                        'first files')
+    enqueue.add_argument('queue', help='SQLite file of the queue')
+    enqueue.add_argument('paths', nargs='*',
+                         help='xml files, tar.gz packages or folders')
+    enqueue.add_argument('--root', help='folder with YYYY-MM sub-folders')
+    enqueue.add_argument('--years', nargs='+', default=[],
+                         help='years to process under --root')
+    enqueue.add_argument('--months', nargs='+',
+                         help='months to process under --root')
+    enqueue.add_argument('-o', '--output', required=True,
+                         help='shared output folder')
+    enqueue.add_argument('--partitions', type=int, default=16,
+                         help='number of output partitions by DOC_ID')
+    enqueue.add_argument('--chunksize', type=int, default=64,
+                         help='xml files in a task')
+    enqueue.add_argument('--no-validate', action='store_true',
+                         help='only extract, skip validation and pruning')
+    enqueue.add_argument('--fused', action='store_true',
+                         help='extract, validate and prune each notice in a '
+                              'single traversal')
+    enqueue.add_argument('--languages', nargs='+',
+                         help='preferred translations, in order of '
+                              'preference (default: EN FR DE)')
+    enqueue.add_argument('--timeout', type=float,
+                         help='time limit of a notice, in seconds')
+    enqueue.add_argument('--memory-limit', type=int,
+                         help='memory limit of a worker process while '
+                              'it processes a notice, in MB')
+    enqueue.add_argument('--prefilter', nargs='*', metavar='CODE',
+                         help='only extract these TD_DOCUMENT_TYPE codes '
+                              '(default: 7, Contract award)')
+    enqueue.add_argument('-d', '--dead-letters',
+                         help='shared folder storing the failed notices '
+                              '(see deadletter.py)')
+
+    worker = commands.add_parser('work', help='run workers on this host')
+    worker.add_argument('queue', help='SQLite file of the queue')
+    worker.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes')
+    worker.add_argument('-n', '--tasks', type=int, default=1,
+                        help='tasks leased at once by a worker')
+    worker.add_argument('--lease', type=float, default=600,
+                        help='duration of a lease, in seconds')
+    worker.add_argument('--poll', type=float, default=5,
+                        help='seconds between two attempts when the other '
+                             'tasks are leased')
+
+    status = commands.add_parser('status', help='print the tasks by status')
+    status.add_argument('queue', help='SQLite file of the queue')
+    status.add_argument('--retry', action='store_true',
+                        help='put the failed tasks back in the queue')
+
+    gather = commands.add_parser(
+        'collect', help='write the records of the output, one per DOC_ID')
+    gather.add_argument('output', help='output folder')
+    gather.add_argument('-o', '--jsonl', default='-',
+                        help='JSON lines file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'work':
+        workers = [Process(target=run_worker,
+                           args=(args.queue, args.tasks, args.lease,
+                                 args.poll))
+                   for _ in range(args.workers)]
+        for child in workers:
+            child.start()
+        for child in workers:
+            child.join()
+        return
+
+    if args.command == 'collect':
+        out = sys.stdout if args.jsonl == '-' else open(args.jsonl, 'w',
+                                                        encoding='utf-8')
+        count = 0
+        try:
+            for record in collect(args.output):
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print('{} notices collected'.format(count), file=sys.stderr)
+        return
+
+    queue = Queue(args.queue)
+    try:
+        if args.command == 'status':
+            if args.retry:
+                print('{} failed tasks queued again'.format(queue.retry()),
+                      file=sys.stderr)
+            print(json.dumps(queue.status()))
+            return
+
+        if args.prefilter == []:
+            args.prefilter = DOCUMENT_TYPES
+        options = {'validate': not args.no_validate, 'fused': args.fused,
+                   'languages': args.languages, 'timeout': args.timeout,
+                   'memory': args.memory_limit, 'prefilter': args.prefilter}
+        job = queue.configure({
+            'output': os.path.abspath(args.output),
+            'partitions': args.partitions,
+            'options': options,
+            'dead_letters': args.dead_letters and os.path.abspath(
+                args.dead_letters)})
+        if job['options'] != options or \
+                job['output'] != os.path.abspath(args.output):
+            print('The queue has a job already: its output and options are '
+                  'kept', file=sys.stderr)
+
+        paths = list(args.paths)
+        if args.root:
+            paths += month_folders(args.root, args.years, args.months)
+        count = queue.add(list_notices(paths), args.chunksize)
+        print('{} tasks added to {}'.format(count, args.queue),
+              file=sys.stderr)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import csv
+from collections import Counter
+
+from lookups import FOLDER
+
+# Rates to the euro shipped with the project: the euro, the currencies
+# pegged to it and the legacy currencies replaced by it, whose conversion
+# rates are fixed from their changeover only. Rates of the other currencies
+# change every month and are not shipped: supply them in a file of the same
+# format, e.g. from the ECB reference rates, or their amounts are NaN. The
+# command lines ask for them, see check_rates()
+RATES = os.path.join(FOLDER, 'EUR_RATES.csv')
+
+# Amount fields of a value (see validator.value) converted to EUR
+AMOUNTS = ['VALUE', 'LOW_VALUE', 'HIGH_VALUE']
+
+
+def read_rates(path):
+    """
+    Read a table of rates to the euro
+    :param path: csv file with the columns CURRENCY, MONTH and RATE:
+                 units of the currency for one euro, in the month (YYYYMM)
+                 or in every month if MONTH is empty. An optional FROM
+                 column gives the first month (YYYYMM) of a rate of every
+                 month, e.g. a conversion rate from the euro changeover.
+                 Other columns are ignored
+    :return: tuple (rates, starts):
+        - rates: dictionary (currency, month): rate, month is '' for the
+                 rates of every month
+        - starts: dictionary currency: first month of its rate of every
+                  month, '' for all months
+    """
+
+    rates = {}
+    starts = {}
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            if not row['RATE']:
+                continue
+            rates[(row['CURRENCY'], row['MONTH'])] = float(row['RATE'])
+            if not row['MONTH']:
+                starts[row['CURRENCY']] = row.get('FROM') or ''
+    return rates, starts
+
+
+class Rates(object):
+    """
+    Rates to the euro by currency and month of dispatch. Lookups are
+    memoised: each (currency, month) pair is resolved once
+    """
+
+    def __init__(self, paths=None):
+        """
+        :param paths: csv files of rates (see read_rates), which override
+                      the shipped RATES in order
+        """
+
+        self.rates, self.starts = read_rates(RATES)
+        for path in paths or []:
+            rates, starts = read_rates(path)
+            self.rates.update(rates)
+            self.starts.update(starts)
+        self.cache = {}
+        self.missing = set()  # (currency, month) with no rate
+
+    def lookup(self, currency, month):
+        """
+        :param currency: CURRENCY of a value, e.g. 'LTL'
+        :param month: month of dispatch, YYYYMM
+        :return: units of the currency for one euro, the rate of the month
+                 or else the rate of every month, if it applies in the
+                 month. NaN if it is unknown
+        """
+
+        rate = self.rates.get((currency, month))
+        if rate is None and month >= self.starts.get(currency, ''):
+            rate = self.rates.get((currency, ''))
+        return float('nan') if rate is None else rate
+
+    def rate(self, currency, month):
+        """
+        Memoised lookup(). Currencies with no rate are kept in missing
+        :param currency: CURRENCY of a value, '' for no currency
+        :param month: month of dispatch, YYYYMM
+        :return: see lookup()
+        """
+
+        key = (currency, month)
+        if key not in self.cache:
+            rate = self.lookup(currency, month)
+            if currency and rate != rate:  # NaN
+                self.missing.add(key)
+            self.cache[key] = rate
+        return self.cache[key]
+
+    def warning(self):
+        """
+        :return: message listing the currencies with no rate in some
+                 months, None if every amount was converted
+        """
+
+        if not self.missing:
+            return None
+        months = Counter(currency for currency, _ in self.missing)
+        return ('No rate to the euro for {}: their _EUR amounts are NaN. '
+                'Supply monthly rates with --rates (see currency.py)'.format(
+                    ', '.join('{} ({} months)'.format(currency, count)
+                              for currency, count in sorted(months.items()))))
+
+
+def check_rates(parser, args):
+    """
+    Stop a command line writing Parquet tables without the monthly rates:
+    the amounts of the floating currencies (GBP, PLN, SEK, ...) would all
+    be NaN. --no-rates accepts it
+    :param parser: argparse.ArgumentParser, with the --rates and --no-rates
+                   options
+    :param args: parsed arguments
+    """
+
+    if not args.rates and not args.no_rates:
+        parser.error('no monthly rates to the euro: give them with --rates '
+                     '(see currency.py), or use --no-rates to leave the '
+                     'amounts of the floating currencies NaN')
+
+
+def eur_columns(prefix):
+    """
+    EUR columns of a value, see export.value_columns()
+    :param prefix: prefix of the value columns, e.g. 'COST'
+    :return: list of (name, type)
+    """
+
+    return [(prefix + '_' + field + '_EUR', 'float') for field in AMOUNTS]
+
+
+def to_eur(df, prefixes, rates):
+    """
+    Add the amounts of the values converted to EUR to a table, at the rate
+    of the month of dispatch. The rate of each (currency, month) pair of the
+    table is looked up once, mapped back to the rows, and the amounts are
+    divided by column
+    :param df: pandas DataFrame with the YEAR and MONTH columns and the
+               value columns of the prefixes, amounts as floats
+    :param prefixes: value prefixes, e.g. ['COST', 'ESTIMATE']
+    :param rates: Rates
+    :return: df, with the columns of eur_columns() for each prefix. Amounts
+             with no currency or an unknown rate are NaN
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    month_codes, months = pd.factorize(df['YEAR'].astype(str) +
+                                       df['MONTH'].astype(str))
+    for prefix in prefixes:
+        currency_codes, currencies = pd.factorize(
+            df[prefix + '_CURRENCY'].fillna(''))
+        # Step 1: One code per (currency, month) pair of the rows
+        codes, pairs = pd.factorize(currency_codes * len(months) +
+                                    month_codes)
+        # Step 2: Look up the rate of each pair once, map it back
+        per_pair = np.array([rates.rate(currencies[pair // len(months)],
+                                        months[pair % len(months)])
+                             for pair in pairs.tolist()], dtype=float)
+        per_row = per_pair.take(codes)
+        for field in AMOUNTS:
+            df[prefix + '_' + field + '_EUR'] = \
+                df[prefix + '_' + field].to_numpy(dtype=float) / per_row
+    return df
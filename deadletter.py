@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from collections import defaultdict
+
+from archive import ARCHIVES, is_archive, iter_archive, source
+
+
+def split_name(name):
+    """
+    Split the name of a notice in the results of batch.iter_extract
+    :param name: xml file, or archive:member for the notices of a package
+    :return: tuple (path, member). member is None for xml files
+    """
+
+    for extension in ARCHIVES:
+        head, sep, member = name.partition(extension + ':')
+        if sep:
+            return head + extension, member
+    return name, None
+
+
+class DeadLetters(object):
+    """
+    Folder of the notices which failed, for inspection and replay. Each
+    failure is stored as two files named after a hash of the notice name:
+        - KEY.json: the failure (path, stage, error, message, traceback),
+          and the name of the saved notice
+        - KEY.xml: copy of the notice, extracted from its package if
+          needed. A package which could not be read is copied whole, as
+          KEY/package name
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: dead-letter folder, created if it does not exist
+        """
+
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, name):
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+        return os.path.basename(name).rsplit('.', 1)[0] + '_' + digest
+
+    def write(self, error, content=None, name=None):
+        """
+        Store a failure
+        :param error: failure, see batch.failure()
+        :param content: bytes of the notice, or path of a file to copy. None
+                        if it could not be read
+        :param name: name of the copy in the folder, defaults to KEY.xml
+        """
+
+        key = self.key(error['path'])
+        entry = dict(error, file=None)
+
+        if content is not None:
+            entry['file'] = name or key + '.xml'
+            target = os.path.join(self.folder, entry['file'])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if isinstance(content, bytes):
+                with open(target, 'wb') as f:
+                    f.write(content)
+            else:
+                shutil.copyfile(content, target)
+
+        with open(os.path.join(self.folder, key + '.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+
+    def record(self, results):
+        """
+        Store the failures of a unit of work. Failed notices of a package
+        are read back in a single pass over the package
+        :param results: list of (path, record, error), see
+                        batch.iter_extract()
+        """
+
+        members = defaultdict(dict)  # Package: member: failure
+        for _, _, error in results:
+            if error is None:
+                continue
+            path, member = split_name(error['path'])
+            if member is not None:
+                members[path][member] = error
+            elif error['stage'] == 'read':  # Unreadable package
+                self.write(error, path, os.path.join(
+                    self.key(path), os.path.basename(path)))
+            else:
+                self.write(error, path if os.path.isfile(path) else None)
+
+        for path, failed in members.items():
+            try:
+                for member, f in iter_archive(path):
+                    if member in failed:
+                        self.write(failed.pop(member), f.read())
+                    if not failed:
+                        break
+            except Exception:
+                pass  # Truncated package: its read failure is stored
+            for error in failed.values():
+                self.write(error)
+
+    def letters(self):
+        """
+        :return: list of the stored failures, with the path of the saved
+                 notice (None if it was not saved), sorted by name
+        """
+
+        entries = []
+        for name in sorted(os.listdir(self.folder)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.folder, name),
+                          encoding='utf-8') as f:
+                    entry = json.load(f)
+                if entry['file'] is not None:
+                    entry['file'] = os.path.join(self.folder, entry['file'])
+                entries.append(entry)
+        return entries
+
+    def remove(self, entry):
+        """
+        Remove a stored failure, e.g. once it is replayed successfully
+        :param entry: failure returned by letters()
+        """
+
+        key = self.key(entry['path'])
+        os.remove(os.path.join(self.folder, key + '.json'))
+        if entry['file'] is not None:
+            os.remove(entry['file'])
+            if os.path.dirname(entry['file']) == os.path.join(self.folder,
+                                                              key):
+                os.rmdir(os.path.dirname(entry['file']))
+
+
+def replay(dead_letters, validate=True, languages=None, clear=False):
+    """
+    Main function to process the stored failures again, e.g. after a fix of
+    the extractor or of the lookups
+    :param dead_letters: DeadLetters
+    :param validate: run the validation schema and prune the records
+    :param languages: preferred translations, see extractor.extract()
+    :param clear: remove the failures which succeed
+    :return: generator of (path, record, error), path being the original
+             name of the notice
+    """
+
+    from batch import iter_extract, process, failure
+
+    for entry in dead_letters.letters():
+        path, member = split_name(entry['path'])
+        if entry['file'] is None:
+            yield entry['path'], None, failure(
+                entry['path'], 'read', IOError('Notice was not saved'))
+            continue
+
+        if is_archive(entry['file']):  # Unreadable package
+            results = [(name.replace(entry['file'], path, 1), record, error)
+                       for name, record, error in iter_extract(
+                           [entry['file']], workers=1, validate=validate,
+                           languages=languages)]
+            if clear and all(error is None for _, _, error in results):
+                dead_letters.remove(entry)
+            yield from results
+            continue
+
+        origin = source(path, member) if member is not None else None
+        record, error = process(entry['file'], validate=validate,
+                                name=entry['path'], origin=origin,
+                                languages=languages)
+        if error is None and clear:
+            dead_letters.remove(entry)
+        yield entry['path'], record, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay the notices of a dead-letter folder')
+    parser.add_argument('folder', help='dead-letter folder')
+    parser.add_argument('--list', action='store_true',
+                        help='only list the stored failures')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='only extract, skip validation and pruning')
+    parser.add_argument('--languages', nargs='+',
+                        help='preferred translations, in order of preference '
+                             '(default: EN FR DE)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='JSON lines output file (default: stdout)')
+    parser.add_argument('--clear', action='store_true',
+                        help='remove the failures which succeed')
+    args = parser.parse_args(argv)
+
+    dead_letters = DeadLetters(args.folder)
+
+    if args.list:
+        for entry in dead_letters.letters():
+            print('{path}\t{stage}\t{error}: {message}'.format(**entry))
+        return
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w',
+                                                       encoding='utf-8')
+    counts = {'records': 0, 'failed': 0}
+    try:
+        for path, record, error in replay(dead_letters,
+                                          not args.no_validate,
+                                          args.languages, args.clear):
+            if error is None:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                counts['records'] += 1
+            else:
+                counts['failed'] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print('{records} notices replayed, {failed} still failing'.format(
+        **counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import os
+import sys
+import argparse
+
+from mongo_import import batches, read_jsonl
+from currency import Rates, check_rates, eur_columns, to_eur
+from interning import Strings, encoded_columns
+
+# Fields of a value (see validator.value)
+VALUE_FIELDS = ['CURRENCY', 'VALUE', 'LOW_VALUE', 'HIGH_VALUE', 'VAT_PRCT']
+
+
+def value_columns(prefix):
+    return [(prefix + '_' + field, 'str' if field == 'CURRENCY' else 'float')
+            for field in VALUE_FIELDS] + eur_columns(prefix)
+
+
+# Columns of each table: (name, type). Types are 'str', 'float', 'int',
+# 'date' or 'list' (list of strings). 'id' columns (nullable integers) hold
+# the names encoded by interning.Strings
+PARTITION = [('YEAR', 'str'), ('MONTH', 'str')]
+
+CONTRACT_VALUE_COLUMNS = value_columns('COST') + value_columns('ESTIMATE') + [
+    ('NUMBER_OF_YEARS', 'float'),
+    ('NUMBER_OF_MONTHS', 'float')
+]
+
+COLUMNS = {
+    'notices': [('DOC_ID', 'str')] + PARTITION + [
+        ('NO_DOC_OJS', 'str'),
+        ('DS_DATE_DISPATCH', 'date'),
+        ('ISO_COUNTRY', 'str'),
+        ('ORIGINAL_NUTS', 'list'),
+        ('ORIGINAL_CPV', 'list'),
+        ('IA_URL_GENERAL', 'str'),
+        ('REF_NOTICE', 'list'),
+        ('TD_DOCUMENT_TYPE', 'str'),
+        ('AA_AUTHORITY_TYPE', 'str'),
+        ('NC_CONTRACT_NATURE', 'str'),
+        ('PR_PROC', 'str'),
+        ('RP_REGULATION', 'str'),
+        ('TY_TYPE_BID', 'str'),
+        ('AC_AWARD_CRIT', 'str'),
+        ('MA_MAIN_ACTIVITIES', 'list'),
+        ('OTH_NOT', 'str'),
+        ('CONTRACTING_AUTHORITY', 'str'),
+        ('NUTS', 'list'),
+        ('NUTS_EXTRA', 'str'),
+        ('CPV_MAIN', 'str'),
+        ('CONTRACT_COVERED_GPA', 'str'),
+        ('CONCLUSION_FRAMEWORK_AGREEMENT', 'str'),
+        ('CONTRACTS_DPS', 'str'),
+        ('AWARDS', 'int')
+    ] + value_columns('GLOBAL_VALUE') + CONTRACT_VALUE_COLUMNS,
+    'awards': [('DOC_ID', 'str')] + PARTITION + [
+        ('AWARD', 'int')
+    ] + CONTRACT_VALUE_COLUMNS,
+    'contractors': [('DOC_ID', 'str')] + PARTITION + [
+        ('AWARD', 'int'),
+        ('OFFICIALNAME', 'str'),
+        ('COUNTRY', 'str'),
+        ('ADDRESS', 'str'),
+        ('TOWN', 'str'),
+        ('POSTAL_CODE', 'str')
+    ]
+}
+
+
+def flatten_value(row, prefix, value):
+    for field in VALUE_FIELDS:
+        row[prefix + '_' + field] = value.get(field)
+
+
+def flatten_contract_value(row, contract_value):
+    flatten_value(row, 'COST', contract_value.get('COST', {}))
+    flatten_value(row, 'ESTIMATE', contract_value.get('ESTIMATE', {}))
+    row['NUMBER_OF_YEARS'] = contract_value.get('NUMBER_OF_YEARS')
+    row['NUMBER_OF_MONTHS'] = contract_value.get('NUMBER_OF_MONTHS')
+
+
+def normalise(record):
+    """
+    Split a record into rows of the notice, award and contractor tables.
+    CONTRACTS_VALUE of the VALUES_LIST section is not exported
+    :param record: validated and pruned record
+    :return: tuple (notice, awards, contractors):
+        - notice: dictionary column: value
+        - awards: list of dictionaries, one per award
+        - contractors: list of dictionaries, one per award with a contractor
+    """
+
+    notice_data = record['CODED_DATA']['NOTICE_DATA']
+    codif_data = record['CODED_DATA']['CODIF_DATA']
+    contract = record['CONTRACT']
+    contract_object = contract.get('CONTRACT_OBJECT', {})
+    awards = contract.get('AWARDS_OF_CONTRACT', [])
+
+    # Step 1: keys shared by the rows of the notice
+    date = codif_data['DS_DATE_DISPATCH']  # YYYYMMDD
+    key = {'DOC_ID': record['DOC_ID'], 'YEAR': date[:4], 'MONTH': date[4:6]}
+
+    # Step 2: notice row
+    notice = dict(key)
+    notice.update(notice_data)
+    notice.update(codif_data)
+    notice.update(contract)
+    notice.update(contract_object)
+    notice['AWARDS'] = len(awards)
+    flatten_value(notice, 'GLOBAL_VALUE',
+                  notice_data.get('VALUES_LIST', {}).get('GLOBAL_VALUE', {}))
+    flatten_contract_value(notice, contract_object.get('CONTRACT_VALUE', {}))
+
+    # Step 3: award and contractor rows
+    award_rows = []
+    contractor_rows = []
+    for n, award in enumerate(awards):
+        row = dict(key, AWARD=n)
+        flatten_contract_value(row, award.get('CONTRACT_VALUE', {}))
+        award_rows.append(row)
+
+        if 'CONTRACTOR' in award:
+            row = dict(key, AWARD=n)
+            row.update(award['CONTRACTOR'])
+            contractor_rows.append(row)
+
+    return notice, award_rows, contractor_rows
+
+
+def frame(rows, columns):
+    """
+    Build a table with the types of its columns
+    :param rows: list of dictionaries
+    :param columns: list of (name, type), see COLUMNS
+    :return: pandas DataFrame. Numbers which are not valid (kept as strings
+             by the validator) are NaN
+    """
+
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=[c for c, _ in columns])
+    for column, kind in columns:
+        if kind == 'float':
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        elif kind == 'int':
+            df[column] = df[column].astype('int64')
+        elif kind == 'date':
+            df[column] = pd.to_datetime(df[column], format='%Y%m%d',
+                                        errors='coerce')
+        else:
+            df[column] = df[column].astype(object)
+    return df
+
+
+def currency_prefixes(columns):
+    """
+    :param columns: list of (name, type), see COLUMNS
+    :return: prefixes of the value columns of a table, e.g. ['COST']
+    """
+
+    return [column[:-len('_CURRENCY')] for column, _ in columns
+            if column.endswith('_CURRENCY')]
+
+
+def tables(records, rates=None, strings=None):
+    """
+    Normalise records into the notice, award and contractor tables
+    :param records: list of validated and pruned records
+    :param rates: currency.Rates of the _EUR columns, defaults to the rates
+                  shipped in Lookups/EUR_RATES.csv
+    :param strings: interning.Strings encoding the names (authority,
+                    contractor name, town and address) as IDs, None to keep
+                    the text
+    :return: dictionary table name: pandas DataFrame, see COLUMNS, or
+             interning.encoded_columns() with strings
+    """
+
+    if rates is None:
+        rates = Rates()
+
+    rows = {name: [] for name in COLUMNS}
+    for record in records:
+        notice, awards, contractors = normalise(record)
+        rows['notices'].append(notice)
+        rows['awards'].extend(awards)
+        rows['contractors'].extend(contractors)
+
+    result = {}
+    for name in COLUMNS:
+        df = to_eur(frame(rows[name], COLUMNS[name]),
+                    currency_prefixes(COLUMNS[name]), rates)
+        result[name] = df if strings is None else strings.encode(df)
+    return result
+
+
+def arrow_schema(columns):
+    """
+    Arrow schema of a table: every Parquet file of the table has the same
+    schema, even when a column is empty in a chunk
+    :param columns: list of (name, type), see COLUMNS
+    :return: pyarrow schema
+    """
+
+    import pyarrow as pa
+
+    types = {'str': pa.string(),
+             'float': pa.float64(),
+             'int': pa.int64(),
+             'id': pa.int32(),
+             'date': pa.timestamp('ns'),
+             'list': pa.list_(pa.string())}
+    return pa.schema([(column, types[kind]) for column, kind in columns])
+
+
+def write_chunk(records, folder, rates=None, strings=None):
+    """
+    Normalise records and append them to the Parquet tables
+    :param records: list of validated and pruned records
+    :param folder: output folder, one sub-folder per table
+    :param rates: currency.Rates, see tables()
+    :param strings: interning.Strings, see tables(). Its dictionary file is
+                    saved before the tables are written: a table never holds
+                    an ID which is not in the file
+    :return: dictionary table name: number of rows written
+    """
+
+    encoded = tables(records, rates, strings)
+    if strings is not None:
+        strings.save()
+
+    counts = {}
+    for name, df in encoded.items():
+        columns = COLUMNS[name]
+        if strings is not None:
+            columns = encoded_columns(columns)
+        counts[name] = len(df)
+        if df.empty:
+            continue
+        df.to_parquet(os.path.join(folder, name), engine='pyarrow',
+                      partition_cols=[c for c, _ in PARTITION],
+                      index=False, schema=arrow_schema(columns))
+    return counts
+
+
+def export(records, folder, chunk_size=100000, rates=None, strings=None):
+    """
+    Main function to write records as Parquet tables, partitioned by year
+    and month of dispatch: folder/awards/YEAR=2015/MONTH=01/...parquet.
+    Records are normalised and written by chunks, so that memory does not
+    grow with the number of records. Amounts are also converted to EUR
+    (_EUR columns) in the same pass
+    :param records: iterable of validated and pruned records
+    :param folder: output folder, one sub-folder per table
+    :param chunk_size: number of records normalised at once
+    :param rates: currency.Rates, see tables()
+    :param strings: interning.Strings, see tables(). Its dictionary file is
+                    saved with each chunk, see write_chunk()
+    :return: dictionary table name: number of rows written
+    """
+
+    if rates is None:
+        rates = Rates()
+
+    counts = {name: 0 for name in COLUMNS}
+
+    for chunk in batches(records, chunk_size):
+        for name, count in write_chunk(chunk, folder, rates,
+                                       strings).items():
+            counts[name] += count
+
+    if strings is not None:  # The file exists even with no records
+        strings.save()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Export extracted notices as partitioned Parquet tables')
+    parser.add_argument('paths', nargs='+',
+                        help='JSON lines files from batch.py, - for stdin')
+    parser.add_argument('-o', '--output', required=True,
+                        help='output folder')
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                        help='records normalised at once')
+    parser.add_argument('--rates', nargs='+',
+                        help='csv files of monthly rates to the euro, see '
+                             'currency.py')
+    parser.add_argument('--no-rates', action='store_true',
+                        help='only convert the currencies with a shipped '
+                             'rate, the other _EUR amounts are NaN')
+    parser.add_argument('--strings',
+                        help='string dictionary file: store the names as '
+                             'IDs (_ID columns), see interning.py')
+    args = parser.parse_args(argv)
+    check_rates(parser, args)
+
+    strings = Strings(args.strings) if args.strings else None
+    rates = Rates(args.rates)
+    counts = export(read_jsonl(args.paths), args.output, args.chunk_size,
+                    rates, strings)
+    print(', '.join('{} {}'.format(counts[name], name) for name in COLUMNS),
+          file=sys.stderr)
+    if rates.warning():
+        print(rates.warning(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,132 @@
-import os
 from lxml import etree
 
 NMSP = {'ted': 'http://publications.europa.eu/TED_schema/Export'}
 
+# Version of the extraction, stored in the manifest of incremental runs:
+# bump it whenever the output of extract() changes
+VERSION = '1.0'
+
+# Preferred translations of the FORM_SECTION, in order of preference. Can be
+# overridden with the languages parameter of extract()
+LANGUAGES = ['EN', 'FR', 'DE']
+
+# XPath queries of the extractor. They are compiled once at import time in
+# XPATH: calling xml.xpath() with a string re-compiles the expression on
+# every call, i.e. dozens of times per notice
+QUERIES = {
+    # TOTAL_VALUE
+    'is_single_value': "name(*) = 'SINGLE_VALUE'",
+    'single_value': ".//ted:VALUE/@CURRENCY | .//ted:VALUE/text()",
+    'low_value': ".//ted:VALUE[1]/@CURRENCY | .//ted:VALUE[1]/text()",
+    'high_value': ".//ted:VALUE[2]/@CURRENCY | .//ted:VALUE[2]/text()",
+
+    # NOTICE_DATA and CODIF_DATA
+    'code': "ted:*[local-name() = $name]/@CODE",
+    'no_doc_ojs': "ted:NO_DOC_OJS/text()",
+    'iso_country': "ted:ISO_COUNTRY/@VALUE",
+    'ia_url_general': "ted:IA_URL_GENERAL/text()",
+    'ref_notice': "ted:REF_NOTICE/ted:NO_DOC_OJS/text()",
+    'values_list': "ted:VALUES_LIST",
+    'global_value': ".//ted:VALUES[@TYPE = 'GLOBAL']",
+    'contracts_value': ".//ted:VALUES[@TYPE = 'CONTRACT']",
+    'ds_date_dispatch': "ted:*[local-name() = 'DS_DATE_DISPATCH']/text()",
+    'notice_data': "ted:CODED_DATA_SECTION/ted:NOTICE_DATA",
+    'codif_data': "ted:CODED_DATA_SECTION/ted:CODIF_DATA",
+
+    # COST
+    'vat_prct': ".//ted:VAT_PRCT/text()",
+    'has_value_cost': "boolean(./ted:VALUE_COST)",
+    'value_cost': "./ted:VALUE_COST/text()",
+    'has_range_value_cost': "boolean(./ted:RANGE_VALUE_COST)",
+    'low_value_cost': "./ted:RANGE_VALUE_COST/ted:LOW_VALUE/text()",
+    'high_value_cost': "./ted:RANGE_VALUE_COST/ted:HIGH_VALUE/text()",
+
+    # CONTRACT_VALUE
+    'has_costs': "boolean(./ted:COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE)",
+    'costs': "./ted:COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE",
+    'has_estimate': "boolean(./ted:INITIAL_ESTIMATED_TOTAL_VALUE_CONTRACT)",
+    'estimate': "./ted:INITIAL_ESTIMATED_TOTAL_VALUE_CONTRACT",
+    'has_years':
+        "boolean(.//ted:NUMBER_OF_YEARS) or boolean(.//ted:NUMBER_YEARS)",
+    'years': ".//ted:NUMBER_OF_YEARS/text() | .//ted:NUMBER_YEARS/text()",
+    'has_months':
+        "boolean(.//ted:NUMBER_OF_MONTHS) or boolean(.//ted:NUMBER_MONTHS)",
+    'months': ".//ted:NUMBER_OF_MONTHS/text() | .//ted:NUMBER_MONTHS/text()",
+
+    # CONTRACT_OBJECT
+    'nuts': ".//ted:NUTS/@CODE",
+    'nuts_extra': ".//ted:LOCATION/ted:P/text()",
+    'cpv_main': ".//ted:CPV_MAIN/ted:CPV_CODE/@CODE",
+    'contract_covered_gpa': ".//ted:CONTRACT_COVERED_GPA/@VALUE",
+    'has_framework_agreement':
+        "boolean(.//ted:CONCLUSION_FRAMEWORK_AGREEMENT)",
+    'has_contracts_dps': "boolean(.//ted:CONTRACTS_DPS)",
+    'total_final_value': "ted:TOTAL_FINAL_VALUE",
+
+    # AWARD_OF_CONTRACT
+    'contact_data': ("./ted:ECONOMIC_OPERATOR_NAME_ADDRESS"
+                     "/ted:CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME"
+                     "| ./ted:CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME_CHP"),
+    'contractor_name': ("./ted:ORGANISATION/ted:OFFICIALNAME/text() | "
+                        "./ted:ORGANISATION/text()"),
+    'country': "ted:COUNTRY/@VALUE",
+    'address': "ted:ADDRESS/text()",
+    'town': "ted:TOWN/text()",
+    'postal_code': "ted:POSTAL_CODE/text()",
+    'award_value': (".//ted:CONTRACT_VALUE_INFORMATION | "
+                    ".//ted:INFORMATION_VALUE_CONTRACT"),
+
+    # CONTRACT
+    'form_section': "ted:FORM_SECTION",
+    'children': "*",
+    'is_oth_not': "name(*) = 'OTH_NOT'",
+    'first_contract': "*/*",
+    'authority': ("ted:*[starts-with(local-name(), 'CONTRACTING') or "
+                  "starts-with(local-name(), 'CONTACTING') or "
+                  "starts-with(local-name(), 'AUTHORITY')]/"
+                  "ted:*[starts-with(local-name(), 'NAME')]//"
+                  "ted:ORGANISATION"),
+    'authority_name': "ted:OFFICIALNAME/text() | ./text()",
+    'contract_object': "ted:*[starts-with(local-name(), 'OBJECT')]",
+    'awards': "ted:*[starts-with(local-name(), 'AWARD')]",
+    'has_award_and_contract_value': "boolean(./ted:AWARD_AND_CONTRACT_VALUE)",
+    'award_and_contract_value': "ted:AWARD_AND_CONTRACT_VALUE",
+}
+
+# Plain strings: the default "smart" strings keep a reference to their
+# parent element, i.e. to the whole parsed document, for as long as the
+# record lives
+XPATH = {key: etree.XPath(query, namespaces=NMSP, smart_strings=False)
+         for key, query in QUERIES.items()}
+
+
+def section(name, fields):
+    """
+    Build a section of the dictionary record. The traversal below is shared
+    by the three outputs of the extraction, which only differ in how they
+    build the sections: this one, records.typed() and fused.valid()
+    :param name: name of the section: 'value' (TOTAL_VALUE, COST or
+                 ESTIMATE), 'values_list', 'notice', 'codif', 'coded',
+                 'contract_value', 'contract_object', 'contractor', 'award',
+                 'contract' or 'record'
+    :param fields: list of (key, value), in the order of the record. Values
+                   are lists of strings as returned by the queries, strings
+                   (CURRENCY, DOC_ID), booleans (YES/NO fields), sections,
+                   or lists of sections. Missing fields are not listed
+    :return: dictionary, with the lists of strings kept as they are
+    """
+
+    return {key: (['YES'] if value else ['NO'])
+            if isinstance(value, bool) else value
+            for key, value in fields}
 
-def get_total(xml):
+
+def get_total(xml, build=section):
     """
     Get TOTAL_VALUE of the contract
     :param xml:
-    :return: dictionary:
+    :param build: builder of the sections, see section()
+    :return: 'value' section:
         - CURRENCY: currency of the contract
 
         - VALUE: value, if SINGLE_VALUE
@@ -16,33 +134,28 @@ def get_total(xml):
         - LOW, HIGH: lower and higher range values, if RANGE_VALUE
     """
 
-    if xml.xpath("name(*) = 'SINGLE_VALUE'"):
-        currency, *value = xml.xpath(".//ted:VALUE/@CURRENCY | "
-                                     ".//ted:VALUE/text()",
-                                     namespaces=NMSP)  # Value Might be missing
+    if XPATH['is_single_value'](xml):
+        currency, *value = XPATH['single_value'](xml)  # Value Might be missing
 
-        return {'CURRENCY': currency,
-                'VALUE': value}  # Might be missing
+        return build('value', [('CURRENCY', currency),
+                               ('VALUE', value)])  # Might be missing
     else:
-        low_currency, *low_value = xml.xpath(".//ted:VALUE[1]/@CURRENCY | "
-                                             ".//ted:VALUE[1]/text()",
-                                             namespaces=NMSP)
-        high_currency, *high_value = xml.xpath(".//ted:VALUE[2]/@CURRENCY | "
-                                               ".//ted:VALUE[2]/text()",
-                                               namespaces=NMSP)
+        low_currency, *low_value = XPATH['low_value'](xml)
+        high_currency, *high_value = XPATH['high_value'](xml)
         # Values Might be missing
 
-        return {'CURRENCY': low_currency,
-                'LOW_VALUE': low_value,
-                'HIGH_VALUE': high_value}
+        return build('value', [('CURRENCY', low_currency),
+                               ('LOW_VALUE', low_value),
+                               ('HIGH_VALUE', high_value)])
 
 
-def get_notice(xml):
+def get_notice(xml, build=section):
     """
     Get NOTICE_DATA Information: some general information related to the
     notice, or information which is extracted from the notice
     :param xml:
-    :return: dictionary:
+    :param build: builder of the sections, see section()
+    :return: 'notice' section:
         - NO_DOC_OJS: Notice number in TED
         - ORIGINAL_NUTS: Region code(s) of the place of performance
                          or delivery
@@ -60,54 +173,50 @@ def get_notice(xml):
                       (prior information, corrigendum, ...)
     """
 
-    obj = dict()
+    fields = []
 
     for item in ['ORIGINAL_NUTS', 'ORIGINAL_CPV']:
-        obj[item] = xml.xpath("ted:*[local-name() = $name]/@CODE",
-                              namespaces=NMSP,
-                              name=item)  # 0 or more
+        fields.append((item, XPATH['code'](xml, name=item)))  # 0 or more
 
-    obj['NO_DOC_OJS'] = xml.xpath("ted:NO_DOC_OJS/text()",
-                                  namespaces=NMSP)  # Compulsory, only one
+    # Compulsory, only one
+    fields.append(('NO_DOC_OJS', XPATH['no_doc_ojs'](xml)))
 
-    obj['ISO_COUNTRY'] = xml.xpath("ted:ISO_COUNTRY/@VALUE",
-                                   namespaces=NMSP)  # Compulsory, only one
+    # Compulsory, only one
+    fields.append(('ISO_COUNTRY', XPATH['iso_country'](xml)))
 
-    obj['IA_URL_GENERAL'] = xml.xpath("ted:IA_URL_GENERAL/text()",
-                                      namespaces=NMSP)  # Optional
+    # Optional
+    fields.append(('IA_URL_GENERAL', XPATH['ia_url_general'](xml)))
 
-    obj['REF_NOTICE'] = xml.xpath("ted:REF_NOTICE/ted:NO_DOC_OJS/text()",
-                                  namespaces=NMSP)  # 0 or more
+    fields.append(('REF_NOTICE', XPATH['ref_notice'](xml)))  # 0 or more
 
-    values = xml.xpath("ted:VALUES_LIST", namespaces=NMSP)
-    values_list = dict()
+    values = XPATH['values_list'](xml)
+    values_list = []
 
     if values:
         # Extract Total Final Value
-        global_val = values[0].xpath(".//ted:VALUES[@TYPE = 'GLOBAL']",
-                                     namespaces=NMSP)
+        global_val = XPATH['global_value'](values[0])
         if global_val:
-            values_list['GLOBAL_VALUE'] = get_total(global_val[0])
+            values_list.append(('GLOBAL_VALUE',
+                                get_total(global_val[0], build)))
 
         # Extract individual sub-contracts values
-        contract_val = values[0].xpath(".//ted:VALUES[@TYPE = 'CONTRACT']",
-                                       namespaces=NMSP)
-        if contract_val:
-            values_list['CONTRACTS_VALUE'] = []
-            for c_val in contract_val:  # 0 or more
-                values_list['CONTRACTS_VALUE'].append(get_total(c_val))
+        contract_val = XPATH['contracts_value'](values[0])
+        if contract_val:  # 0 or more
+            values_list.append(('CONTRACTS_VALUE', [
+                get_total(c_val, build) for c_val in contract_val]))
 
-    obj['VALUES_LIST'] = values_list
+    fields.append(('VALUES_LIST', build('values_list', values_list)))
 
-    return obj
+    return build('notice', fields)
 
 
-def get_codif(xml):
+def get_codif(xml, build=section):
     """
     Get CODIF_DATA Information: descriptive metadata related to
     the notice content
     :param xml:
-    :return: dictionary:
+    :param build: builder of the sections, see section()
+    :return: 'codif' section:
         - DS_DATE_DISPATCH: Date of dispatch of the notice. Format: yyyymmdd
         - TD_DOCUMENT_TYPE: Type of document
         - AA_AUTHORITY_TYPE: Type of awarding authority
@@ -119,305 +228,305 @@ def get_codif(xml):
         - MA_MAIN_ACTIVITIES: Main activity of the contracting body
                              (multiple values)
     """
-    obj = dict()
+    fields = []
 
     for item in ['TD_DOCUMENT_TYPE', 'AA_AUTHORITY_TYPE', 'NC_CONTRACT_NATURE',
                  'PR_PROC', 'RP_REGULATION', 'TY_TYPE_BID', 'AC_AWARD_CRIT',
                  'MA_MAIN_ACTIVITIES']:
-        el = xml.xpath("ted:*[local-name() = $name]/@CODE",
-                       namespaces=NMSP,
-                       name=item)
-        obj[item] = el  # All Compulsory, only one
-                        #  MA_MAIN_ACTIVITIES can be 0 or more
-    obj['DS_DATE_DISPATCH'] = xml.xpath(
-        "ted:*[local-name() = 'DS_DATE_DISPATCH']/text()", namespaces=NMSP)
+        el = XPATH['code'](xml, name=item)
+        fields.append((item, el))  # All Compulsory, only one
+                                   #  MA_MAIN_ACTIVITIES can be 0 or more
+    fields.append(('DS_DATE_DISPATCH', XPATH['ds_date_dispatch'](xml)))
 
-    return obj
+    return build('codif', fields)
 
 
-def get_coded(xml):
+def get_coded(xml, build=section):
     """
     Get metadata of the contract
     :param xml:
-    :return: dictionary with data from NOTICE_DATA and CODIF_DATA sections
+    :param build: builder of the sections, see section()
+    :return: 'coded' section with data from NOTICE_DATA and CODIF_DATA
     """
 
-    obj = dict()
-
-    obj['NOTICE_DATA'] = get_notice(xml.xpath(
-        "ted:CODED_DATA_SECTION/ted:NOTICE_DATA", namespaces=NMSP)[0])
-    obj['CODIF_DATA'] = get_codif(xml.xpath(
-        "ted:CODED_DATA_SECTION/ted:CODIF_DATA", namespaces=NMSP)[0])
+    return build('coded', [
+        ('NOTICE_DATA', get_notice(XPATH['notice_data'](xml)[0], build)),
+        ('CODIF_DATA', get_codif(XPATH['codif_data'](xml)[0], build))])
 
-    return obj
 
-
-def get_cost(xml):
+def get_cost(xml, build=section):
     """
     Get CURRENCY, VALUE (or LOW - HIGH values), VAT PERCENTAGE of the contract
     :param xml:
-    :return: dictionary:
+    :param build: builder of the sections, see section()
+    :return: 'value' section:
         - CURRENCY
         - VALUE ( or LOW_VALUE, HIGH_VALUE for range values)
         - VAT_PRCT
     """
 
-    obj = dict()
-
-    obj['CURRENCY'] = xml.attrib['CURRENCY']
+    fields = [('CURRENCY', xml.attrib['CURRENCY']),
+              ('VAT_PRCT', XPATH['vat_prct'](xml))]
 
-    obj['VAT_PRCT'] = xml.xpath(".//ted:VAT_PRCT/text()", namespaces=NMSP)
+    if XPATH['has_value_cost'](xml):
 
-    if xml.xpath("boolean(./ted:VALUE_COST)", namespaces=NMSP):
+        fields.append(('VALUE', XPATH['value_cost'](xml)))
 
-        obj['VALUE'] = xml.xpath("./ted:VALUE_COST/text()", namespaces=NMSP)
+    if XPATH['has_range_value_cost'](xml):
 
-    if xml.xpath("boolean(./ted:RANGE_VALUE_COST)", namespaces=NMSP):
+        fields.append(('LOW_VALUE', XPATH['low_value_cost'](xml)))
+        fields.append(('HIGH_VALUE', XPATH['high_value_cost'](xml)))
 
-        obj['LOW_VALUE'] = xml.xpath("./ted:RANGE_VALUE_COST/ted:LOW_VALUE/text()",
-                                   namespaces=NMSP)
-        obj['HIGH_VALUE'] = xml.xpath("./ted:RANGE_VALUE_COST/ted:HIGH_VALUE/text()",
-                                    namespaces=NMSP)
+    return build('value', fields)
 
-    return obj
 
-
-def get_contract_value(xml):
+def get_contract_value(xml, build=section):
     """
     Function to help extract the CONTRACT value
     :param xml:
-    :return: dictionary with either the TOTAL FINAL VALUE of the contract
-             or the INITIAL ESTIMATE
+    :param build: builder of the sections, see section()
+    :return: 'contract_value' section with either the TOTAL FINAL VALUE of
+             the contract or the INITIAL ESTIMATE
     """
 
-    obj = dict()
-
-    if xml.xpath("boolean(./ted:COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE)",
-                 namespaces=NMSP):
-        obj['COST'] = get_cost(xml.xpath(
-            "./ted:COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE",
-            namespaces=NMSP)[0])
-
-    if xml.xpath("boolean(./ted:INITIAL_ESTIMATED_TOTAL_VALUE_CONTRACT)",
-                 namespaces=NMSP):
-        obj['ESTIMATE'] = get_cost(xml.xpath(
-            "./ted:INITIAL_ESTIMATED_TOTAL_VALUE_CONTRACT",
-            namespaces=NMSP)[0])
-    if xml.xpath(
-            "boolean(.//ted:NUMBER_OF_YEARS) or boolean(.//ted:NUMBER_YEARS)",
-            namespaces=NMSP):
-        obj['NUMBER_OF_YEARS'] = xml.xpath(
-            ".//ted:NUMBER_OF_YEARS/text() | .//ted:NUMBER_YEARS/text()",
-            namespaces=NMSP)
-    if xml.xpath(
-            "boolean(.//ted:NUMBER_OF_MONTHS) or boolean(.//ted:NUMBER_MONTHS)",
-            namespaces=NMSP):
-        obj['NUMBER_OF_MONTHS'] = xml.xpath(
-            ".//ted:NUMBER_OF_MONTHS/text() | .//ted:NUMBER_MONTHS/text()",
-            namespaces=NMSP)
-
-    return obj
-
-
-def get_object(xml):
+    fields = []
+
+    if XPATH['has_costs'](xml):
+        fields.append(('COST', get_cost(XPATH['costs'](xml)[0], build)))
+
+    if XPATH['has_estimate'](xml):
+        fields.append(('ESTIMATE',
+                       get_cost(XPATH['estimate'](xml)[0], build)))
+    if XPATH['has_years'](xml):
+        fields.append(('NUMBER_OF_YEARS', XPATH['years'](xml)))
+    if XPATH['has_months'](xml):
+        fields.append(('NUMBER_OF_MONTHS', XPATH['months'](xml)))
+
+    return build('contract_value', fields)
+
+
+def get_object(xml, build=section):
     """
     Function to extract the OBJECT section of the xml
     :param xml:
-    :return:
+    :param build: builder of the sections, see section()
+    :return: 'contract_object' section
     """
 
-    obj = dict()
+    fields = []
 
     # Step 4.1: Extract OBJECT LOCATION, NUTS, MAIN_CPV
-    obj['NUTS'] = xml.xpath(".//ted:NUTS/@CODE", namespaces=NMSP)  # 0 or more
-    obj['NUTS_EXTRA'] = xml.xpath(".//ted:LOCATION/ted:P/text()",
-                                  namespaces=NMSP)  # 0 or more
-    obj['CPV_MAIN'] = xml.xpath(".//ted:CPV_MAIN/ted:CPV_CODE/@CODE",
-                                namespaces=NMSP)  # 0 or 1
+    fields.append(('NUTS', XPATH['nuts'](xml)))  # 0 or more
+    fields.append(('NUTS_EXTRA', XPATH['nuts_extra'](xml)))  # 0 or more
+    fields.append(('CPV_MAIN', XPATH['cpv_main'](xml)))  # 0 or 1
 
     # Step 4.2: Extract CONTRACT_COVERED_GPA, CONCLUSION_FRAMEWORK_AGREEMENT,
     # CONTRACTS_DPS
-    obj['CONTRACT_COVERED_GPA'] = xml.xpath(
-        ".//ted:CONTRACT_COVERED_GPA/@VALUE", namespaces=NMSP)  # 0 or 1
+    fields.append(('CONTRACT_COVERED_GPA',
+                   XPATH['contract_covered_gpa'](xml)))  # 0 or 1
 
-    obj['CONCLUSION_FRAMEWORK_AGREEMENT'] = ['YES'] if xml.xpath(
-        "boolean(.//ted:CONCLUSION_FRAMEWORK_AGREEMENT)", namespaces=NMSP) \
-        else ['NO'] # YES/NO
+    fields.append(('CONCLUSION_FRAMEWORK_AGREEMENT',
+                   XPATH['has_framework_agreement'](xml)))  # YES/NO
 
-    obj['CONTRACTS_DPS'] = ['YES'] if xml.xpath(
-        "boolean(.//ted:CONTRACTS_DPS)", namespaces=NMSP) \
-        else ['NO']  # YES/NO
+    fields.append(('CONTRACTS_DPS',
+                   XPATH['has_contracts_dps'](xml)))  # YES/NO
 
-    # Step 4.3: Extract TOTAL_VALUE
-    values = xml.xpath("ted:TOTAL_FINAL_VALUE", namespaces=NMSP)
+    # Step 4.3: Extract TOTAL_VALUE, replaced by the costs of the object
+    contract_value = None
+    values = XPATH['total_final_value'](xml)
 
     if values:
-        obj['CONTRACT_VALUE'] = get_contract_value(values[0])
+        contract_value = get_contract_value(values[0], build)
 
-    if xml.xpath("boolean(./ted:COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE)",
-                 namespaces=NMSP):
-        obj['CONTRACT_VALUE'] = get_contract_value(xml)
+    if XPATH['has_costs'](xml):
+        contract_value = get_contract_value(xml, build)
 
-    return obj
+    if contract_value is not None:  # See fused.valid()
+        fields.append(('CONTRACT_VALUE', contract_value))
 
+    return build('contract_object', fields)
 
-def get_award(xml):
 
-    obj = dict()
+def get_award(xml, build=section):
+
+    fields = []
 
     # Step 5.1: Extract CONTRACTOR DATA
-    contractor = dict()
-    contact_data = xml.xpath(
-        ("./ted:ECONOMIC_OPERATOR_NAME_ADDRESS"
-         "/ted:CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME"
-         "| ./ted:CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME_CHP"),
-        namespaces=NMSP)
+    contact_data = XPATH['contact_data'](xml)
 
     if contact_data:
         contact_data = contact_data[0]
 
         # Step 5.1.2: Extract CONTRACTOR NAME
-        contractor['OFFICIALNAME'] = contact_data.xpath(
-            ("./ted:ORGANISATION/ted:OFFICIALNAME/text() | "
-             "./ted:ORGANISATION/text()"), namespaces=NMSP)
+        contractor = [('OFFICIALNAME',
+                       XPATH['contractor_name'](contact_data))]
 
         # Step 5.1.2: Extract CONTRACTOR ADDRESS
-        contractor['COUNTRY'] = contact_data.xpath("ted:COUNTRY/@VALUE",
-                                                   namespaces=NMSP)
-        contractor['ADDRESS'] = contact_data.xpath("ted:ADDRESS/text()",
-                                                   namespaces=NMSP)
-        contractor['TOWN'] = contact_data.xpath("ted:TOWN/text()",
-                                                namespaces=NMSP)
-        contractor['POSTAL_CODE'] = contact_data.xpath(
-            "ted:POSTAL_CODE/text()", namespaces=NMSP)
-        obj['CONTRACTOR'] = contractor
+        contractor.append(('COUNTRY', XPATH['country'](contact_data)))
+        contractor.append(('ADDRESS', XPATH['address'](contact_data)))
+        contractor.append(('TOWN', XPATH['town'](contact_data)))
+        contractor.append(('POSTAL_CODE',
+                           XPATH['postal_code'](contact_data)))
+        fields.append(('CONTRACTOR', build('contractor', contractor)))
 
     # Step 5.2: Extract CONTRACTOR CONTRACT VALUE
-    values = xml.xpath(
-      ".//ted:CONTRACT_VALUE_INFORMATION | .//ted:INFORMATION_VALUE_CONTRACT",
-      namespaces=NMSP)
+    values = XPATH['award_value'](xml)
 
     if values:
-        obj['CONTRACT_VALUE'] = get_contract_value(values[0])
+        contract_value = get_contract_value(values[0], build)
+        if contract_value is not None:  # See fused.valid()
+            fields.append(('CONTRACT_VALUE', contract_value))
 
-    return obj
+    return build('award', fields)
 
 
-def get_contract(xml):
+def get_contract(xml, languages=None, build=section):
     """
     Function to extract data from CONTRACT xml section
     :param xml:
-    :return: dictionary of the main sections:
+    :param languages: preferred translations, in order of preference.
+                      Defaults to LANGUAGES
+    :param build: builder of the sections, see section()
+    :return: 'contract' section with the main sections:
+        - OTH_NOT
         - CONTRACTING_AUTHORITY
         - CONTRACT_OBJECT
         - AWARDS_OF_CONTRACT
     """
 
-    obj = dict()
+    if languages is None:
+        languages = LANGUAGES
 
-    form = xml.xpath('ted:FORM_SECTION', namespaces=NMSP)[0]
+    form = XPATH['form_section'](xml)[0]
 
     # Step 1: Skip if it is a form with no structure. Too difficult to extract
-    if form.xpath("name(*) = 'OTH_NOT'"):
-        obj['OTH_NOT'] = ['YES']
-        return obj
-    obj['OTH_NOT'] = ['NO']
+    if XPATH['is_oth_not'](form):
+        return build('contract', [('OTH_NOT', True)])
+    fields = [('OTH_NOT', False)]
 
-    # Step 2: Extract the contract award section. Prefer English, or French, or
-    # German translation if there. Otherwise pick first language available.
-    contract = form.xpath("*/*")[0]
-
-    for ln in ['EN', 'FR', 'DE']:
-        if form.xpath("*/@LG = $ln", ln=ln):
-            contract = form.xpath("*[@LG = $ln]/*", ln=ln)[0]
-            break
+    # Step 2: Extract the contract award section
+    contract = preferred_contract(form, languages)
 
     # Step 3: Extract Contracting Authority: OFFICIALNAME
-    authority = contract.xpath(
-        ("ted:*[starts-with(local-name(), 'CONTRACTING') or "
-         "starts-with(local-name(), 'CONTACTING') or "
-         "starts-with(local-name(), 'AUTHORITY')]/"
-         "ted:*[starts-with(local-name(), 'NAME')]//"
-         "ted:ORGANISATION"), namespaces=NMSP)[0]
-    obj['CONTRACTING_AUTHORITY'] = authority.xpath(  # Compulsory, only one
-        "ted:OFFICIALNAME/text() | ./text()", namespaces=NMSP)
+    authority = XPATH['authority'](contract)[0]
+    # Compulsory, only one
+    fields.append(('CONTRACTING_AUTHORITY',
+                   XPATH['authority_name'](authority)))
 
     # Step 4: Extract CONTRACT OBJECT information
-    contract_object = contract.xpath(  # Compulsory, only one
-            "ted:*[starts-with(local-name(), 'OBJECT')]", namespaces=NMSP)[0]
-    obj['CONTRACT_OBJECT'] = get_object(contract_object)
+    # Compulsory, only one
+    contract_object = XPATH['contract_object'](contract)[0]
+    fields.append(('CONTRACT_OBJECT', get_object(contract_object, build)))
 
     # Step 5: Extract AWARD_OF_CONTRACT section
-    awards = contract.xpath(  # 0 or more
-        "ted:*[starts-with(local-name(), 'AWARD')]", namespaces=NMSP)
-
-    obj['AWARDS_OF_CONTRACT'] = []
+    awards = []
 
-    for award in awards:
+    for award in XPATH['awards'](contract):  # 0 or more
 
-        if award.xpath("boolean(./ted:AWARD_AND_CONTRACT_VALUE)",
-                       namespaces=NMSP):
+        if XPATH['has_award_and_contract_value'](award):
 
-            for sub_award in award.xpath(
-                    "ted:AWARD_AND_CONTRACT_VALUE",
-                    namespaces=NMSP):
-                obj['AWARDS_OF_CONTRACT'].append(get_award(sub_award))
+            for sub_award in XPATH['award_and_contract_value'](award):
+                awards.append(get_award(sub_award, build))
 
         else:
-            obj['AWARDS_OF_CONTRACT'].append(get_award(award))
+            awards.append(get_award(award, build))
 
-    return obj
+    fields.append(('AWARDS_OF_CONTRACT', awards))
 
+    return build('contract', fields)
 
-def extract(path):
+
+def preferred_contract(form, languages):
+    """
+    Select the contract of the preferred translation of the FORM_SECTION.
+    Prefer the first available of the languages, in a single pass over the
+    translations. Otherwise pick first language available. The other
+    translations are parsed all the same, they are only not queried.
+    :param form: FORM_SECTION
+    :param languages: preferred translations, in order of preference
+    :return: first child of the translation, e.g. FD_CONTRACT_AWARD
+    """
+
+    best = None
+    rank = len(languages)
+    for translation in XPATH['children'](form):
+        if language_rank(translation, languages) < rank:
+            best = translation
+            rank = language_rank(translation, languages)
+
+    if best is None:
+        return XPATH['first_contract'](form)[0]
+    return XPATH['children'](best)[0]
+
+
+def language_rank(translation, languages):
+    """
+    Rank of a translation of the FORM_SECTION in the preferred languages
+    :param translation: child of the FORM_SECTION
+    :param languages: preferred languages, in order of preference
+    :return: index in languages, len(languages) for any other language
+    """
+
+    lg = translation.get('LG')
+    return languages.index(lg) if lg in languages else len(languages)
+
+
+def extract(path, languages=None):
     """
     Main function to extract data from xml file
     :param path:
+    :param languages: preferred translations of the FORM_SECTION, in order
+                      of preference. Defaults to LANGUAGES
     :return: dictionary of the main sections:
         - DOC_ID
         - CODED_DATA
             - NOTICE_DATA
             - CODIF_DATA
         - CONTRACT
+            - OTH_NOT
             - CONTRACTING_AUTHORITY
             - CONTRACT_OBJECT
             - AWARDS_OF_CONTRACT
     """
 
-    root = etree.parse(path).getroot()
-
-    obj = dict()
+    return extract_tree(etree.parse(path).getroot(), languages)
 
-    obj['DOC_ID'] = root.get('DOC_ID', default=None)
 
-    obj['CODED_DATA'] = get_coded(root)
-
-    obj['CONTRACT'] = get_contract(root)
+def extract_tree(root, languages=None, build=section):
+    """
+    Extract data from a parsed notice, see extract()
+    :param root: root element of the notice
+    :param languages: preferred translations of the FORM_SECTION
+    :param build: builder of the sections, see section()
+    :return: 'record' section with the main sections
+    """
 
-    return obj
+    return build('record', [
+        ('DOC_ID', root.get('DOC_ID', default=None)),
+        ('CODED_DATA', get_coded(root, build)),
+        ('CONTRACT', get_contract(root, languages, build))])
 
 
 if __name__ == "__main__":
 
-    os.chdir('/Volumes/WD/S8')
+    from batch import month_folders
+    from deadletter import DeadLetters
+    from pipeline import run, JsonLines
 
     years = ['2011', '2012', '2013', '2014', '2015', '2016']
     months = ['01', '02', '03', '04', '05', '06', '07', '08',
               '09', '10', '11', '12']
 
-    collection = []
+    # A failing notice does not stop the run: it is reported, and stored
+    # with its traceback for replay, see deadletter.py
+    dead_letters = DeadLetters('dead_letters')
+
+    # Records are written as they are extracted, rather than collected in
+    # memory: see pipeline.py
     for Y in years:
         print(Y)
-        for M in months:
-            print(M)
-            # Folder containing xml files
-            DIR = os.path.join(os.getcwd(), Y + '-' + M)
-            # List xml files
-            files = os.listdir(DIR)
-            for f in files:
-                # Extract data from xml file
-                file_path = os.path.join(DIR, f)
-                try:
-                    data = extract(file_path)
-                except Exception as e:
-                    print(e)
+        counts = run(month_folders('/Volumes/WD/S8', [Y], months),
+                     [JsonLines('raw_' + Y + '.jsonl')],
+                     JsonLines('errors_raw_' + Y + '.jsonl'),
+                     validate=False, timeout=60, dead_letters=dead_letters)
+        print('{records} notices, {failed} failed'.format(**counts))
@@ -0,0 +1,397 @@
+import os
+import sys
+import json
+import queue
+import hashlib
+import asyncio
+import argparse
+import threading
+from urllib.parse import urlsplit, urljoin
+
+from batch import iter_extract, failure
+from manifest import file_hash
+from pipeline import JsonLines, feed
+
+# Size of the blocks read from the network
+BLOCK_SIZE = 64 * 1024
+
+# Maximum number of redirections followed
+MAX_REDIRECTS = 5
+
+# Attempts after a dropped connection, an incomplete download or a server
+# error, resuming the partial download, and delay before the first one (in
+# seconds, doubled at each attempt)
+RETRIES = 3
+RETRY_DELAY = 1.0
+
+
+class FetchError(Exception):
+    """
+    A package could not be downloaded, or does not match its expected size
+    or checksum
+    """
+
+
+class Cache(object):
+    """
+    Content-addressed cache of downloaded packages:
+        - objects/ab/abcdef.../20160103_001.tar.gz: packages, in a folder
+          named after the SHA-256 of their content. The file keeps the name
+          of the package, as it is the ARCHIVE of the records
+        - partial/: downloads in progress, resumed by the next fetch
+        - index.json: URL: {sha256, size, path} of the downloaded packages
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: cache folder, created if it does not exist
+        """
+
+        self.folder = folder
+        for sub in ('objects', 'partial'):
+            os.makedirs(os.path.join(folder, sub), exist_ok=True)
+        self.index_path = os.path.join(folder, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    def lookup(self, url):
+        """
+        :param url: URL of a package
+        :return: path of the cached package, None if it is not cached
+        """
+
+        entry = self.index.get(url)
+        if entry is not None:
+            path = os.path.join(self.folder, entry['path'])
+            if os.path.exists(path):
+                return path
+        return None
+
+    def partial(self, url):
+        """
+        :param url: URL of a package
+        :return: path of its partial download
+        """
+
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, 'partial', key + '.part')
+
+    def store(self, url, part, digest):
+        """
+        Move a complete download into the cache
+        :param url: URL of the package
+        :param part: downloaded file, see partial()
+        :param digest: SHA-256 of the file
+        :return: path of the cached package
+        """
+
+        name = os.path.basename(urlsplit(url).path) or 'package'
+        path = os.path.join('objects', digest[:2], digest, name)
+        target = os.path.join(self.folder, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        size = os.path.getsize(part)
+        os.replace(part, target)  # Same content: replacing is harmless
+
+        self.index[url] = {'sha256': digest, 'size': size, 'path': path}
+        temp = self.index_path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(temp, self.index_path)
+        return target
+
+
+async def request(url, start=0):
+    """
+    Send a GET request
+    :param url: http or https URL. FTP is not supported
+    :param start: first byte requested, to resume a download
+    :return: tuple (status, headers, reader, writer). Header names are
+             lower case, the body is read from reader
+    :raises: ConnectionError on a malformed response, to retry later
+    """
+
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise FetchError('Unsupported URL, only HTTP(S) is supported: ' +
+                         url)
+    https = parts.scheme == 'https'
+    port = parts.port or (443 if https else 80)
+
+    reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                   ssl=https or None)
+
+    target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    lines = ['GET {} HTTP/1.1'.format(target),
+             'Host: {}'.format(parts.netloc),
+             'User-Agent: ExtracTED',
+             'Accept-Encoding: identity',
+             'Connection: close']
+    if start:
+        lines.append('Range: bytes={}-'.format(start))
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+
+    line = await reader.readline()
+    try:
+        status = int(line.split()[1])
+    except (IndexError, ValueError):
+        writer.close()
+        raise ConnectionError('Malformed response from {}: {!r}'.format(
+            url, line[:100]))
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return status, headers, reader, writer
+
+
+async def read_body(reader, headers, f):
+    """
+    Write the body of a response to a file
+    :param reader: stream of the response
+    :param headers: headers of the response
+    :param f: file opened in binary mode
+    :return: number of bytes written
+    """
+
+    written = 0
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';')[0], 16)
+            except ValueError:
+                raise ConnectionError('Malformed chunk: {!r}'.format(
+                    line[:100]))
+            if size == 0:
+                break
+            f.write(await reader.readexactly(size))
+            written += size
+            await reader.readline()  # CRLF after the chunk
+        return written
+
+    remaining = int(headers.get('content-length', -1))
+    while remaining != 0:
+        block = await reader.read(BLOCK_SIZE if remaining < 0 else
+                                  min(BLOCK_SIZE, remaining))
+        if not block:
+            break  # Connection closed: partial download, resumed later
+        f.write(block)
+        written += len(block)
+        remaining -= len(block) if remaining > 0 else 0
+    return written
+
+
+async def fetch_part(url, part):
+    """
+    Download a package, or the rest of it, in its partial file
+    :param url: URL of the package
+    :param part: partial download, see Cache.partial()
+    :return: total size announced by the server, '*' if unknown
+    :raises: ConnectionError on a server error, to retry later
+    """
+
+    location = url
+    for _ in range(MAX_REDIRECTS + 1):
+        start = os.path.getsize(part) if os.path.exists(part) else 0
+        status, headers, reader, writer = await request(location, start)
+        try:
+            if status in (301, 302, 303, 307, 308):
+                location = urljoin(location, headers['location'])
+                continue
+            if status == 416 and start:  # Partial file is not valid
+                os.remove(part)
+                continue
+            if status == 206:
+                # Content-Range: bytes start-end/total
+                first = int(headers['content-range'].split()[1]
+                            .split('-')[0])
+                if first != start:
+                    raise FetchError('Unexpected range for ' + url)
+                total = headers['content-range'].split('/')[-1]
+            elif status == 200:
+                start = 0  # Range not supported: download again
+                total = headers.get('content-length', '*')
+            elif status >= 500:
+                raise ConnectionError('HTTP {} for {}'.format(status, url))
+            else:
+                raise FetchError('HTTP {} for {}'.format(status, url))
+
+            with open(part, 'ab' if start else 'wb') as f:
+                await read_body(reader, headers, f)
+        finally:
+            writer.close()
+        return total
+
+    raise FetchError('Too many redirections for ' + url)
+
+
+async def download(url, cache, semaphore, sha256=None):
+    """
+    Download a package in the cache, resuming a previous partial download.
+    Dropped connections, incomplete downloads, malformed responses and
+    server errors are retried RETRIES times, from where the download
+    stopped
+    :param url: URL of the package
+    :param cache: Cache
+    :param semaphore: limits the number of concurrent connections
+    :param sha256: expected SHA-256 of the package, None to only check the
+                   size announced by the server
+    :return: path of the cached package
+    """
+
+    cached = cache.lookup(url)
+    if cached is not None:
+        return cached
+
+    part = cache.partial(url)
+
+    async with semaphore:
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                total = await fetch_part(url, part)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                error = FetchError('{} for {}'.format(e, url))
+                continue
+
+            size = os.path.getsize(part)
+            if total == '*' or size == int(total):
+                break
+            error = FetchError('Incomplete download of {}: {} of {} '
+                               'bytes'.format(url, size, total))
+        else:
+            raise error
+
+    loop = asyncio.get_event_loop()
+    digest = await loop.run_in_executor(None, file_hash, part)
+    if sha256 is not None and digest != sha256.lower():
+        os.remove(part)
+        raise FetchError('Checksum mismatch for ' + url)
+
+    return cache.store(url, part, digest)
+
+
+async def fetch_all(urls, cache, limit=4, checksums=None):
+    """
+    Download packages concurrently. A URL given several times is downloaded
+    once: its downloads would write the same partial file
+    :param urls: list of URLs
+    :param cache: Cache
+    :param limit: maximum number of concurrent connections
+    :param checksums: dictionary URL: expected SHA-256, optional
+    :return: async generator of (url, path, error), in the order the
+             downloads finish. error is None when the download succeeded
+    """
+
+    semaphore = asyncio.Semaphore(limit)
+    checksums = checksums or {}
+
+    async def fetch(url):
+        try:
+            return url, await download(url, cache, semaphore,
+                                       checksums.get(url)), None
+        except Exception as e:
+            return url, None, e
+
+    urls = list(dict.fromkeys(urls))
+    for future in asyncio.as_completed([fetch(url) for url in urls]):
+        yield await future
+
+
+def iter_fetch(urls, folder, limit=4, checksums=None):
+    """
+    Main function to download packages in a background thread, while the
+    finished ones are processed
+    :param urls: list of URLs, downloaded once each
+    :param folder: cache folder
+    :param limit: maximum number of concurrent connections
+    :param checksums: dictionary URL: expected SHA-256, optional
+    :return: generator of (url, path, error) as the downloads finish
+    """
+
+    results = queue.Queue()
+    cache = Cache(folder)
+
+    async def produce():
+        async for result in fetch_all(urls, cache, limit, checksums):
+            results.put(result)
+
+    def run():
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(produce())
+        finally:
+            loop.close()
+            results.put(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while True:
+        result = results.get()
+        if result is None:
+            break
+        yield result
+    thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Download TED packages concurrently and extract them as '
+                    'they arrive')
+    parser.add_argument('urls', nargs='+',
+                        help='HTTP(S) URLs of the packages (FTP is not '
+                             'supported)')
+    parser.add_argument('-c', '--cache', default='cache',
+                        help='cache folder of the packages')
+    parser.add_argument('-l', '--limit', type=int, default=4,
+                        help='maximum number of concurrent downloads')
+    parser.add_argument('--checksums',
+                        help='JSON file of URL: expected SHA-256')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of extraction processes')
+    parser.add_argument('--jsonl', default='-',
+                        help='JSON lines output file (default: stdout)')
+    parser.add_argument('-e', '--errors',
+                        help='JSON lines file for the failures')
+    args = parser.parse_args(argv)
+
+    checksums = None
+    if args.checksums:
+        with open(args.checksums) as f:
+            checksums = json.load(f)
+
+    sinks = [JsonLines(args.jsonl)]
+    errors = JsonLines(args.errors) if args.errors else None
+    counts = {'records': 0, 'failed': 0}
+
+    def packages():
+        # Packages are sent to the same pool of workers as they arrive
+        for url, path, error in iter_fetch(args.urls, args.cache,
+                                           args.limit, checksums):
+            if error is None:
+                yield path
+                continue
+            counts['failed'] += 1
+            if errors is not None:
+                errors.write(failure(url, 'fetch', error))
+
+    try:
+        feed(iter_extract(packages(), args.workers), sinks, errors, counts)
+    finally:
+        for sink in sinks + ([errors] if errors is not None else []):
+            sink.close()
+
+    print('{records} notices extracted, {failed} failed'.format(**counts),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import lookups
+from extractor import extract_tree
+from validator import Fallback, ValueInvalid, currencies, number
+
+# Fused extraction: each field is coerced, checked and dropped if empty as
+# it is extracted, instead of building the raw record, validating it with
+# the schema and pruning it. Only values which are valid without doubt are
+# handled here: anything else raises Fallback, and the notice goes through
+# the three steps, which give the output or the error. The traversal is the
+# one of the extractor, with the sections built by valid()
+
+CURRENCIES = frozenset(currencies)
+YES_NO = frozenset(['YES', 'NO'])
+
+
+def put(obj, key, value):
+    """
+    Set a field unless it is empty, as prune() does
+    """
+
+    if value:
+        obj[key] = value
+
+
+def first(lst):
+    """
+    All(Coerce(flat), str)
+    """
+
+    if not lst:
+        raise Fallback
+    return lst[0]
+
+
+def optional(lst):
+    """
+    Any([], All(Coerce(flat), str)), pruned
+    """
+
+    return lst[0] if lst else None
+
+
+def code(name, s):
+    """
+    Code of a lookup, see validator.code()
+    """
+
+    if s not in lookups.codes(name):
+        raise Fallback
+    return s
+
+
+def prefixed(name, lst):
+    """
+    [All(str, starts_with(name))]
+    """
+
+    for s in lst:
+        if lookups.prefix(name, s) is None:
+            raise Fallback
+    return lst
+
+
+def numeric(lst):
+    """
+    Any([], All(Coerce(flat), Coerce(number)), All(Coerce(flat), str)):
+    a number, or the string if it is not one. Pruned
+    """
+
+    if not lst:
+        return None
+    try:
+        return number(lst[0])
+    except ValueInvalid:
+        return lst[0]  # Let it pass
+
+
+def currency(s):
+    """
+    In(currencies)
+    """
+
+    if s not in CURRENCIES:
+        raise Fallback
+    return s
+
+
+def country(s):
+    """
+    All(Coerce(flat), str, Length(2), code('ISO_COUNTRY'))
+    """
+
+    if len(s) < 2:  # Length(2)
+        raise Fallback
+    return code('ISO_COUNTRY', s)
+
+
+def yes_no(lst):
+    """
+    Optional YES/NO field, pruned
+    """
+
+    s = optional(lst)
+    if s is not None and s not in YES_NO:
+        raise Fallback
+    return s
+
+
+def identity(value):
+    return value
+
+
+def coded(name):
+    return lambda lst: code(name, first(lst))
+
+
+# Coercion and check of each field, by key. The sections are built already
+VALID = {
+    # value: TOTAL_VALUE, COST or ESTIMATE
+    'CURRENCY': currency,
+    'VAT_PRCT': numeric,
+    'VALUE': numeric,
+    'LOW_VALUE': numeric,
+    'HIGH_VALUE': numeric,
+
+    # NOTICE_DATA and CODIF_DATA
+    'ORIGINAL_NUTS': lambda lst: prefixed('ISO_COUNTRY', lst),
+    'ORIGINAL_CPV': lambda lst: prefixed('CPV', lst),
+    'NO_DOC_OJS': first,
+    'ISO_COUNTRY': lambda lst: country(first(lst)),
+    'IA_URL_GENERAL': optional,
+    'REF_NOTICE': identity,
+    'MA_MAIN_ACTIVITIES': lambda lst: [code('MA_MAIN_ACTIVITY', s)
+                                       for s in lst],
+    'DS_DATE_DISPATCH': first,
+
+    # CONTRACT_VALUE
+    'NUMBER_OF_YEARS': numeric,
+    'NUMBER_OF_MONTHS': numeric,
+
+    # CONTRACT_OBJECT
+    'NUTS': lambda lst: prefixed('ISO_COUNTRY', lst),
+    'NUTS_EXTRA': ' '.join,
+    'CPV_MAIN': lambda lst: optional(prefixed('CPV', lst[:1])),
+    'CONTRACT_COVERED_GPA': yes_no,
+    'CONCLUSION_FRAMEWORK_AGREEMENT': lambda b: 'YES' if b else 'NO',
+    'CONTRACTS_DPS': lambda b: 'YES' if b else 'NO',
+
+    # CONTRACTOR
+    'OFFICIALNAME': optional,
+    'COUNTRY': lambda lst: country(lst[0]) if lst else None,
+    'ADDRESS': optional,
+    'TOWN': optional,
+    'POSTAL_CODE': optional,
+
+    # CONTRACT
+    'OTH_NOT': lambda b: 'YES' if b else 'NO',
+    'CONTRACTING_AUTHORITY': first,
+}
+VALID.update((item, coded(item)) for item in [
+    'TD_DOCUMENT_TYPE', 'AA_AUTHORITY_TYPE', 'NC_CONTRACT_NATURE', 'PR_PROC',
+    'RP_REGULATION', 'TY_TYPE_BID', 'AC_AWARD_CRIT'])
+
+# Sections which are kept even if empty, as prune() keeps the dictionaries
+# it empties
+KEPT = frozenset(['CONTRACTOR', 'CONTRACT_VALUE'])
+
+
+def valid(name, fields):
+    """
+    Build a section of the validated and pruned record, see
+    extractor.section()
+    :param name: name of the section
+    :param fields: list of (key, value)
+    :return: dictionary, or None for a 'contract_value' section with none
+             of its fields, as it is then pruned. Awards may be empty: they
+             are kept, as prune() does not drop list items
+    :raises: Fallback
+    """
+
+    if name == 'contract_value' and not fields:
+        return None
+
+    obj = dict()
+    for key, value in fields:
+        if key in VALID:
+            value = VALID[key](value)
+        if key in KEPT:
+            obj[key] = value
+        else:
+            put(obj, key, value)
+    return obj
+
+
+def extract_valid(root, languages=None, origin=None):
+    """
+    Main function to extract, validate and prune a notice in a single
+    traversal. Same output as schema(extract(path)) followed by prune()
+    :param root: root element of the parsed notice
+    :param languages: preferred translations of the FORM_SECTION, in order
+                      of preference. Defaults to extractor.LANGUAGES
+    :param origin: SOURCE of the record, for notices read from a package
+    :return: validated and pruned record
+    :raises: Fallback, or any error of the extraction, when the notice is
+             not valid without doubt: run the three steps on it instead
+    """
+
+    if not isinstance(root.get('DOC_ID', default=None), str):
+        raise Fallback
+
+    obj = extract_tree(root, languages, valid)
+
+    if origin is not None:
+        obj['SOURCE'] = origin
+
+    return obj
@@ -0,0 +1,278 @@
+import os
+import mmap
+import struct
+import hashlib
+import argparse
+
+# Dictionary-encoded string columns of the exported tables
+INTERNED = ['CONTRACTING_AUTHORITY', 'OFFICIALNAME', 'TOWN', 'ADDRESS']
+
+# String dictionary file, memory-mapped:
+#   - header: magic, number of strings
+#   - offsets: position of each string in the blob, by ID, plus the end
+#   - index: (hash, ID) sorted by hash, to find the ID of a string
+#   - blob: the UTF-8 strings, in ID order
+MAGIC = b'TEDSTR01'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+INDEX = struct.Struct('<qI')
+
+
+def string_hash(s):
+    """
+    :param s: string
+    :return: signed 64-bit integer, first 8 bytes of its BLAKE2b hash
+    """
+
+    digest = hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest()
+    return struct.unpack('<q', digest)[0]
+
+
+def intern_record(record, pool):
+    """
+    Make the repeated names of a record share a single string object with
+    the other records of the pool: a unit of work is then pickled with one
+    copy of each name, and the records held by the consumer share them
+    :param record: extracted record, modified in place
+    :param pool: dictionary string: string
+    :return: record
+    """
+
+    def canonical(s):
+        s = str(s)  # Plain string, not an lxml result tied to its document
+        return pool.setdefault(s, s)
+
+    contract = record.get('CONTRACT', {})
+    authority = contract.get('CONTRACTING_AUTHORITY')
+    if isinstance(authority, str):
+        contract['CONTRACTING_AUTHORITY'] = canonical(authority)
+
+    for award in contract.get('AWARDS_OF_CONTRACT', []):
+        contractor = award.get('CONTRACTOR', {})
+        for key in INTERNED[1:]:
+            s = contractor.get(key)
+            if isinstance(s, str):
+                contractor[key] = canonical(s)
+            elif isinstance(s, list):  # Raw records: lists of strings
+                contractor[key] = [canonical(item) for item in s]
+    return record
+
+
+class Dictionary(object):
+    """
+    Read-only string dictionary file, memory-mapped: the strings are not
+    loaded, and the processes reading the same file share its pages. IDs
+    are the positions of the strings, 0 to len() - 1
+    """
+
+    def __init__(self, path):
+        """
+        :param path: dictionary file, see Strings.save()
+        """
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a string dictionary: ' + path)
+        self.offsets = HEADER.size
+        self.index = self.offsets + (self.count + 1) * OFFSET.size
+        self.blob = self.index + self.count * INDEX.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        """
+        :param key: ID of a string
+        :return: the string
+        """
+
+        if not 0 <= key < self.count:
+            raise KeyError(key)
+        start, = OFFSET.unpack_from(self.map, self.offsets + key * OFFSET.size)
+        end, = OFFSET.unpack_from(self.map,
+                                  self.offsets + (key + 1) * OFFSET.size)
+        return self.map[self.blob + start:self.blob + end].decode('utf-8')
+
+    def find(self, s):
+        """
+        :param s: string
+        :return: its ID, None if it is not in the dictionary
+        """
+
+        digest = string_hash(s)
+        low, high = 0, self.count
+        while low < high:  # Binary search on the sorted hashes
+            middle = (low + high) // 2
+            if INDEX.unpack_from(self.map,
+                                 self.index + middle * INDEX.size)[0] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.count:  # Strings with the same hash, if any
+            found, key = INDEX.unpack_from(self.map,
+                                           self.index + low * INDEX.size)
+            if found != digest:
+                break
+            if self[key] == s:
+                return key
+            low += 1
+        return None
+
+    def __iter__(self):
+        for key in range(self.count):
+            yield self[key]
+
+    def close(self):
+        self.map.close()
+
+
+class Strings(object):
+    """
+    String dictionary of the runs: encodes strings as small integer IDs.
+    IDs are given in order of appearance and never change: the dictionary
+    file only grows, so the IDs of tables written by previous runs stay valid
+    """
+
+    def __init__(self, path):
+        """
+        :param path: dictionary file, read if it exists
+        """
+
+        self.path = path
+        self.dictionary = Dictionary(path) if os.path.exists(path) else None
+        self.known = len(self.dictionary) if self.dictionary else 0
+        self.new = []  # Strings not in the file yet, by ID - known
+        self.ids = {}  # Memo string: ID
+
+    def add(self, s):
+        """
+        :param s: string
+        :return: its ID, a new one if the string is not in the dictionary
+        """
+
+        key = self.ids.get(s)
+        if key is None:
+            if self.dictionary is not None:
+                key = self.dictionary.find(s)
+            if key is None:
+                key = self.known + len(self.new)
+                self.new.append(s)
+            self.ids[s] = key
+        return key
+
+    def encode(self, df, columns=INTERNED):
+        """
+        Replace string columns of a table by their IDs, column NAME becoming
+        NAME_ID. Each distinct string of a column is encoded once
+        :param df: pandas DataFrame
+        :param columns: columns to encode, when they are in the table
+        :return: df
+        """
+
+        import pandas as pd
+
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[column])
+            ids = pd.array([self.add(s) for s in uniques] + [None],
+                           dtype='Int32')
+            df[column] = ids[codes]  # Missing values (code -1) are NA
+            df.rename(columns={column: column + '_ID'}, inplace=True)
+        return df
+
+    def save(self):
+        """
+        Write the dictionary file with the new strings, atomically
+        :return: number of strings in the file
+        """
+
+        if not self.new and self.dictionary is not None:
+            return self.known
+
+        strings = list(self.dictionary) if self.dictionary else []
+        strings.extend(self.new)
+        if self.dictionary is not None:
+            self.dictionary.close()
+
+        encoded = [s.encode('utf-8') for s in strings]
+        index = sorted((string_hash(s), key) for key, s in enumerate(strings))
+
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(strings)))
+            offset = 0
+            for data in encoded:
+                f.write(OFFSET.pack(offset))
+                offset += len(data)
+            f.write(OFFSET.pack(offset))
+            for entry in index:
+                f.write(INDEX.pack(*entry))
+            for data in encoded:
+                f.write(data)
+        os.replace(temp, self.path)
+
+        self.dictionary = Dictionary(self.path)
+        self.known = len(strings)
+        self.new = []
+        return self.known
+
+
+def encoded_columns(columns, interned=INTERNED):
+    """
+    Columns of a table once encoded, see Strings.encode()
+    :param columns: list of (name, type), see export.COLUMNS
+    :param interned: encoded columns
+    :return: list of (name, type), encoded columns being (NAME_ID, 'id')
+    """
+
+    return [(column + '_ID', 'id') if column in interned else (column, kind)
+            for column, kind in columns]
+
+
+def decode(df, dictionary, columns=INTERNED):
+    """
+    Replace the ID columns of a table by their strings, see Strings.encode()
+    :param df: pandas DataFrame, e.g. read from the Parquet tables
+    :param dictionary: Dictionary
+    :param columns: encoded columns, when their NAME_ID is in the table
+    :return: df
+    """
+
+    import pandas as pd
+
+    for column in columns:
+        if column + '_ID' not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[column + '_ID'])
+        strings = [dictionary[int(key)] for key in uniques] + [None]
+        df[column + '_ID'] = [strings[code] for code in codes]
+        df.rename(columns={column + '_ID': column}, inplace=True)
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Look up the strings of a string dictionary')
+    parser.add_argument('dictionary', help='string dictionary file')
+    parser.add_argument('ids', nargs='*', type=int, help='IDs to print')
+    parser.add_argument('-f', '--find', nargs='+', default=[],
+                        help='strings whose ID is printed')
+    args = parser.parse_args(argv)
+
+    dictionary = Dictionary(args.dictionary)
+    try:
+        if not args.ids and not args.find:
+            print('{} strings'.format(len(dictionary)))
+        for key in args.ids:
+            print('{}\t{}'.format(key, dictionary[key]))
+        for s in args.find:
+            print('{}\t{}'.format(dictionary.find(s), s))
+    finally:
+        dictionary.close()
+
+
+if __name__ == "__main__":
+    main()
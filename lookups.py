@@ -0,0 +1,191 @@
+import os
+import csv
+import pickle
+
+# Folder of the lookup tables
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Lookups')
+
+# Compiled tables, rebuilt when a csv file changes
+CACHE = os.path.join(FOLDER, 'lookups.pickle')
+
+# Lookup name: (csv file, encoding, code column, description column)
+TABLES = {
+    'ISO_COUNTRY': ('ISO_COUNTRY.csv', 'latin', 1, 2),
+    'CPV': ('CPV.csv', 'utf-8', 0, 1),
+    'MA_MAIN_ACTIVITY': ('MA_MAIN_ACTIVITY.csv', 'utf-8', 0, 1),
+    'TD_DOCUMENT_TYPE': ('TD_DOCUMENT_TYPE.csv', 'utf-8', 0, 1),
+    'NC_CONTRACT_NATURE': ('NC_CONTRACT_NATURE.csv', 'utf-8', 0, 1),
+    'AA_AUTHORITY_TYPE': ('AA_AUTHORITY_TYPE.csv', 'utf-8', 0, 1),
+    'PR_PROC': ('PR_PROC.csv', 'utf-8', 0, 1),
+    'TY_TYPE_BID': ('TY_TYPE_BID.csv', 'utf-8', 0, 1),
+    'AC_AWARD_CRIT': ('AC_AWARD_CRIT.csv', 'utf-8', 0, 1),
+    'RP_REGULATION': ('RP_REGULATION.csv', 'utf-8', 0, 1)
+}
+
+# Lookups used as code prefixes: NUTS codes start with the ISO country code,
+# CPV codes with the CPV division
+PREFIXES = ['ISO_COUNTRY', 'CPV']
+
+# Marks the end of a code in a trie
+END = ''
+
+# Compiled lookups, loaded on first use
+compiled = None
+
+
+def signature(folder=FOLDER):
+    """
+    Key of the cache: name, modification time and size of the csv files
+    :param folder: folder of the lookup tables
+    :return: tuple
+    """
+
+    key = []
+    for name in sorted(TABLES):
+        stat = os.stat(os.path.join(folder, TABLES[name][0]))
+        key.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(key)
+
+
+def read_table(path, encoding, code, description):
+    """
+    Read a lookup table
+    :param path: csv file, with a header
+    :param encoding: encoding of the file
+    :param code: index of the code column
+    :param description: index of the description column
+    :return: dictionary code: description, in file order
+    """
+
+    with open(path, encoding=encoding, newline='') as f:
+        rows = csv.reader(f)
+        next(rows)  # Header
+        return {row[code]: row[description] for row in rows if row}
+
+
+def trie(codes):
+    """
+    Build a prefix trie
+    :param codes: iterable of codes
+    :return: nested dictionaries character: sub-trie. END marks the end of
+             a code and holds the code
+    """
+
+    root = {}
+    for code in codes:
+        node = root
+        for char in code:
+            node = node.setdefault(char, {})
+        node[END] = code
+    return root
+
+
+def build(folder=FOLDER):
+    """
+    Compile the lookup tables
+    :param folder: folder of the lookup tables
+    :return: dictionary:
+        - signature: see signature()
+        - descriptions: lookup name: {code: description}
+        - codes: lookup name: frozenset of codes
+        - tries: lookup name: prefix trie, for PREFIXES
+    """
+
+    descriptions = {name: read_table(os.path.join(folder, table[0]),
+                                     *table[1:])
+                    for name, table in TABLES.items()}
+
+    return {'signature': signature(folder),
+            'descriptions': descriptions,
+            'codes': {name: frozenset(table)
+                      for name, table in descriptions.items()},
+            'tries': {name: trie(descriptions[name]) for name in PREFIXES}}
+
+
+def load(folder=FOLDER, cache=CACHE):
+    """
+    Load the compiled lookups from the cache, or build them and write the
+    cache if a csv file changed since it was written
+    :param folder: folder of the lookup tables
+    :param cache: pickle file, None to always build the lookups
+    :return: compiled lookups, see build()
+    """
+
+    key = signature(folder)
+
+    if cache is not None:
+        try:
+            with open(cache, 'rb') as f:
+                tables = pickle.load(f)
+            if tables['signature'] == key:
+                return tables
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            pass  # No cache yet, or unreadable: rebuild it
+
+    tables = build(folder)
+
+    if cache is not None:
+        temp = '{}.{}'.format(cache, os.getpid())
+        try:
+            with open(temp, 'wb') as f:
+                pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, cache)  # Atomic for concurrent workers
+        except OSError:
+            pass  # Read-only folder: keep the lookups in memory only
+
+    return tables
+
+
+def get():
+    """
+    Compiled lookups of the process, loaded once
+    :return: see build()
+    """
+
+    global compiled
+    if compiled is None:
+        compiled = load()
+    return compiled
+
+
+def codes(name):
+    """
+    Codes of a lookup
+    :param name: lookup name, e.g. 'ISO_COUNTRY'
+    :return: frozenset of codes
+    """
+
+    return get()['codes'][name]
+
+
+def prefix(name, s):
+    """
+    Find the code which starts a string, e.g. the CPV division of a CPV code
+    :param name: lookup name in PREFIXES
+    :param s: string, e.g. '45233120'
+    :return: shortest code starting s, e.g. '45', None if there is none
+    """
+
+    node = get()['tries'][name]
+    for char in s:
+        node = node.get(char)
+        if node is None:
+            return None
+        if END in node:
+            return node[END]
+    return None
+
+
+def description(name, code):
+    """
+    Describe a code
+    :param name: lookup name, e.g. 'CPV'
+    :param code: code, or a string starting with a code for PREFIXES (e.g.
+                 a NUTS code for ISO_COUNTRY)
+    :return: description, e.g. 'Construction work', None for unknown codes
+    """
+
+    descriptions = get()['descriptions'][name]
+    if code not in descriptions and name in PREFIXES:
+        code = prefix(name, code)
+    return descriptions.get(code)
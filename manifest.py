@@ -0,0 +1,133 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+import extractor
+import validator
+
+TABLE = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    status TEXT NOT NULL,
+    errors INTEGER NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+# Size of the blocks read to hash a file
+BLOCK_SIZE = 1024 * 1024
+
+
+def version(validate=True, prefilter=None):
+    """
+    Version of the output of a run: files processed by another version are
+    processed again
+    :param validate: records are validated and pruned
+    :param prefilter: TD_DOCUMENT_TYPE codes extracted, None for all the
+                      notices (see prefilter.py)
+    :return: string, e.g. '1.0+1.0'
+    """
+
+    result = extractor.VERSION
+    if validate:
+        result += '+' + validator.VERSION
+    if prefilter is not None:
+        result += '+TD' + ','.join(sorted(prefilter))
+    return result
+
+
+def file_hash(path):
+    """
+    Hash the content of a file
+    :param path: xml file or package
+    :return: hexadecimal SHA-256 digest
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """
+    SQLite manifest of the files processed by previous runs: path, size,
+    modification time, content hash, version of the extraction and result.
+    Used to only process new or changed files, and the files which failed
+    """
+
+    def __init__(self, path, version):
+        """
+        :param path: SQLite file, created if it does not exist
+        :param version: version of the current run, see version()
+        """
+
+        self.db = sqlite3.connect(path)
+        self.db.execute(TABLE)
+        self.version = version
+        self.pending = {}  # Path: (size, mtime_ns, hash) of stale files
+
+    def stale(self, files):
+        """
+        Select the files to process. A file is skipped when it was processed
+        by the same version without failures, and its size and modification
+        time, or else its content hash, did not change. Files with failed
+        notices are processed again
+        :param files: xml files and packages
+        :return: list of files to process, in the same order
+        """
+
+        selected = []
+        for path in files:
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            row = self.db.execute(
+                'SELECT size, mtime_ns, hash, version, status FROM files '
+                'WHERE path = ?', (key,)).fetchone()
+
+            if row is not None and row[3] == self.version and \
+                    row[4] == 'ok':
+                if row[:2] == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                digest = file_hash(path)
+                if digest == row[2]:  # Touched or copied, same content
+                    self.db.execute(
+                        'UPDATE files SET size = ?, mtime_ns = ? '
+                        'WHERE path = ?',
+                        (stat.st_size, stat.st_mtime_ns, key))
+                    continue
+            else:
+                digest = file_hash(path)
+
+            self.pending[key] = (stat.st_size, stat.st_mtime_ns, digest)
+            selected.append(path)
+
+        self.db.commit()
+        return selected
+
+    def done(self, path, errors=0):
+        """
+        Record a processed file. Call commit() to save it
+        :param path: file returned by stale()
+        :param errors: number of notices of the file which failed
+        """
+
+        key = os.path.abspath(path)
+        size, mtime_ns, digest = self.pending.pop(key)
+        self.db.execute(
+            'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, size, mtime_ns, digest, self.version,
+             'failed' if errors else 'ok', errors, time.time()))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
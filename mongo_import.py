@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+
+
+def batches(records, size):
+    """
+    Split records into batches
+    :param records: iterable of records
+    :param size: number of records in a batch
+    :return: generator of lists of up to size records
+    """
+
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upserts(batch):
+    """
+    Build the write requests of a batch: each record replaces the document
+    with the same DOC_ID, or is inserted
+    :param batch: list of records
+    :return: list of pymongo ReplaceOne
+    """
+
+    from pymongo import ReplaceOne
+
+    return [ReplaceOne({'DOC_ID': record['DOC_ID']}, record, upsert=True)
+            for record in batch]
+
+
+def read_checkpoint(path):
+    """
+    Read the progress of a previous load
+    :param path: checkpoint file, None for no checkpoint
+    :return: dictionary of the files already read: absolute path: offset
+             (bytes) of the first record not written yet
+    """
+
+    if path is None or not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return json.load(f)['offsets']
+
+
+def write_checkpoint(path, offsets):
+    """
+    Save the progress of a load, once a batch is written
+    :param path: checkpoint file
+    :param offsets: dictionary of absolute path: offset, see read_checkpoint()
+    """
+
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'offsets': offsets}, f)
+    os.replace(temp, path)  # Never leaves a half-written checkpoint
+
+
+def load(records, collection, batch_size=1000, ordered=False, commit=None):
+    """
+    Main function to upload records in a MongoDB collection.
+    Records are written in batches with bulk_write, upserting on DOC_ID, so
+    writing a record twice leaves a single document
+    :param records: iterable of validated and pruned records (e.g.
+                    batch.iter_extract, or read_jsonl())
+    :param collection: pymongo collection, or any object with the same
+                       bulk_write method (e.g. mongomock)
+    :param batch_size: number of records in a bulk write
+    :param ordered: stop a batch at the first failed write. Unordered
+                    writes are faster, and still raise at the end of the
+                    batch if a write failed
+    :param commit: function called after each written batch, e.g. to save
+                   the progress (see load_files())
+    :return: dictionary:
+        - records: records written
+        - inserted: new documents
+        - replaced: existing documents replaced
+        - seconds: duration of the load
+        - docs_per_sec: records written per second
+    """
+
+    stats = {'records': 0, 'inserted': 0, 'replaced': 0}
+    start = time.perf_counter()
+
+    for batch in batches(records, batch_size):
+        result = collection.bulk_write(upserts(batch), ordered=ordered)
+        stats['records'] += len(batch)
+        stats['inserted'] += result.upserted_count
+        stats['replaced'] += result.matched_count
+
+        if commit is not None:
+            commit()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['docs_per_sec'] = (stats['records'] / stats['seconds']
+                             if stats['seconds'] else 0.0)
+    return stats
+
+
+def load_files(paths, collection, batch_size=1000, ordered=False,
+               checkpoint=None):
+    """
+    Upload JSON lines files in a MongoDB collection, see load(). With a
+    checkpoint, the offset of each file is saved after each batch, and a
+    new load with the same checkpoint resumes each file after its last
+    written record, even if files were added, removed or reordered
+    :param paths: files, '-' for the standard input (never resumed)
+    :param collection: pymongo collection, see load()
+    :param batch_size: number of records in a bulk write
+    :param ordered: stop a batch at the first failed write
+    :param checkpoint: file to save the progress, None to always read the
+                       files from their start
+    :return: dictionary of load(), with resumed: number of files resumed
+             after a previous load
+    """
+
+    offsets = read_checkpoint(checkpoint)
+    resumed = sum(os.path.abspath(path) in offsets for path in paths)
+
+    commit = None
+    if checkpoint is not None:
+        def commit():
+            write_checkpoint(checkpoint, offsets)
+
+    stats = load(read_jsonl(paths, offsets), collection, batch_size,
+                 ordered, commit)
+    stats['resumed'] = resumed
+    return stats
+
+
+def connect(uri, db, name):
+    """
+    Open the collection of the notices, with a unique index on DOC_ID for
+    the upserts
+    :param uri: MongoDB connection string
+    :param db: database name
+    :param name: collection name
+    :return: pymongo collection
+    """
+
+    from pymongo import MongoClient, ASCENDING
+
+    collection = MongoClient(uri)[db][name]
+    collection.create_index([('DOC_ID', ASCENDING)], unique=True)
+    return collection
+
+
+def read_jsonl(paths, offsets=None):
+    """
+    Read records from JSON lines files, as written by batch.py
+    :param paths: files, '-' for the standard input
+    :param offsets: dictionary of absolute path: offset to start each file
+                    from, updated as the records are read, see
+                    read_checkpoint(). None to read the files from their
+                    start
+    :return: generator of records
+    """
+
+    for path in paths:
+        if path == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield json.loads(line)
+            continue
+
+        key = os.path.abspath(path)
+        with open(path, 'rb') as f:  # Binary, to tell the offsets
+            if offsets is not None:
+                f.seek(offsets.get(key, 0))
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if offsets is not None:
+                    offsets[key] = f.tell()
+                yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Upload extracted notices in a MongoDB collection')
+    parser.add_argument('paths', nargs='+',
+                        help='JSON lines files from batch.py, - for stdin')
+    parser.add_argument('--uri', default='mongodb://localhost:27017',
+                        help='MongoDB connection string')
+    parser.add_argument('--db', default='ted', help='database name')
+    parser.add_argument('--collection', default='notices',
+                        help='collection name')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='records per bulk write')
+    parser.add_argument('--ordered', action='store_true',
+                        help='stop a batch at the first failed write')
+    parser.add_argument('-c', '--checkpoint',
+                        help='file to save the progress and resume from')
+    args = parser.parse_args(argv)
+
+    collection = connect(args.uri, args.db, args.collection)
+    stats = load_files(args.paths, collection, args.batch_size,
+                       args.ordered, args.checkpoint)
+
+    print('{records} notices written ({inserted} new, {replaced} replaced, '
+          '{resumed} files resumed) in {seconds:.1f} s: '
+          '{docs_per_sec:.0f} docs/sec'.format(**stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
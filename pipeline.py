@@ -0,0 +1,336 @@
+import sys
+import json
+import argparse
+import resource
+from collections import Counter
+
+from batch import iter_extract, month_folders
+from manifest import Manifest, version
+from export import COLUMNS, write_chunk
+from currency import Rates, check_rates
+from interning import Strings
+from mongo_import import connect, upserts
+from store import Store
+from prefilter import DOCUMENT_TYPES
+from deadletter import DeadLetters
+
+
+class JsonLines(object):
+    """
+    Sink writing one JSON document per line, as soon as it is received
+    """
+
+    def __init__(self, path):
+        """
+        :param path: output file, '-' for the standard output
+        """
+
+        self.f = sys.stdout if path == '-' else open(path, 'w',
+                                                     encoding='utf-8')
+
+    def write(self, document):
+        self.f.write(json.dumps(document, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class Parquet(object):
+    """
+    Sink normalising records into Parquet tables, by chunks
+    (see export.py)
+    """
+
+    def __init__(self, folder, chunk_size=100000, rates=None, strings=None):
+        """
+        :param folder: output folder, one sub-folder per table
+        :param chunk_size: number of records kept before they are written
+        :param rates: currency.Rates of the _EUR columns, defaults to the
+                      shipped rates
+        :param strings: interning.Strings to store the names as IDs, None to
+                        keep the text
+        """
+
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.rates = rates if rates is not None else Rates()
+        self.strings = strings
+        self.chunk = []
+        self.counts = {name: 0 for name in COLUMNS}
+
+    def write(self, record):
+        self.chunk.append(record)
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            for name, count in write_chunk(self.chunk, self.folder,
+                                           self.rates,
+                                           self.strings).items():
+                self.counts[name] += count
+            self.chunk = []
+
+    def close(self):
+        self.flush()
+        if self.strings is not None:  # Even with no records
+            self.strings.save()
+
+
+class Mongo(object):
+    """
+    Sink upserting records in a MongoDB collection, by batches
+    (see mongo_import.py)
+    """
+
+    def __init__(self, collection, batch_size=1000, ordered=False):
+        """
+        :param collection: pymongo collection
+        :param batch_size: number of records in a bulk write
+        :param ordered: stop a batch at the first failed write
+        """
+
+        self.collection = collection
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.batch = []
+
+    def write(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.collection.bulk_write(upserts(self.batch),
+                                       ordered=self.ordered)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+
+
+def feed(results, sinks, errors=None, counts=None):
+    """
+    Write extraction results to the sinks, without closing them
+    :param results: iterable of (path, record, error), see batch.iter_extract
+    :param sinks: list of sinks, objects with write(record) and close()
+    :param errors: sink of the failures, None to ignore them
+    :param counts: dictionary of the counts to update as the results are
+                   written, a new one if None
+    :return: dictionary with the number of records and failures
+    """
+
+    if counts is None:
+        counts = {'records': 0, 'failed': 0}
+    for path, record, error in results:
+        if error is None:
+            counts['records'] += 1
+            for sink in sinks:
+                sink.write(record)
+        else:
+            counts['failed'] += 1
+            if errors is not None:
+                errors.write(error)
+    return counts
+
+
+def run(paths, sinks, errors=None, workers=None, chunksize=64, window=None,
+        validate=True, manifest=None, languages=None, fused=False,
+        timeout=None, memory=None, dead_letters=None, intern=False,
+        prefilter=None, sync=10000):
+    """
+    Main function to run the pipeline: source -> extract -> validate ->
+    prune -> sinks. Records flow one by one to the sinks, which write them
+    incrementally, and at most window units of work are processed ahead of
+    the sinks: memory stays flat whatever the number of notices
+    :param paths: files and/or folders of xml notices or TED packages
+    :param sinks: list of sinks, objects with write(record), flush() and
+                  close()
+    :param errors: sink of the failures (see batch.failure), None to ignore
+                   them
+    :param workers: number of processes. Defaults to the number of cores
+    :param chunksize: number of files sent to a worker at once
+    :param window: units of work processed ahead of the sinks, see
+                   batch.iter_extract
+    :param validate: run the validation schema and prune the records
+    :param manifest: Manifest of an incremental run. The sinks are flushed
+                     before it is saved, so that a file is only recorded
+                     once its records are written
+    :param languages: preferred translations, see extractor.extract()
+    :param fused: extract, validate and prune in a single traversal
+    :param timeout: time limit of a notice in seconds, see batch.process
+    :param memory: memory limit of each notice in a worker in MB, see
+                   batch.iter_extract
+    :param dead_letters: deadletter.DeadLetters storing the failed notices,
+                         None to only send them to errors
+    :param intern: share one copy of the repeated names across the records
+                   of a unit of work, see batch.iter_extract
+    :param prefilter: TD_DOCUMENT_TYPE codes to extract, the other notices
+                      are skipped from their head (see prefilter.py)
+    :param sync: with a manifest, number of records between two flushes of
+                 the sinks. Lower values lose less work on a crash, higher
+                 values keep the Parquet files and Mongo batches large
+    :return: dictionary with the number of records, failures and skipped
+             notices, the reasons of the skips, and the peak memory of the
+             process (kilobytes)
+    """
+
+    outputs = sinks + ([errors] if errors is not None else [])
+    counts = {'records': 0, 'failed': 0}
+    synced = [0]
+
+    def flush():
+        # Called by iter_extract once a unit of work is written to the sinks
+        if counts['records'] + counts['failed'] - synced[0] < sync:
+            return False
+        for sink in outputs:
+            sink.flush()
+        synced[0] = counts['records'] + counts['failed']
+        return True
+
+    skipped = Counter()
+    try:
+        feed(iter_extract(paths, workers, chunksize, validate, manifest,
+                          languages=languages, window=window,
+                          fused=fused, timeout=timeout, memory=memory,
+                          dead_letters=dead_letters, intern=intern,
+                          prefilter=prefilter, skipped=skipped, flush=flush),
+             sinks, errors, counts)
+    finally:
+        for sink in outputs:
+            sink.close()
+
+    counts['prefilter'] = dict(skipped)
+    counts['skipped'] = sum(number for reason, number in skipped.items()
+                            if reason.startswith('TD_DOCUMENT_TYPE'))
+    counts['rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract TED Contract award notices to several sinks '
+                    'with bounded memory')
+    parser.add_argument('paths', nargs='*',
+                        help='xml files, tar.gz packages or folders')
+    parser.add_argument('--root', help='folder with YYYY-MM sub-folders')
+    parser.add_argument('--years', nargs='+', default=[],
+                        help='years to process under --root')
+    parser.add_argument('--months', nargs='+',
+                        help='months to process under --root')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=64,
+                        help='files sent to a worker at once')
+    parser.add_argument('--window', type=int, default=None,
+                        help='units of work processed ahead of the sinks '
+                             '(default: twice the number of workers)')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='only extract, skip validation and pruning')
+    parser.add_argument('--fused', action='store_true',
+                        help='extract, validate and prune each notice in a '
+                             'single traversal')
+    parser.add_argument('--languages', nargs='+',
+                        help='preferred translations, in order of preference '
+                             '(default: EN FR DE)')
+    parser.add_argument('-m', '--manifest',
+                        help='SQLite manifest: only process the files which '
+                             'are new or changed since the previous runs')
+    parser.add_argument('--jsonl', help='JSON lines output file, - for stdout')
+    parser.add_argument('--parquet', help='Parquet output folder')
+    parser.add_argument('--rates', nargs='+',
+                        help='csv files of monthly rates to the euro for the '
+                             'Parquet tables, see currency.py')
+    parser.add_argument('--no-rates', action='store_true',
+                        help='only convert the currencies with a shipped '
+                             'rate, the other _EUR amounts are NaN')
+    parser.add_argument('--strings',
+                        help='string dictionary file: store the names as IDs '
+                             'in the Parquet tables, see interning.py')
+    parser.add_argument('--intern', action='store_true',
+                        help='send one copy of the repeated names per unit '
+                             'of work')
+    parser.add_argument('--store',
+                        help='SQLite query store (see store.py)')
+    parser.add_argument('--mongo', help='MongoDB connection string')
+    parser.add_argument('--db', default='ted', help='MongoDB database name')
+    parser.add_argument('--collection', default='notices',
+                        help='MongoDB collection name')
+    parser.add_argument('-e', '--errors',
+                        help='JSON lines file for the failures')
+    parser.add_argument('--timeout', type=float,
+                        help='time limit of a notice, in seconds')
+    parser.add_argument('--memory-limit', type=int,
+                        help='memory limit of a worker process while '
+                             'it processes a notice, in MB')
+    parser.add_argument('-d', '--dead-letters',
+                        help='folder storing the failed notices for replay '
+                             '(see deadletter.py)')
+    parser.add_argument('--prefilter', nargs='*', metavar='CODE',
+                        help='only extract these TD_DOCUMENT_TYPE codes '
+                             '(default: 7, Contract award), skipping the '
+                             'other notices from their head')
+    args = parser.parse_args(argv)
+
+    if args.prefilter == []:
+        args.prefilter = DOCUMENT_TYPES
+    if args.store and args.no_validate:
+        # The store indexes the codes and names of the pruned records
+        parser.error('--store needs validated records: drop --no-validate')
+    if args.parquet:
+        check_rates(parser, args)
+
+    paths = list(args.paths)
+    if args.root:
+        paths += month_folders(args.root, args.years, args.months)
+
+    sinks = []
+    rates = Rates(args.rates)
+    if args.jsonl:
+        sinks.append(JsonLines(args.jsonl))
+    if args.parquet:
+        strings = Strings(args.strings) if args.strings else None
+        sinks.append(Parquet(args.parquet, rates=rates,
+                             strings=strings))
+    if args.store:
+        sinks.append(Store(args.store))
+    if args.mongo:
+        sinks.append(Mongo(connect(args.mongo, args.db, args.collection)))
+    if not sinks:
+        parser.error('no sink: use --jsonl, --parquet, --store and/or '
+                     '--mongo')
+
+    errors = JsonLines(args.errors) if args.errors else None
+
+    manifest = None
+    if args.manifest:
+        manifest = Manifest(args.manifest, version(not args.no_validate,
+                                                   args.prefilter))
+
+    dead_letters = None
+    if args.dead_letters:
+        dead_letters = DeadLetters(args.dead_letters)
+
+    try:
+        counts = run(paths, sinks, errors, args.workers, args.chunksize,
+                     args.window, not args.no_validate, manifest,
+                     args.languages, args.fused, args.timeout,
+                     args.memory_limit, dead_letters, args.intern,
+                     args.prefilter)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    print('{records} notices extracted, {failed} failed, {skipped} skipped, '
+          '{rss_kb} kB peak'.format(**counts), file=sys.stderr)
+    if rates.warning():
+        print(rates.warning(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
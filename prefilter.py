@@ -0,0 +1,122 @@
+from lxml import etree
+
+# TD_DOCUMENT_TYPE codes of the notices to extract: Contract award notices
+DOCUMENT_TYPES = ['7']
+
+# Size of the blocks of the head fed to the incremental parser. The
+# TD_DOCUMENT_TYPE is usually within the first block: a skipped notice is
+# read no further
+BLOCK_SIZE = 4 * 1024
+
+
+class Skipped(Exception):
+    """
+    A notice was skipped from its head, without a full parse
+    """
+
+
+def local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def pull_parser():
+    """
+    :return: etree.XMLPullParser reporting the start of the elements read
+             by read_head() only: the other elements are parsed in C
+             without a Python event
+    """
+
+    return etree.XMLPullParser(events=('start',), tag=[
+        '{*}TD_DOCUMENT_TYPE', '{*}FORM_SECTION'])
+
+
+def read_head(parser, f, block_size=BLOCK_SIZE, document_types=None):
+    """
+    Parse the head of a notice: up to the first child of the FORM_SECTION.
+    The tree is built as usual, so the parse can go on from there
+    :param parser: parser of pull_parser()
+    :param f: notice, opened in binary mode
+    :param block_size: size of the blocks fed to the parser
+    :param document_types: TD_DOCUMENT_TYPE codes to keep, None for all.
+                           The other notices are read no further than the
+                           block of their TD_DOCUMENT_TYPE: the
+                           TRANSLATION_SECTION before the FORM_SECTION can
+                           be large
+    :return: tuple (root, document_type, form):
+        - root: root element, holding the tree parsed so far. None if the
+                file is empty
+        - document_type: CODE of the TD_DOCUMENT_TYPE, e.g. '7'. None if
+                         there is none
+        - form: name of the first child of the FORM_SECTION, e.g.
+                'CONTRACT_AWARD' or 'OTH_NOT'. None if there is no form
+    :raises: Skipped, with the reason e.g. 'TD_DOCUMENT_TYPE 3'
+    """
+
+    root = None
+    document_type = None
+    section = None
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return root, document_type, None
+        parser.feed(block)
+        for _, element in parser.read_events():
+            if root is None:
+                root = element.getroottree().getroot()
+            if local(element.tag) == 'FORM_SECTION':
+                section = element
+            elif document_type is None:
+                document_type = element.get('CODE')
+                if document_types is not None and \
+                        document_type is not None and \
+                        document_type not in document_types:
+                    raise Skipped('TD_DOCUMENT_TYPE {}'.format(
+                        document_type))
+        if section is not None and len(section):  # First child started
+            return root, document_type, local(section[0].tag)
+
+
+def read_rest(parser, f):
+    """
+    Finish the parse of a notice started by read_head(), feeding the rest
+    of the file at once
+    :return: root element of the complete tree
+    """
+
+    parser.feed(f.read())
+    return parser.close()
+
+
+def parse(source, document_types=None, block_size=BLOCK_SIZE):
+    """
+    Main function to parse a notice, reading only its head when the notice
+    can be skipped or does not need its form:
+        - notices whose TD_DOCUMENT_TYPE is not one of document_types are
+          skipped, without reading the rest of the file. Notices with no
+          TD_DOCUMENT_TYPE are kept: the validation reports them
+        - OTH_NOT forms have no structure: the record only needs the head,
+          and the rest is not parsed (extract_tree() gives the same output)
+        - the other notices are parsed to the end, continuing the parse of
+          the head
+    :param source: xml file, or file-like object opened in binary mode
+    :param document_types: TD_DOCUMENT_TYPE codes to keep, defaults to
+                           DOCUMENT_TYPES
+    :param block_size: size of the blocks of the head fed to the parser
+    :return: tuple (root, route): root element, route 'head' or 'full'
+    :raises: Skipped, with the reason e.g. 'TD_DOCUMENT_TYPE 3'
+    """
+
+    if document_types is None:
+        document_types = DOCUMENT_TYPES
+
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        parser = pull_parser()
+        root, document_type, form = read_head(parser, f, block_size,
+                                              document_types)
+        if form == 'OTH_NOT':
+            return root, 'head'
+        return read_rest(parser, f), 'full'
+    finally:
+        if f is not source:
+            f.close()
@@ -0,0 +1,250 @@
+import time
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+
+import extractor
+import fused
+import validator
+
+# Functions of the extractor which are timed. They call each other through
+# the module, so wrapping them in the module times the nested calls too
+# The traversal is shared by records.py and fused.py, which only build the
+# sections: its timings include theirs
+FUNCTIONS = ['get_coded', 'get_notice', 'get_codif', 'get_total',
+             'get_contract', 'preferred_contract', 'get_object',
+             'get_award', 'get_contract_value', 'get_cost']
+
+# Builders of the sections of the fused extraction which are timed
+FUSED = ['valid']
+
+# XPath queries which are timed, by the module they are called through
+QUERIES = [(extractor, 'xpath.')]
+
+# Stages of batch.process_chunk: extract and prune run per notice, validate
+# per unit of work. fused replaces the three of them (see fused.py). With
+# the pre-filter, the notice is parsed by prefilter and extract_tree extracts
+# the parsed tree instead of extract
+STAGES = {'extract': 'extract', 'validate': 'validate_batch',
+          'prune': 'prune', 'fused': 'extract_valid',
+          'prefilter': 'parse_notice', 'extract_tree': 'extract_tree'}
+
+# Stages which return a record, whose DOC_ID is kept in the slowest documents
+DOCUMENT_STAGES = ['extract', 'fused', 'extract_tree']
+
+# Number of slowest documents kept
+SLOWEST = 10
+
+
+class Module(object):
+    """
+    Stand-in of a module, with some of its functions replaced
+    """
+
+    def __init__(self, module, **functions):
+        self.module = module
+        self.__dict__.update(functions)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+class Profile(object):
+    """
+    Timing counters and call counts, per function and per stage, and the
+    slowest documents
+    """
+
+    def __init__(self, slowest=SLOWEST):
+        """
+        :param slowest: number of slowest documents to keep
+        """
+
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)  # Including nested timed calls
+        self.own = defaultdict(float)  # Excluding nested timed calls
+        self.slowest = slowest
+        self.documents = []  # Heap of (seconds, DOC_ID)
+        self.stack = []  # Time of the nested calls of the running calls
+
+    def wrap(self, name, function, document=False):
+        """
+        Time the calls of a function
+        :param name: name of the counter, e.g. 'extractor.get_award'
+        :param function: function to time
+        :param document: the function returns a record, whose DOC_ID is
+                         tracked in the slowest documents
+        :return: function with the same signature
+        """
+
+        def timed(*args, **kwargs):
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.stack.pop()
+                self.calls[name] += 1
+                self.seconds[name] += elapsed
+                self.own[name] += elapsed - nested
+                if self.stack:
+                    self.stack[-1] += elapsed
+
+            if document:
+                self.document(result.get('DOC_ID'), elapsed)
+            return result
+
+        return timed
+
+    def document(self, doc_id, seconds):
+        """
+        Track the time spent on a document
+        :param doc_id: DOC_ID of the notice
+        :param seconds: time spent
+        """
+
+        if len(self.documents) < self.slowest:
+            heapq.heappush(self.documents, (seconds, doc_id))
+        elif seconds > self.documents[0][0]:
+            heapq.heapreplace(self.documents, (seconds, doc_id))
+
+    def snapshot(self):
+        """
+        :return: counters as a dictionary, to send them between processes
+        """
+
+        return {'calls': dict(self.calls),
+                'seconds': dict(self.seconds),
+                'own': dict(self.own),
+                'documents': list(self.documents)}
+
+    def merge(self, snapshot):
+        """
+        Add the counters of another profile, e.g. of a worker process
+        :param snapshot: see snapshot()
+        """
+
+        for name, calls in snapshot['calls'].items():
+            self.calls[name] += calls
+            self.seconds[name] += snapshot['seconds'][name]
+            self.own[name] += snapshot['own'][name]
+        for seconds, doc_id in snapshot['documents']:
+            self.document(doc_id, seconds)
+
+    def summary(self):
+        """
+        :return: text table of the counters, by decreasing own time, and of
+                 the slowest documents
+        """
+
+        lines = ['{:<40} {:>10} {:>10} {:>10} {:>10}'.format(
+            'name', 'calls', 'total s', 'own s', 'own us')]
+        for name in sorted(self.calls, key=self.own.get, reverse=True):
+            lines.append('{:<40} {:>10} {:>10.3f} {:>10.3f} {:>10.1f}'.format(
+                name, self.calls[name], self.seconds[name], self.own[name],
+                self.own[name] / self.calls[name] * 1e6))
+
+        lines.append('')
+        lines.append('slowest documents (extraction):')
+        for seconds, doc_id in sorted(self.documents, reverse=True):
+            lines.append('{:<40} {:>10.1f} ms'.format(str(doc_id),
+                                                       seconds * 1e3))
+        return '\n'.join(lines)
+
+    def prometheus(self, prefix='ted_extraction'):
+        """
+        Export the counters in the Prometheus text format
+        :param prefix: prefix of the metric names
+        :return: text
+        """
+
+        metrics = [
+            ('calls_total', 'counter', 'Number of calls', self.calls),
+            ('seconds_total', 'counter',
+             'Time spent, including nested timed calls', self.seconds),
+            ('own_seconds_total', 'counter',
+             'Time spent, excluding nested timed calls', self.own)
+        ]
+
+        lines = []
+        for metric, kind, description, values in metrics:
+            name = prefix + '_' + metric
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for key in sorted(values):
+                lines.append('{}{{name="{}"}} {!r}'.format(name, key,
+                                                          values[key]))
+
+        name = prefix + '_slowest_document_seconds'
+        lines.append('# HELP {} Extraction time of the slowest documents'
+                     .format(name))
+        lines.append('# TYPE {} gauge'.format(name))
+        for seconds, doc_id in sorted(self.documents, reverse=True):
+            lines.append('{}{{doc_id="{}"}} {!r}'.format(name, doc_id,
+                                                        seconds))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, prefix='ted_extraction'):
+        with open(path, 'w') as f:
+            f.write(self.prometheus(prefix))
+
+
+def targets(batch=None):
+    """
+    Functions replaced by their timed version while profiling
+    :param batch: batch module, to time its stages
+    :return: list of (module, attribute, counter name, tracks DOC_ID)
+    """
+
+    functions = [(extractor, name, 'extractor.' + name, False)
+                 for name in FUNCTIONS]
+    functions.extend((fused, name, 'fused.' + name, False) for name in FUSED)
+    functions.append((validator, 'schema', 'validator.schema', False))
+    if batch is not None:
+        # batch imports schema from the validator: its own name is replaced
+        functions.append((batch, 'schema', 'validator.schema', False))
+        functions.extend((batch, attribute, 'stage.' + stage,
+                          stage in DOCUMENT_STAGES)
+                         for stage, attribute in STAGES.items())
+    return functions
+
+
+@contextmanager
+def enabled(profile=None, batch=None):
+    """
+    Time the extractor, the fused extraction, the XPath queries and the
+    stages of the batch processing. Functions are only replaced while
+    enabled: there is no overhead otherwise
+    :param profile: Profile to update, a new one if None
+    :param batch: batch module, to time its stages. It is passed by the
+                  caller, as it runs as __main__ from the command line
+    :return: context manager giving the Profile
+    """
+
+    if profile is None:
+        profile = Profile()
+
+    replaced = []
+    for module, attribute, name, document in targets(batch):
+        replaced.append((module, attribute, getattr(module, attribute)))
+        setattr(module, attribute, profile.wrap(
+            name, getattr(module, attribute), document))
+
+    # Parsing, by the extractor and before the fused extraction
+    for module in [extractor] if batch is None else [extractor, batch]:
+        replaced.append((module, 'etree', module.etree))
+        module.etree = Module(module.etree, parse=profile.wrap(
+            'etree.parse', module.etree.parse))
+
+    # XPath queries, e.g. the language selection of get_contract
+    for module, prefix in QUERIES:
+        replaced.append((module, 'XPATH', module.XPATH))
+        module.XPATH = {key: profile.wrap(prefix + key, query)
+                        for key, query in module.XPATH.items()}
+
+    try:
+        yield profile
+    finally:
+        for module, attribute, original in reversed(replaced):
+            setattr(module, attribute, original)
@@ -0,0 +1,230 @@
+from lxml import etree
+
+import extractor
+
+
+def scalar(lst):
+    """
+    Unwrap the result of a query which usually has one value
+    :param lst: list of strings
+    :return: None if empty, the string if only one, else a tuple
+    """
+
+    if not lst:
+        return None
+    if len(lst) == 1:
+        return lst[0]
+    return tuple(lst)
+
+
+def listed(value):
+    """
+    Inverse of scalar(): list-wrapped value of the dictionary records
+    """
+
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def flag(value):
+    return ['YES'] if value else ['NO']
+
+
+def nested(value):
+    return value.to_dict()
+
+
+def nested_list(values):
+    return [value.to_dict() for value in values]
+
+
+def identity(value):
+    return value
+
+
+# Conversion of each kind of field to the dictionary records:
+#   - 'str': string kept as is, e.g. CURRENCY
+#   - 'scalar': string, None or tuple, see scalar()
+#   - 'list': tuple of strings, 0 or more values
+#   - 'flag': boolean, YES/NO
+#   - 'record': nested record, 'records': tuple of nested records
+CONVERSIONS = {'str': identity, 'scalar': listed, 'list': list, 'flag': flag,
+               'record': nested, 'records': nested_list}
+
+# Conversion of each kind of field from the traversal, see typed()
+QUERIED = {'str': identity, 'scalar': scalar, 'list': tuple,
+           'flag': identity, 'record': identity, 'records': tuple}
+
+
+class Slotted(object):
+    """
+    Record with one slot per key of the dictionary record. A slot which is
+    not set is a key which is not in the dictionary
+    """
+
+    __slots__ = ()
+    FIELDS = ()  # (key, kind), in the order of the dictionary record
+    KINDS = {}  # key: kind
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def to_dict(self):
+        """
+        :return: dictionary record, as returned by extractor.extract()
+        """
+
+        obj = dict()
+        for key, kind in self.FIELDS:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                continue
+            obj[key] = CONVERSIONS[kind](value)
+        return obj
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(key, getattr(self, key))
+            for key, _ in self.FIELDS if hasattr(self, key)))
+
+
+def slotted(name, fields, doc):
+    """
+    Create a record type
+    :param name: class name
+    :param fields: list of (key, kind), see CONVERSIONS
+    :param doc: docstring
+    :return: subclass of Slotted
+    """
+
+    return type(name, (Slotted,), {'__slots__': [k for k, _ in fields],
+                                   'FIELDS': tuple(fields),
+                                   'KINDS': dict(fields), '__doc__': doc})
+
+
+Cost = slotted('Cost', [
+    ('CURRENCY', 'str'),
+    ('VAT_PRCT', 'scalar'),
+    ('VALUE', 'scalar'),
+    ('LOW_VALUE', 'scalar'),
+    ('HIGH_VALUE', 'scalar')
+], 'Value of a contract: TOTAL_VALUE, COST or ESTIMATE')
+
+ValuesList = slotted('ValuesList', [
+    ('GLOBAL_VALUE', 'record'),
+    ('CONTRACTS_VALUE', 'records')
+], 'VALUES_LIST sub-section of NOTICE_DATA')
+
+Notice = slotted('Notice', [
+    ('ORIGINAL_NUTS', 'list'),
+    ('ORIGINAL_CPV', 'list'),
+    ('NO_DOC_OJS', 'scalar'),
+    ('ISO_COUNTRY', 'scalar'),
+    ('IA_URL_GENERAL', 'scalar'),
+    ('REF_NOTICE', 'list'),
+    ('VALUES_LIST', 'record')
+], 'NOTICE_DATA section')
+
+Codif = slotted('Codif', [
+    ('TD_DOCUMENT_TYPE', 'scalar'),
+    ('AA_AUTHORITY_TYPE', 'scalar'),
+    ('NC_CONTRACT_NATURE', 'scalar'),
+    ('PR_PROC', 'scalar'),
+    ('RP_REGULATION', 'scalar'),
+    ('TY_TYPE_BID', 'scalar'),
+    ('AC_AWARD_CRIT', 'scalar'),
+    ('MA_MAIN_ACTIVITIES', 'list'),
+    ('DS_DATE_DISPATCH', 'scalar')
+], 'CODIF_DATA section')
+
+Coded = slotted('Coded', [
+    ('NOTICE_DATA', 'record'),
+    ('CODIF_DATA', 'record')
+], 'CODED_DATA section')
+
+ContractValue = slotted('ContractValue', [
+    ('COST', 'record'),
+    ('ESTIMATE', 'record'),
+    ('NUMBER_OF_YEARS', 'scalar'),
+    ('NUMBER_OF_MONTHS', 'scalar')
+], 'CONTRACT_VALUE of the contract object or of an award')
+
+ContractObject = slotted('ContractObject', [
+    ('NUTS', 'list'),
+    ('NUTS_EXTRA', 'list'),
+    ('CPV_MAIN', 'scalar'),
+    ('CONTRACT_COVERED_GPA', 'scalar'),
+    ('CONCLUSION_FRAMEWORK_AGREEMENT', 'flag'),
+    ('CONTRACTS_DPS', 'flag'),
+    ('CONTRACT_VALUE', 'record')
+], 'CONTRACT_OBJECT section')
+
+Contractor = slotted('Contractor', [
+    ('OFFICIALNAME', 'scalar'),
+    ('COUNTRY', 'scalar'),
+    ('ADDRESS', 'scalar'),
+    ('TOWN', 'scalar'),
+    ('POSTAL_CODE', 'scalar')
+], 'CONTRACTOR sub-section of an award')
+
+Award = slotted('Award', [
+    ('CONTRACTOR', 'record'),
+    ('CONTRACT_VALUE', 'record')
+], 'AWARD_OF_CONTRACT section')
+
+Contract = slotted('Contract', [
+    ('OTH_NOT', 'flag'),
+    ('CONTRACTING_AUTHORITY', 'scalar'),
+    ('CONTRACT_OBJECT', 'record'),
+    ('AWARDS_OF_CONTRACT', 'records')
+], 'CONTRACT section')
+
+Record = slotted('Record', [
+    ('DOC_ID', 'str'),
+    ('CODED_DATA', 'record'),
+    ('CONTRACT', 'record')
+], 'Contract award notice')
+
+
+# Record type of each section of the traversal, see extractor.section()
+SECTIONS = {'value': Cost, 'values_list': ValuesList, 'notice': Notice,
+            'codif': Codif, 'coded': Coded, 'contract_value': ContractValue,
+            'contract_object': ContractObject, 'contractor': Contractor,
+            'award': Award, 'contract': Contract, 'record': Record}
+
+
+def typed(name, fields):
+    """
+    Build a section of the typed record, see extractor.section()
+    :param name: name of the section
+    :param fields: list of (key, value)
+    :return: Slotted
+    """
+
+    cls = SECTIONS[name]
+    return cls(**{key: QUERIED[cls.KINDS[key]](value)
+                  for key, value in fields})
+
+
+def extract(path, languages=None):
+    """
+    Main function to extract a typed record from xml file. Same content as
+    extractor.extract(), without the one-element lists: record.to_dict()
+    returns the dictionary record
+    :param path:
+    :param languages: preferred translations of the FORM_SECTION, in order
+                      of preference. Defaults to extractor.LANGUAGES
+    :return: Record
+    """
+
+    return extractor.extract_tree(etree.parse(path).getroot(), languages,
+                                  typed)
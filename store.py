@@ -0,0 +1,301 @@
+import sys
+import json
+import sqlite3
+import argparse
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS notices (
+        id INTEGER PRIMARY KEY,
+        doc_id TEXT NOT NULL UNIQUE,
+        date TEXT,
+        country TEXT,
+        authority TEXT COLLATE NOCASE,
+        record TEXT NOT NULL
+    )
+    """,
+    'CREATE TABLE IF NOT EXISTS cpvs (doc_id TEXT NOT NULL, cpv TEXT)',
+    'CREATE TABLE IF NOT EXISTS nuts (doc_id TEXT NOT NULL, nuts TEXT)',
+    """
+    CREATE TABLE IF NOT EXISTS contractors (
+        doc_id TEXT NOT NULL,
+        name TEXT NOT NULL COLLATE NOCASE
+    )
+    """,
+]
+
+# Secondary indexes of the queries. Codes and dates are matched by prefix
+# with a range on the index, see prefix_range()
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS notices_date ON notices (date)',
+    'CREATE INDEX IF NOT EXISTS notices_country ON notices (country, date)',
+    'CREATE INDEX IF NOT EXISTS notices_authority ON notices (authority)',
+    'CREATE INDEX IF NOT EXISTS cpvs_cpv ON cpvs (cpv, doc_id)',
+    'CREATE INDEX IF NOT EXISTS cpvs_doc ON cpvs (doc_id)',
+    'CREATE INDEX IF NOT EXISTS nuts_nuts ON nuts (nuts, doc_id)',
+    'CREATE INDEX IF NOT EXISTS nuts_doc ON nuts (doc_id)',
+    'CREATE INDEX IF NOT EXISTS contractors_name ON contractors (name)',
+    'CREATE INDEX IF NOT EXISTS contractors_doc ON contractors (doc_id)',
+]
+
+# Full text index of the authority and contractor names of each notice, if
+# the SQLite library has FTS5. Its rowid is the id of the notice
+FTS = 'CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5 (name)'
+
+
+def prefix_range(prefix):
+    """
+    Range of the strings starting with a prefix, usable on an index
+    :param prefix: e.g. CPV division '45' or year '2015'
+    :return: tuple (low, high): low <= s < high for the strings s starting
+             with prefix
+    """
+
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def codes(record):
+    """
+    Indexed codes of a record
+    :param record: validated and pruned record
+    :return: tuple (cpvs, nuts, contractors): sets of CPV codes
+             (ORIGINAL_CPV and CPV_MAIN), NUTS codes (ORIGINAL_NUTS and NUTS)
+             and contractor OFFICIALNAMEs
+    """
+
+    notice = record.get('CODED_DATA', {}).get('NOTICE_DATA', {})
+    contract = record.get('CONTRACT', {})
+    contract_object = contract.get('CONTRACT_OBJECT', {})
+
+    cpvs = set(notice.get('ORIGINAL_CPV', []))
+    if 'CPV_MAIN' in contract_object:
+        cpvs.add(contract_object['CPV_MAIN'])
+
+    nuts = set(notice.get('ORIGINAL_NUTS', []))
+    nuts.update(contract_object.get('NUTS', []))
+
+    contractors = set()
+    for award in contract.get('AWARDS_OF_CONTRACT', []):
+        name = award.get('CONTRACTOR', {}).get('OFFICIALNAME')
+        if name:
+            contractors.add(name)
+
+    return cpvs, nuts, contractors
+
+
+class Store(object):
+    """
+    Local SQLite store of the pruned records, indexed for analytical
+    lookups by CPV, NUTS, country, date, authority and contractor. Also a
+    sink of pipeline.run(): records are written as they are received, and a
+    notice written again replaces the previous one. Records must be
+    validated: the raw records hold lists instead of values
+    """
+
+    def __init__(self, path, batch_size=1000):
+        """
+        :param path: SQLite file, created if it does not exist
+        :param batch_size: number of records written in a transaction
+        """
+
+        self.db = sqlite3.connect(path)
+        for statement in TABLES + INDEXES:
+            self.db.execute(statement)
+        try:
+            self.db.execute(FTS)
+            self.fts = True
+        except sqlite3.OperationalError:  # No FTS5: names matched with LIKE
+            self.fts = False
+        self.db.commit()
+        self.batch_size = batch_size
+        self.pending = 0
+
+    def write(self, record):
+        doc_id = record['DOC_ID']
+        cpvs, nuts, contractors = codes(record)
+        authority = record.get('CONTRACT', {}).get('CONTRACTING_AUTHORITY')
+
+        self.delete(doc_id)
+        rowid = self.db.execute(
+            'INSERT INTO notices (doc_id, date, country, authority, record) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (doc_id,
+             record['CODED_DATA']['CODIF_DATA'].get('DS_DATE_DISPATCH'),
+             record['CODED_DATA']['NOTICE_DATA'].get('ISO_COUNTRY'),
+             authority, json.dumps(record, ensure_ascii=False))).lastrowid
+        self.db.executemany('INSERT INTO cpvs VALUES (?, ?)',
+                            [(doc_id, cpv) for cpv in cpvs])
+        self.db.executemany('INSERT INTO nuts VALUES (?, ?)',
+                            [(doc_id, code) for code in nuts])
+        self.db.executemany('INSERT INTO contractors VALUES (?, ?)',
+                            [(doc_id, name) for name in contractors])
+        if self.fts:
+            names = sorted(contractors) + ([authority] if authority else [])
+            self.db.execute('INSERT INTO names (rowid, name) VALUES (?, ?)',
+                            (rowid, '\n'.join(names)))
+
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def delete(self, doc_id):
+        """
+        Remove a notice, if it is stored
+        :param doc_id: DOC_ID of the notice
+        """
+
+        row = self.db.execute('SELECT id FROM notices WHERE doc_id = ?',
+                              (doc_id,)).fetchone()
+        if row is None:
+            return
+        if self.fts:
+            self.db.execute('DELETE FROM names WHERE rowid = ?', row)
+        for table in ('notices', 'cpvs', 'nuts', 'contractors'):
+            self.db.execute('DELETE FROM {} WHERE doc_id = ?'.format(table),
+                            (doc_id,))
+
+    def where(self, cpv=None, nuts=None, country=None, date=None, since=None,
+              until=None, authority=None, contractor=None, text=None):
+        """
+        Build the conditions of a query, see query()
+        :return: tuple (sql, parameters)
+        """
+
+        conditions = []
+        parameters = []
+
+        if cpv:
+            conditions.append('doc_id IN (SELECT doc_id FROM cpvs '
+                              'WHERE cpv >= ? AND cpv < ?)')
+            parameters.extend(prefix_range(cpv))
+        if nuts:
+            conditions.append('doc_id IN (SELECT doc_id FROM nuts '
+                              'WHERE nuts >= ? AND nuts < ?)')
+            parameters.extend(prefix_range(nuts))
+        if country:
+            conditions.append('country = ?')
+            parameters.append(country)
+        if date:
+            conditions.append('date >= ? AND date < ?')
+            parameters.extend(prefix_range(date))
+        if since:
+            conditions.append('date >= ?')
+            parameters.append(since)
+        if until:
+            conditions.append('date < ?')
+            parameters.append(prefix_range(until)[1])
+        if authority:
+            conditions.append('authority = ?')
+            parameters.append(authority)
+        if contractor:
+            conditions.append('doc_id IN (SELECT doc_id FROM contractors '
+                              'WHERE name = ?)')
+            parameters.append(contractor)
+        if text and self.fts:
+            conditions.append('id IN (SELECT rowid FROM names '
+                              'WHERE names MATCH ?)')
+            parameters.append(text)
+        elif text:
+            conditions.append('(authority LIKE ? OR doc_id IN (SELECT doc_id '
+                              'FROM contractors WHERE name LIKE ?))')
+            parameters.extend(['%' + text + '%'] * 2)
+
+        sql = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return sql, parameters
+
+    def query(self, limit=None, **criteria):
+        """
+        Main function to look up records. Criteria are combined with AND
+        :param cpv: CPV code or prefix, e.g. '45' for the division 45.
+                    Matches ORIGINAL_CPV and CPV_MAIN
+        :param nuts: NUTS code or prefix, e.g. 'DE' or 'DE21'. Matches
+                     ORIGINAL_NUTS and NUTS
+        :param country: ISO_COUNTRY of the notice, e.g. 'DE'
+        :param date: prefix of DS_DATE_DISPATCH, e.g. '2015' or '201503'
+        :param since: first DS_DATE_DISPATCH (or prefix), included
+        :param until: last DS_DATE_DISPATCH (or prefix), included
+        :param authority: CONTRACTING_AUTHORITY, case insensitive
+        :param contractor: OFFICIALNAME of a contractor, case insensitive
+        :param text: words of the authority or contractor names, as an FTS5
+                     query if available, else a substring
+        :param limit: maximum number of records, None for all
+        :return: generator of records, by DS_DATE_DISPATCH
+        """
+
+        sql, parameters = self.where(**criteria)
+        sql = 'SELECT record FROM notices' + sql + ' ORDER BY date, doc_id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(limit)
+        for row in self.db.execute(sql, parameters):
+            yield json.loads(row[0])
+
+    def count(self, **criteria):
+        """
+        :param criteria: see query()
+        :return: number of matching records
+        """
+
+        sql, parameters = self.where(**criteria)
+        return self.db.execute('SELECT COUNT(*) FROM notices' + sql,
+                               parameters).fetchone()[0]
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def flush(self):
+        self.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build and query a local store of extracted records')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    build = commands.add_parser('build', help='load JSON lines records')
+    build.add_argument('store', help='SQLite file')
+    build.add_argument('jsonl', nargs='+',
+                       help='JSON lines files of validated records')
+
+    query = commands.add_parser('query', help='look up records')
+    query.add_argument('store', help='SQLite file')
+    for criterion in ('cpv', 'nuts', 'country', 'date', 'since', 'until',
+                      'authority', 'contractor', 'text'):
+        query.add_argument('--' + criterion)
+    query.add_argument('--limit', type=int)
+    query.add_argument('--count', action='store_true',
+                       help='only print the number of records')
+    args = parser.parse_args(argv)
+
+    store = Store(args.store)
+    try:
+        if args.command == 'build':
+            count = 0
+            for path in args.jsonl:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        store.write(json.loads(line))
+                        count += 1
+            print('{} notices stored'.format(count), file=sys.stderr)
+            return
+
+        criteria = {key: getattr(args, key) for key in (
+            'cpv', 'nuts', 'country', 'date', 'since', 'until', 'authority',
+            'contractor', 'text')}
+        if args.count:
+            print(store.count(**criteria))
+            return
+        for record in store.query(args.limit, **criteria):
+            print(json.dumps(record, ensure_ascii=False))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+import os
+import io
+import sys
+import random
+import tarfile
+import argparse
+from xml.sax.saxutils import escape, quoteattr
+
+# Synthetic Contract award notices in the TED export format, used as an
+# offline corpus for benchmarks. Notices cover single and range values,
+# several AWARD_AND_CONTRACT_VALUE, up to 24 translations and OTH_NOT forms
+NS = 'http://publications.europa.eu/TED_schema/Export'
+
+LANGUAGES = ['BG', 'CS', 'DA', 'DE', 'EL', 'EN', 'ES', 'ET', 'FI', 'FR',
+             'GA', 'HR', 'HU', 'IT', 'LT', 'LV', 'MT', 'NL', 'PL', 'PT',
+             'RO', 'SK', 'SL', 'SV']
+
+COUNTRIES = ['AT', 'BE', 'CH', 'CZ', 'DE', 'DK', 'ES', 'FR', 'UK', 'IT',
+             'LT', 'NL', 'PL', 'SE', 'SK']
+
+CURRENCIES = {'AT': 'EUR', 'BE': 'EUR', 'CH': 'CHF', 'CZ': 'CZK',
+              'DE': 'EUR', 'DK': 'DKK', 'ES': 'EUR', 'FR': 'EUR',
+              'UK': 'GBP', 'IT': 'EUR', 'LT': 'LTL', 'NL': 'EUR',
+              'PL': 'PLN', 'SE': 'SEK', 'SK': 'EUR'}
+
+CPV_DIVISIONS = ['03', '09', '15', '30', '33', '34', '45', '48', '50',
+                 '55', '60', '71', '72', '79', '80', '85', '90']
+
+AUTHORITIES = ['City Council of {town}', 'Ministry of Health',
+               '{town} University Hospital', 'Regional Water Authority',
+               'National Roads Agency', '{town} School Board']
+
+COMPANIES = ['Acme Construction Ltd', 'Nordic Supplies AB',
+             'Linkgroup AG', 'Omega Medical GmbH', 'Bauer & Sohn KG',
+             'Servicios Integrales SA', 'Delta IT Solutions',
+             'Green Cleaning Services', 'TransLogistics sp. z o.o.']
+
+# TD_DOCUMENT_TYPE codes, '7' for the Contract awards. The other types are
+# generated to test the pre-filter (see prefilter.py)
+DOCUMENT_TYPES = {'0': 'Prior information notice', '3': 'Contract notice',
+                  '7': 'Contract award notice'}
+
+TOWNS = ['Zürich', 'Berlin', 'Paris', 'Madrid', 'Vilnius', 'Warszawa',
+         'Stockholm', 'London', 'Roma', 'Praha', 'Bratislava', 'Wien']
+
+
+def amount(rng):
+    return rng.choice([
+        '{:d}'.format(rng.randint(1000, 5000000)),
+        '{:,d}'.format(rng.randint(1000, 5000000)).replace(',', ' '),
+        '{:d},{:02d}'.format(rng.randint(1000, 500000), rng.randint(0, 99)),
+    ])
+
+
+def cost(rng, currency, tag='COSTS_RANGE_AND_CURRENCY_WITH_VAT_RATE'):
+    if rng.random() < 0.8:
+        value = '<VALUE_COST>{}</VALUE_COST>'.format(amount(rng))
+    else:
+        value = ('<RANGE_VALUE_COST><LOW_VALUE>{}</LOW_VALUE>'
+                 '<HIGH_VALUE>{}</HIGH_VALUE></RANGE_VALUE_COST>').format(
+                     amount(rng), amount(rng))
+    vat = ''
+    if rng.random() < 0.3:
+        vat = ('<INCLUDING_VAT><VAT_PRCT>{}</VAT_PRCT>'
+               '</INCLUDING_VAT>').format(rng.choice(['20', '21', '19,6']))
+    return '<{0} CURRENCY="{1}">{2}{3}</{0}>'.format(tag, currency, value,
+                                                     vat)
+
+
+def total_value(rng, currency, kind):
+    if rng.random() < 0.85:
+        body = '<SINGLE_VALUE><VALUE CURRENCY="{}">{}</VALUE></SINGLE_VALUE>'
+        body = body.format(currency, amount(rng))
+    else:
+        body = ('<RANGE_VALUE><VALUE CURRENCY="{0}">{1}</VALUE>'
+                '<VALUE CURRENCY="{0}">{2}</VALUE></RANGE_VALUE>').format(
+                    currency, amount(rng), amount(rng))
+    return '<VALUES TYPE="{}">{}</VALUES>'.format(kind, body)
+
+
+def award(rng, country, currency):
+    name = rng.choice(COMPANIES)
+    town = rng.choice(TOWNS)
+    parts = []
+    if rng.random() < 0.95:
+        parts.append(
+            '<ECONOMIC_OPERATOR_NAME_ADDRESS>'
+            '<CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME>'
+            '<ORGANISATION><OFFICIALNAME>{}</OFFICIALNAME></ORGANISATION>'
+            '<ADDRESS>{} {}</ADDRESS><TOWN>{}</TOWN>'
+            '<POSTAL_CODE>{}</POSTAL_CODE><COUNTRY VALUE="{}"/>'
+            '</CONTACT_DATA_WITHOUT_RESPONSIBLE_NAME>'
+            '</ECONOMIC_OPERATOR_NAME_ADDRESS>'.format(
+                escape(name), rng.choice(['Main Street', 'Hauptstraße',
+                                          'Rue de la Paix']),
+                rng.randint(1, 200), escape(town), rng.randint(1000, 99999),
+                rng.choice([country] * 4 + COUNTRIES)))
+    if rng.random() < 0.9:
+        extra = ''
+        if rng.random() < 0.2:
+            extra = ('<NUMBER_OF_YEARS>{}</NUMBER_OF_YEARS>'.format(
+                rng.randint(1, 5)))
+        elif rng.random() < 0.2:
+            extra = ('<NUMBER_OF_MONTHS>{}</NUMBER_OF_MONTHS>'.format(
+                rng.randint(1, 48)))
+        estimate = ''
+        if rng.random() < 0.4:
+            estimate = cost(rng, currency,
+                             'INITIAL_ESTIMATED_TOTAL_VALUE_CONTRACT')
+        parts.append(
+            '<CONTRACT_VALUE_INFORMATION>{}{}{}'
+            '</CONTRACT_VALUE_INFORMATION>'.format(
+                estimate, cost(rng, currency), extra))
+    return ''.join(parts)
+
+
+def form(rng, lg, doc, oth_not):
+    if oth_not:
+        return ('<OTH_NOT LG="{}" CATEGORY="TRANSLATION"><FD_OTH_NOT>'
+                '<P>Free text notice.</P></FD_OTH_NOT></OTH_NOT>').format(lg)
+
+    authority = escape(doc['authority'])
+    nuts = ''.join('<NUTS CODE="{}"/>'.format(code) for code in doc['nuts'])
+    location = ''
+    if rng.random() < 0.5:
+        location = '<LOCATION><P>{}</P><P>{}</P></LOCATION>'.format(
+            escape(doc['town']), lg)
+    framework = ('<CONCLUSION_FRAMEWORK_AGREEMENT/>'
+                 if doc['framework'] else '')
+    dps = '<CONTRACTS_DPS/>' if doc['dps'] else ''
+    total = ''
+    if doc['total']:
+        total = '<TOTAL_FINAL_VALUE>{}</TOTAL_FINAL_VALUE>'.format(
+            doc['total'])
+
+    awards = []
+    for award in doc['awards']:
+        if doc['award_values']:
+            awards.append(
+                '<AWARD_OF_CONTRACT_DEFENCE>'
+                '<AWARD_AND_CONTRACT_VALUE>{}</AWARD_AND_CONTRACT_VALUE>'
+                '<AWARD_AND_CONTRACT_VALUE>{}</AWARD_AND_CONTRACT_VALUE>'
+                '</AWARD_OF_CONTRACT_DEFENCE>'.format(award, award))
+        else:
+            awards.append('<AWARD_OF_CONTRACT ITEM="1">{}'
+                          '</AWARD_OF_CONTRACT>'.format(award))
+
+    return (
+        '<CONTRACT_AWARD LG="{lg}" CATEGORY="TRANSLATION" FORM="3">'
+        '<FD_CONTRACT_AWARD CTYPE="SERVICES">'
+        '<CONTRACTING_AUTHORITY_INFORMATION>'
+        '<NAME_ADDRESSES_CONTACT_CONTRACT_AWARD>'
+        '<CA_CE_CONCESSIONAIRE_PROFILE>'
+        '<ORGANISATION><OFFICIALNAME>{authority}</OFFICIALNAME>'
+        '</ORGANISATION><ADDRESS>Town Hall</ADDRESS>'
+        '<TOWN>{town}</TOWN><COUNTRY VALUE="{country}"/>'
+        '</CA_CE_CONCESSIONAIRE_PROFILE>'
+        '</NAME_ADDRESSES_CONTACT_CONTRACT_AWARD>'
+        '</CONTRACTING_AUTHORITY_INFORMATION>'
+        '<OBJECT_CONTRACT_INFORMATION_CONTRACT_AWARD_NOTICE>'
+        '<DESCRIPTION_AWARD_NOTICE_INFORMATION>'
+        '<TITLE_CONTRACT><P>Contract title in {lg}</P></TITLE_CONTRACT>'
+        '<LOCATION_NUTS>{location}{nuts}</LOCATION_NUTS>'
+        '{framework}{dps}'
+        '<SHORT_CONTRACT_DESCRIPTION><P>{lg} description of the '
+        'contract, repeated to pad the translation. {pad}</P>'
+        '</SHORT_CONTRACT_DESCRIPTION>'
+        '<CPV><CPV_MAIN><CPV_CODE CODE="{cpv}"/></CPV_MAIN></CPV>'
+        '<CONTRACT_COVERED_GPA VALUE="{gpa}"/>'
+        '</DESCRIPTION_AWARD_NOTICE_INFORMATION>'
+        '{total}'
+        '</OBJECT_CONTRACT_INFORMATION_CONTRACT_AWARD_NOTICE>'
+        '<PROCEDURE_DEFINITION_CONTRACT_AWARD_NOTICE>'
+        '<TYPE_PROCEDURE_DEFINITION_CONTRACT_AWARD><PT_OPEN/>'
+        '</TYPE_PROCEDURE_DEFINITION_CONTRACT_AWARD>'
+        '</PROCEDURE_DEFINITION_CONTRACT_AWARD_NOTICE>'
+        '{awards}'
+        '</FD_CONTRACT_AWARD></CONTRACT_AWARD>').format(
+            lg=lg, authority=authority, town=escape(doc['town']),
+            country=doc['country'], location=location, nuts=nuts,
+            framework=framework, dps=dps, cpv=doc['cpv'], gpa=doc['gpa'],
+            total=total, awards=''.join(awards),
+            pad='Lorem ipsum dolor sit amet. ' * rng.randint(1, 20))
+
+
+def notice(seed=None, languages=None, oth_not=None, document_type='7'):
+    """
+    Generate a synthetic Contract award notice in the TED export format
+    :param seed: random seed, for reproducible notices
+    :param languages: number of translations of the FORM_SECTION, random
+                      between 1 and 24 if not given
+    :param oth_not: whether the form is a non-structured OTH_NOT form,
+                    random (5%) if not given
+    :param document_type: TD_DOCUMENT_TYPE code, e.g. '3' for a notice
+                          which is not a Contract award (the form is the same)
+    :return: tuple of DOC_ID and the notice as bytes
+    """
+
+    rng = random.Random(seed)
+
+    year = rng.choice(['2011', '2012', '2013', '2014', '2015', '2016'])
+    month = '{:02d}'.format(rng.randint(1, 12))
+    number = rng.randint(1, 499999)
+    doc_id = '{}-{}'.format(number, year)
+    country = rng.choice(COUNTRIES)
+    currency = CURRENCIES[country]
+    town = rng.choice(TOWNS)
+
+    if oth_not is None:
+        oth_not = rng.random() < 0.05
+    if languages is None:
+        languages = rng.choice([1, 1, 2, 3, 5, 24])
+    original = rng.choice(LANGUAGES)
+    translations = [original] + sorted(
+        rng.sample([lg for lg in LANGUAGES if lg != original],
+                   min(languages, len(LANGUAGES)) - 1))
+
+    cpv = '{}{:06d}'.format(rng.choice(CPV_DIVISIONS), rng.randint(0, 999999))
+    nuts = [country + ''.join(rng.choice('0123456789ABC')
+                              for _ in range(rng.randint(0, 3)))
+            for _ in range(rng.randint(0, 2))]
+
+    awards = [award(rng, country, currency)
+              for _ in range(rng.choice([0, 1, 1, 1, 2, 3, 8]))]
+
+    total = ''
+    if rng.random() < 0.6:
+        total = cost(rng, currency)
+
+    doc = {'authority': rng.choice(AUTHORITIES).format(town=town),
+           'town': town, 'country': country, 'nuts': nuts, 'cpv': cpv,
+           'gpa': rng.choice(['YES', 'NO']),
+           'framework': rng.random() < 0.2, 'dps': rng.random() < 0.05,
+           'total': total, 'awards': awards,
+           'award_values': rng.random() < 0.1}
+
+    values = ''
+    if rng.random() < 0.7:
+        values = '<VALUES_LIST>{}{}</VALUES_LIST>'.format(
+            total_value(rng, currency, 'GLOBAL'),
+            ''.join(total_value(rng, currency, 'CONTRACT')
+                    for _ in range(rng.randint(0, 3))))
+
+    ref = ''
+    if rng.random() < 0.5:
+        ref = '<REF_NOTICE><NO_DOC_OJS>{}/S {:03d}-{:06d}</NO_DOC_OJS>' \
+              '</REF_NOTICE>'.format(year, rng.randint(1, 250),
+                                     rng.randint(1, 499999))
+    url = ''
+    if rng.random() < 0.7:
+        url = '<IA_URL_GENERAL>www.{}.example</IA_URL_GENERAL>'.format(
+            town.lower())
+    activities = ''.join('<MA_MAIN_ACTIVITIES CODE="{}">Activity'
+                         '</MA_MAIN_ACTIVITIES>'.format(code)
+                         for code in rng.sample('8ABCDEHLSUZ',
+                                                rng.randint(0, 2)))
+
+    coded = (
+        '<CODED_DATA_SECTION>'
+        '<REF_OJS><COLL_OJ>S</COLL_OJ><NO_OJ>{day}</NO_OJ></REF_OJS>'
+        '<NOTICE_DATA>'
+        '<NO_DOC_OJS>{year}/S {day:03d}-{number:06d}</NO_DOC_OJS>'
+        '{nuts}'
+        '<ORIGINAL_CPV CODE="{cpv}">Product</ORIGINAL_CPV>'
+        '{values}'
+        '<ISO_COUNTRY VALUE="{country}"/>'
+        '{url}{ref}'
+        '</NOTICE_DATA>'
+        '<CODIF_DATA>'
+        '<DS_DATE_DISPATCH>{year}{month}{dd:02d}</DS_DATE_DISPATCH>'
+        '<AA_AUTHORITY_TYPE CODE="{aa}">Authority</AA_AUTHORITY_TYPE>'
+        '<TD_DOCUMENT_TYPE CODE="{td}">{td_name}</TD_DOCUMENT_TYPE>'
+        '<NC_CONTRACT_NATURE CODE="{nc}">Nature</NC_CONTRACT_NATURE>'
+        '<PR_PROC CODE="{pr}">Procedure</PR_PROC>'
+        '<RP_REGULATION CODE="{rp}">Regulation</RP_REGULATION>'
+        '<TY_TYPE_BID CODE="9">Not applicable</TY_TYPE_BID>'
+        '<AC_AWARD_CRIT CODE="{ac}">Criteria</AC_AWARD_CRIT>'
+        '{activities}'
+        '</CODIF_DATA>'
+        '</CODED_DATA_SECTION>').format(
+            day=rng.randint(1, 250), year=year, number=number, month=month,
+            dd=rng.randint(1, 28),
+            nuts=''.join('<ORIGINAL_NUTS CODE="{}">Region</ORIGINAL_NUTS>'
+                         .format(code) for code in nuts),
+            cpv=cpv, values=values, country=country, url=url, ref=ref,
+            aa=rng.choice('12345689NRZ'), nc=rng.choice('1234'),
+            pr=rng.choice('12369'), rp=rng.choice('2457'),
+            ac=rng.choice('12Z'), activities=activities, td=document_type,
+            td_name=DOCUMENT_TYPES.get(document_type, 'Other'))
+
+    translation = ''.join(
+        '<ML_TI_DOC LG="{}"><TI_CY>{}</TI_CY><TI_TOWN>{}</TI_TOWN>'
+        '<TI_TEXT><P>Title</P></TI_TEXT></ML_TI_DOC>'.format(
+            lg, country, escape(town)) for lg in translations)
+
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<TED_EXPORT xmlns="{ns}" DOC_ID={doc_id} EDITION="{year}001">'
+        '<TECHNICAL_SECTION><RECEPTION_ID>16-000001-001</RECEPTION_ID>'
+        '<DELETION_DATE>20170101</DELETION_DATE>'
+        '<FORM_LG_LIST>{lgs}</FORM_LG_LIST></TECHNICAL_SECTION>'
+        '<LINKS_SECTION><XML_SCHEMA_DEFINITION_LINK type="simple"/>'
+        '</LINKS_SECTION>'
+        '{coded}'
+        '<TRANSLATION_SECTION>{translation}</TRANSLATION_SECTION>'
+        '<FORM_SECTION>{forms}</FORM_SECTION>'
+        '</TED_EXPORT>').format(
+            ns=NS, doc_id=quoteattr(doc_id), year=year,
+            lgs=' '.join(translations), coded=coded,
+            translation=translation,
+            forms=''.join(form(rng, lg, doc, oth_not)
+                          for lg in translations))
+
+    return doc_id, xml.encode('utf-8')
+
+
+def document_type(i, others):
+    """
+    :param i: position of a notice in the corpus
+    :param others: share of the notices which are not Contract awards
+    :return: TD_DOCUMENT_TYPE code of the notice, '7' or a code of the
+             other types, spread evenly across the corpus
+    """
+
+    if int((i + 1) * others) == int(i * others):
+        return '7'
+    return '3' if i % 2 else '0'
+
+
+def generate(directory, count, seed=0, others=0, **kwargs):
+    """
+    Write a corpus of synthetic notices to a directory
+    :param directory: output folder, created if missing
+    :param count: number of notices
+    :param seed: random seed of the corpus
+    :param others: share of the notices which are not Contract awards
+    :param kwargs: passed to notice()
+    :return: list of paths of the written notices
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        doc_id, xml = notice(seed=seed * 1000003 + i,
+                             document_type=document_type(i, others),
+                             **kwargs)
+        path = os.path.join(directory, '{}_{:06d}.xml'.format(
+            doc_id.replace('-', '_'), i))
+        with open(path, 'wb') as f:
+            f.write(xml)
+        paths.append(path)
+    return paths
+
+
+def package(path, count, seed=0, others=0, **kwargs):
+    """
+    Write synthetic notices as a TED daily package
+    :param path: tar.gz file
+    :param count: number of notices
+    :param seed: random seed of the package
+    :param others: share of the notices which are not Contract awards
+    :param kwargs: passed to notice()
+    :return: path
+    """
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(count):
+            doc_id, xml = notice(seed=seed * 1000003 + i,
+                                 document_type=document_type(i, others),
+                                 **kwargs)
+            member = tarfile.TarInfo('{}.xml'.format(
+                doc_id.replace('-', '_')))
+            member.size = len(xml)
+            tar.addfile(member, io.BytesIO(xml))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic TED Contract award notices')
+    parser.add_argument('output',
+                        help='output folder, or tar.gz package')
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='number of notices')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed of the corpus')
+    parser.add_argument('--languages', type=int,
+                        help='number of translations (default: random)')
+    parser.add_argument('--oth-not', action='store_true', default=None,
+                        help='only generate OTH_NOT forms')
+    parser.add_argument('--others', type=float, default=0,
+                        help='share of notices of other types than Contract '
+                             'award, e.g. 0.6 (default: 0)')
+    args = parser.parse_args(argv)
+
+    kwargs = {'languages': args.languages, 'oth_not': args.oth_not,
+              'others': args.others}
+    if args.output.endswith(('.tar.gz', '.tgz')):
+        package(args.output, args.count, args.seed, **kwargs)
+    else:
+        generate(args.output, args.count, args.seed, **kwargs)
+    print('{} notices written to {}'.format(args.count, args.output),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
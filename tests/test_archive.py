@@ -0,0 +1,76 @@
+import os
+import tarfile
+
+from archive import is_archive, iter_archive, source
+from batch import chunked, process, process_chunk
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'oth_not.xml']
+
+
+def package(tmp_path, name='20160103_001.tar.gz'):
+    """
+    Small TED package: a folder with notices, and a file which is not one
+    """
+
+    path = str(tmp_path / name)
+    readme = tmp_path / 'README.txt'
+    readme.write_text('not a notice')
+    with tarfile.open(path, 'w:gz') as tar:
+        tar.add(str(tmp_path), arcname='20160103_001', recursive=False)
+        for notice in NOTICES:
+            tar.add(os.path.join(FIXTURES, notice),
+                    arcname='20160103_001/' + notice)
+        tar.add(str(readme), arcname='20160103_001/README.txt')
+    return path
+
+
+def test_is_archive():
+    assert is_archive('20160103_001.tar.gz')
+    assert is_archive('20160103_001.TGZ')
+    assert is_archive('20160103_001.tar')
+    assert not is_archive('20160103_001.xml')
+
+
+def test_iter_archive(tmp_path):
+    path = package(tmp_path)
+
+    members = []
+    for member, f in iter_archive(path):
+        with open(os.path.join(FIXTURES, os.path.basename(member)),
+                  'rb') as notice:
+            assert f.read() == notice.read()
+        members.append(member)
+
+    # The folder and the README are skipped
+    assert members == ['20160103_001/' + notice for notice in NOTICES]
+
+
+def test_process_chunk(tmp_path):
+    path = package(tmp_path)
+    assert list(chunked([path], size=64)) == [[path]]
+
+    results = process_chunk(([path], {}))
+
+    assert [name for name, _, _ in results] == [
+        path + ':20160103_001/' + notice for notice in NOTICES]
+    for (_, record, error), notice in zip(results, NOTICES):
+        assert error is None
+        assert record.pop('SOURCE') == source(path, '20160103_001/' + notice)
+        assert record == process(os.path.join(FIXTURES, notice))[0]
+    assert source(path, 'a.xml') == {'ARCHIVE': '20160103_001.tar.gz',
+                                     'MEMBER': 'a.xml'}
+
+
+def test_truncated_package(tmp_path):
+    path = package(tmp_path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        f.write(content[:len(content) // 2])
+
+    results = process_chunk(([path], {}))
+    name, record, error = results[-1]
+    assert (name, record) == (path, None)
+    assert error['stage'] == 'read'
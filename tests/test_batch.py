@@ -0,0 +1,72 @@
+import os
+import json
+import resource
+
+import batch
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'award_range.xml', 'empty_years.xml',
+           'oth_not.xml', 'invalid.xml']
+
+
+def files():
+    return [os.path.join(FIXTURES, name) for name in NOTICES]
+
+
+def summary(results):
+    return [(path, record, error and (error['stage'], error['message']))
+            for path, record, error in results]
+
+
+def test_validate_chunk_falls_back(monkeypatch):
+    expected = batch.process_chunk((files(), {}))
+
+    def fail(records):
+        raise MemoryError
+
+    # A failed batch validation is redone one notice at a time
+    monkeypatch.setattr(batch, 'validate_batch', fail)
+    results = batch.process_chunk((files(), {}))
+    assert summary(results) == summary(expected)
+    assert [error['stage'] for _, _, error in results
+            if error is not None] == ['validate']
+
+
+def test_memory_limit_per_notice():
+    before = resource.getrlimit(resource.RLIMIT_AS)
+    record, error = batch.process(files()[0], memory=4000)
+    assert error is None and record['DOC_ID']
+    assert resource.getrlimit(resource.RLIMIT_AS) == before
+
+
+def test_memory_limit_never_in_parent(monkeypatch):
+    parent = os.getpid()
+    setrlimit = resource.setrlimit
+
+    def checked(kind, limits):
+        assert os.getpid() != parent
+        setrlimit(kind, limits)
+
+    monkeypatch.setattr(batch.resource, 'setrlimit', checked)
+    results = list(batch.iter_extract(files(), workers=1, memory=4000))
+    assert summary(results) == summary(
+        batch.process_chunk((files(), {})))
+
+
+def test_failure_report():
+    missing = os.path.join(FIXTURES, 'missing.xml')
+    paths = files() + [missing]
+    results = list(batch.iter_extract(paths, workers=2, chunksize=2))
+
+    # Results in the order of the input files, whatever the workers
+    assert [path for path, _, _ in results] == paths
+    errors = [error for _, _, error in results if error is not None]
+    assert [(error['path'], error['stage']) for error in errors] == [
+        (files()[-1], 'validate'), (missing, 'extract')]
+    for error in errors:
+        assert set(error) == {'path', 'stage', 'error', 'message',
+                              'traceback'}
+        assert error['traceback'].startswith('Traceback')
+    assert errors[1]['error'] == 'OSError'
+    assert json.loads(json.dumps(errors)) == errors
@@ -0,0 +1,149 @@
+import os
+import json
+from collections import Counter
+
+import batch
+import coordinator
+from coordinator import MAX_ATTEMPTS, Partitions, Queue, collect, work
+from prefilter import DOCUMENT_TYPES
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def files():
+    return [os.path.join(FIXTURES, name)
+            for name in sorted(os.listdir(FIXTURES))
+            if name.endswith('.xml')]
+
+
+class Clock(object):
+    """
+    Stand-in for the time module of the coordinator, moved by hand
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_lease_expires(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(coordinator, 'time', clock)
+    queue = Queue(str(tmp_path / 'queue.db'))
+    assert queue.add(files()[:2], size=1) == 2
+
+    (first, paths), = queue.lease('a', duration=10)
+    assert paths == files()[:1]
+    (second, _), = queue.lease('b', duration=10)
+    assert second != first
+    assert queue.lease('b', duration=10) == []
+
+    # The lease of the dead worker expires, its task is leased again
+    clock.now += 5
+    queue.complete(second, 'b')
+    assert queue.lease('b', duration=10) == []
+    clock.now += 6
+    assert queue.status()['expired'] == 1
+    assert queue.lease('b', duration=10) == [(first, paths)]
+    assert queue.active() == 1
+
+    queue.complete(first, 'b')
+    assert queue.active() == 0
+    status = queue.status()
+    assert status['done'] == 2 and status['expired'] == 0
+    queue.close()
+
+
+def test_max_attempts(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(coordinator, 'time', clock)
+    queue = Queue(str(tmp_path / 'queue.db'))
+    queue.add(files()[:1])
+
+    for _ in range(MAX_ATTEMPTS):
+        (task, _), = queue.lease('a', duration=10)
+        clock.now += 11  # The worker dies with the task
+
+    # Given up rather than leased again
+    assert queue.lease('a', duration=10) == []
+    assert queue.active() == 0
+    assert queue.status()['failed'] == 1
+
+    assert queue.retry() == 1
+    assert queue.lease('a', duration=10) == [(task, files()[:1])]
+    queue.close()
+
+
+def test_add_skips_known_files(tmp_path):
+    queue = Queue(str(tmp_path / 'queue.db'))
+    assert queue.add(files(), size=4) == 3
+    assert queue.add(files()[:1] + files(), size=4) == 0
+    queue.close()
+
+
+def record(doc_id, value):
+    return {'DOC_ID': doc_id, 'VALUE': value}
+
+
+def test_collect_keeps_one_record(tmp_path):
+    partitions = Partitions(str(tmp_path / 'out'), count=4)
+    partitions.write(1, [('a.xml', record('1-2015', 'first'), None),
+                         ('b.xml', record('2-2015', 'first'), None)])
+    partitions.write(2, [('c.xml', record('1-2015', 'last'), None),
+                         ('d.xml', None, {'path': 'd.xml'})])
+    # A task processed again replaces its output
+    partitions.write(1, [('a.xml', record('1-2015', 'again'), None),
+                         ('b.xml', record('2-2015', 'again'), None)])
+
+    records = sorted(collect(str(tmp_path / 'out')),
+                     key=lambda r: r['DOC_ID'])
+    assert records == [record('1-2015', 'last'), record('2-2015', 'again')]
+    errors = os.listdir(str(tmp_path / 'out' / 'errors'))
+    assert errors == ['task-000002.jsonl']
+
+
+def test_work_as_batch(tmp_path):
+    queue_path = str(tmp_path / 'queue.db')
+    output = str(tmp_path / 'out')
+    options = {'validate': True, 'fused': False, 'languages': None,
+               'timeout': None, 'memory': None, 'prefilter': DOCUMENT_TYPES}
+    queue = Queue(queue_path)
+    queue.configure({'output': output, 'partitions': 4, 'options': options,
+                     'dead_letters': None})
+    queue.add(files(), size=3)
+
+    # A worker died with the first task: its lease expired already
+    queue.lease('dead', duration=-1)
+    queue.close()
+
+    counts = work(queue_path, 'alive', poll=0)
+
+    skipped = Counter()
+    expected = {}
+    failed = 0
+    for _, rec, error in batch.iter_extract(
+            files(), workers=1, chunksize=3, prefilter=DOCUMENT_TYPES,
+            skipped=skipped):
+        if error is None:
+            expected[rec['DOC_ID']] = rec
+        else:
+            failed += 1
+
+    records = {rec['DOC_ID']: rec for rec in collect(output)}
+    assert json.dumps(records, sort_keys=True) == json.dumps(
+        expected, sort_keys=True)
+    assert counts['tasks'] == 4 and counts['failed'] == failed == 2
+    assert counts['skipped'] == skipped['TD_DOCUMENT_TYPE 3'] == 1
+
+    queue = Queue(queue_path)
+    status = queue.status()
+    assert status['done'] == 4 and status['errors'] == failed
+    assert queue.db.execute('SELECT worker, attempts FROM tasks '
+                            'ORDER BY id').fetchall() == [('alive', 2)] + [
+        ('alive', 1)] * 3
+    queue.close()
@@ -0,0 +1,93 @@
+import math
+from collections import Counter
+
+import pytest
+
+import export
+from currency import Rates, to_eur
+
+
+def test_fixed_rates_from_changeover():
+    rates = Rates()
+    assert rates.rate('EUR', '201101') == 1
+    assert rates.rate('HRK', '202301') == 7.5345
+    assert rates.rate('LTL', '201501') == 3.4528
+    # Floating before the changeover: no rate shipped
+    assert math.isnan(rates.rate('HRK', '201512'))
+    assert math.isnan(rates.rate('LTL', '201412'))
+    assert math.isnan(rates.rate('PLN', '201512'))
+    assert rates.missing == {('HRK', '201512'), ('LTL', '201412'),
+                             ('PLN', '201512')}
+    assert 'HRK (1 months)' in rates.warning()
+
+
+def test_monthly_rates(tmp_path):
+    path = tmp_path / 'monthly.csv'
+    path.write_text('CURRENCY,MONTH,RATE\n'
+                    'HRK,201512,7.638\n'
+                    'PLN,201512,4.2639\n')
+    rates = Rates([str(path)])
+    assert rates.rate('HRK', '201512') == 7.638
+    assert rates.rate('HRK', '202302') == 7.5345
+    assert rates.rate('PLN', '201512') == 4.2639
+    assert rates.rate('', '201512') != rates.rate('', '201512')  # NaN
+    assert rates.warning() is None
+
+
+def test_to_eur():
+    pd = pytest.importorskip('pandas')
+    df = pd.DataFrame({'YEAR': ['2015', '2015', '2023', '2015'],
+                       'MONTH': ['12', '12', '01', '12'],
+                       'COST_CURRENCY': ['EUR', 'HRK', 'HRK', None],
+                       'COST_VALUE': [10.0, 75.345, 75.345, 5.0],
+                       'COST_LOW_VALUE': [None, None, None, None],
+                       'COST_HIGH_VALUE': [None, None, None, None]})
+    rates = Rates()
+    values = to_eur(df, ['COST'], rates)['COST_VALUE_EUR'].tolist()
+    assert values[0] == 10.0 and values[2] == pytest.approx(10.0)
+    assert math.isnan(values[1]) and math.isnan(values[3])
+    assert rates.missing == {('HRK', '201512')}
+
+
+class Counting(Rates):
+    """
+    Rates counting the lookups of each (currency, month) pair
+    """
+
+    def __init__(self, paths=None):
+        super(Counting, self).__init__(paths)
+        self.calls = Counter()
+
+    def rate(self, currency, month):
+        self.calls[(currency, month)] += 1
+        return super(Counting, self).rate(currency, month)
+
+
+def test_to_eur_looks_up_pairs_once():
+    pd = pytest.importorskip('pandas')
+    df = pd.DataFrame({'YEAR': ['2015'] * 4 + ['2023'] * 2,
+                       'MONTH': ['12'] * 4 + ['01'] * 2,
+                       'COST_CURRENCY': ['EUR', 'BGN', 'EUR', None,
+                                         'HRK', 'HRK'],
+                       'COST_VALUE': [1.0, 1.95583, 2.0, 3.0, 7.5345, None],
+                       'COST_LOW_VALUE': [None] * 6,
+                       'COST_HIGH_VALUE': [None] * 6})
+    rates = Counting()
+    values = to_eur(df, ['COST'], rates)['COST_VALUE_EUR'].tolist()
+    assert values[:3] == [1.0, pytest.approx(1.0), 2.0]
+    assert math.isnan(values[3]) and math.isnan(values[5])
+    assert values[4] == pytest.approx(1.0)
+    assert rates.calls == Counter({('EUR', '201512'): 1,
+                                   ('BGN', '201512'): 1,
+                                   ('', '201512'): 1, ('HRK', '202301'): 1})
+
+    empty = to_eur(df.iloc[:0].copy(), ['COST'], Counting())
+    assert empty['COST_VALUE_EUR'].tolist() == []
+
+
+def test_cli_needs_rates(tmp_path):
+    path = tmp_path / 'empty.jsonl'
+    path.write_text('')
+    with pytest.raises(SystemExit):
+        export.main([str(path), '-o', str(tmp_path / 'out')])
+    export.main([str(path), '-o', str(tmp_path / 'out'), '--no-rates'])
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import batch
+from currency import Rates
+from export import COLUMNS, PARTITION, tables, write_chunk
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'award_range.xml', 'award_defence.xml',
+           'award_24.xml', 'empty_years.xml', 'oth_not.xml']
+
+
+def records():
+    results = batch.process_chunk(([os.path.join(FIXTURES, name)
+                                    for name in NOTICES], {}))
+    assert all(error is None for _, _, error in results)
+    return [record for _, record, _ in results]
+
+
+def test_tables():
+    pytest.importorskip('pandas')
+    data = records()
+    result = tables(data, Rates())
+
+    awards = [record['CONTRACT'].get('AWARDS_OF_CONTRACT', [])
+              for record in data]
+    notices = result['notices']
+    assert list(notices.columns) == [c for c, _ in COLUMNS['notices']]
+    assert list(notices['DOC_ID']) == [record['DOC_ID'] for record in data]
+    assert list(notices['AWARDS']) == [len(lst) for lst in awards]
+    assert len(result['awards']) == sum(len(lst) for lst in awards)
+    assert len(result['contractors']) == sum(
+        'CONTRACTOR' in award for lst in awards for award in lst)
+
+    for name, df in result.items():
+        assert list(df.columns)[:4] == ['DOC_ID', 'YEAR', 'MONTH'] + (
+            ['NO_DOC_OJS'] if name == 'notices' else ['AWARD'])
+        for column, kind in COLUMNS[name]:
+            if kind == 'float':
+                assert df[column].dtype == 'float64', column
+            elif kind == 'date':
+                assert str(df[column].dtype).startswith('datetime64')
+        assert set(df['YEAR'] + df['MONTH']) <= {
+            record['CODED_DATA']['CODIF_DATA']['DS_DATE_DISPATCH'][:6]
+            for record in data}
+
+    # Awards and contractors of a notice share its keys, in award order
+    first = data[0]['DOC_ID']
+    awards = result['awards'][result['awards']['DOC_ID'] == first]
+    assert list(awards['AWARD']) == list(range(len(awards)))
+
+
+def test_write_chunk(tmp_path):
+    pytest.importorskip('pyarrow')
+    pd = pytest.importorskip('pandas')
+    folder = str(tmp_path)
+    data = records()
+    expected = tables(data, Rates())
+
+    counts = write_chunk(data, folder, Rates())
+    assert counts == {name: len(df) for name, df in expected.items()}
+    assert sorted(os.listdir(os.path.join(folder, 'awards'))) == sorted(
+        'YEAR=' + year for year in set(expected['awards']['YEAR']))
+    for name, df in expected.items():
+        written = pd.read_parquet(os.path.join(folder, name))
+        assert len(written) == len(df)
+        assert set(written.columns) == set(df.columns)
+        for column, _ in PARTITION:
+            assert sorted(written[column].astype(str)) == sorted(df[column])
+        assert sorted(written['DOC_ID']) == sorted(df['DOC_ID'])
@@ -0,0 +1,59 @@
+import io
+import os
+
+import pytest
+from lxml import etree
+
+import extractor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Contract award notices: 1 to 24 translations, with and without the
+# preferred languages, single and range values, AWARD_AND_CONTRACT_VALUE
+# awards, empty durations, and an OTH_NOT form
+NOTICES = ['award_en.xml', 'award_range.xml', 'award_defence.xml',
+           'award_no_preferred.xml', 'award_24.xml', 'empty_years.xml',
+           'empty_months.xml', 'oth_not.xml']
+
+
+def fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+@pytest.mark.parametrize('name', NOTICES)
+def test_extract(name):
+    record = extractor.extract(fixture(name))
+    assert record['DOC_ID'] and record['CODED_DATA']['CODIF_DATA']
+    with open(fixture(name), 'rb') as f:
+        assert extractor.extract(f) == record
+
+
+@pytest.mark.parametrize('name, languages, language', [
+    ('award_24.xml', None, 'EN'), ('award_24.xml', ['SV', 'EN'], 'SV'),
+    ('award_no_preferred.xml', None, 'PT'),
+    ('award_no_preferred.xml', ['SK', 'LV'], 'SK')])
+def test_preferred_contract(name, languages, language):
+    root = etree.parse(fixture(name)).getroot()
+    form = extractor.XPATH['form_section'](root)[0]
+    contract = extractor.preferred_contract(
+        form, languages or extractor.LANGUAGES)
+    assert contract.getparent().get('LG') == language
+
+
+def test_truncated_notice():
+    with open(fixture('award_defence.xml'), 'rb') as f:
+        data = f.read()
+    with pytest.raises(Exception):
+        extractor.extract(io.BytesIO(data[:len(data) // 2]))
+
+
+@pytest.mark.parametrize('name', ['award_en.xml', 'award_range.xml'])
+def test_compiled_queries(name):
+    # The compiled queries give the results of the queries as strings
+    assert set(extractor.XPATH) == set(extractor.QUERIES)
+    root = etree.parse(fixture(name)).getroot()
+    for element in root.iter(etree.Element):
+        for key, query in extractor.QUERIES.items():
+            assert extractor.XPATH[key](element, name='TD_DOCUMENT_TYPE') \
+                == element.xpath(query, namespaces=extractor.NMSP,
+                                 name='TD_DOCUMENT_TYPE'), key
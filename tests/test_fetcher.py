@@ -0,0 +1,158 @@
+import os
+import io
+import json
+import hashlib
+import tarfile
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import fetcher
+from fetcher import Cache, FetchError, iter_fetch
+
+CONTENT = os.urandom(300 * 1024)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the server's content with range requests. Its failures list gives
+    the behaviour of the next requests: '503', 'drop' to close the
+    connection in the middle of the body, or 'empty' to close it before
+    the status line
+    """
+
+    def do_GET(self):
+        content = self.server.content
+        self.server.requests.append(self.headers.get('Range'))
+        failure = self.server.failures.pop(0) if self.server.failures \
+            else None
+        if failure == '503':
+            self.send_error(503)
+            return
+        if failure == 'empty':
+            self.close_connection = True
+            return
+
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+
+        body = content[start:]
+        if failure == 'drop':
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(fetcher, 'RETRY_DELAY', 0.0)
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    httpd.content = CONTENT
+    httpd.requests = []
+    httpd.failures = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server):
+    return 'http://127.0.0.1:{}/20160104_001.tar.gz'.format(
+        server.server_address[1])
+
+
+def fetch(server, folder):
+    checksums = {url(server): hashlib.sha256(CONTENT).hexdigest()}
+    return list(iter_fetch([url(server)], folder, checksums=checksums))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download(server, tmp_path):
+    [(_, path, error)] = fetch(server, str(tmp_path))
+    assert error is None and read(path) == CONTENT
+    assert os.path.basename(path) == '20160104_001.tar.gz'
+
+    # Cached: not downloaded again
+    [(_, cached, _)] = fetch(server, str(tmp_path))
+    assert cached == path and server.requests == [None]
+
+
+def test_resume(server, tmp_path):
+    part = Cache(str(tmp_path)).partial(url(server))
+    with open(part, 'wb') as f:
+        f.write(CONTENT[:1000])
+
+    [(_, path, error)] = fetch(server, str(tmp_path))
+    assert error is None and read(path) == CONTENT
+    assert server.requests == ['bytes=1000-']
+    assert not os.path.exists(part)
+
+
+def test_retry(server, tmp_path):
+    server.failures = ['503', 'drop']
+
+    [(_, path, error)] = fetch(server, str(tmp_path))
+    assert error is None and read(path) == CONTENT
+    # The dropped download is resumed where it stopped
+    assert server.requests[:2] == [None, None]
+    assert server.requests[2] == 'bytes={}-'.format(len(CONTENT) // 2)
+
+
+def test_malformed_response(server, tmp_path):
+    server.failures = ['empty']
+
+    [(_, path, error)] = fetch(server, str(tmp_path))
+    assert error is None and read(path) == CONTENT
+    assert len(server.requests) == 2
+
+
+def test_duplicate_urls(server, tmp_path):
+    results = list(iter_fetch([url(server)] * 3, str(tmp_path)))
+    assert [(u, error) for u, _, error in results] == [(url(server), None)]
+    assert read(results[0][1]) == CONTENT
+    assert server.requests == [None]
+
+
+def test_retries_exhausted(server, tmp_path):
+    server.failures = ['503'] * (fetcher.RETRIES + 1)
+
+    [(_, path, error)] = fetch(server, str(tmp_path))
+    assert path is None and isinstance(error, FetchError)
+    assert len(server.requests) == fetcher.RETRIES + 1
+
+
+def test_main(server, tmp_path):
+    names = ['award_en.xml', 'award_range.xml', 'oth_not.xml']
+    package = io.BytesIO()
+    with tarfile.open(fileobj=package, mode='w:gz') as tar:
+        for name in names:
+            tar.add(os.path.join(FIXTURES, name), arcname=name)
+    server.content = package.getvalue()
+
+    output = str(tmp_path / 'awards.jsonl')
+    fetcher.main([url(server), '-c', str(tmp_path / 'cache'), '-w', '2',
+                  '--jsonl', output])
+
+    with open(output, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == len(names)
+    assert {record['SOURCE']['ARCHIVE'] for record in records} == {
+        '20160104_001.tar.gz'}
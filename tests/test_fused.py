@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from lxml import etree
+
+from batch import process
+from fused import extract_valid
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# empty_years and empty_months hold CONTRACT_VALUE sections whose fields are
+# all empty: kept as {} by the three steps. non_numeric holds amounts which
+# are not numbers: kept as strings
+NOTICES = ['award_en.xml', 'award_range.xml', 'award_defence.xml',
+           'award_no_preferred.xml', 'award_24.xml', 'empty_years.xml',
+           'empty_months.xml', 'oth_not.xml', 'non_numeric.xml']
+
+
+def fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+@pytest.mark.parametrize('name', NOTICES + ['invalid.xml'])
+@pytest.mark.parametrize('languages', [None, ['SV']])
+def test_same_as_three_steps(name, languages):
+    expected, expected_error = process(fixture(name), languages=languages)
+    record, error = process(fixture(name), languages=languages, fused=True)
+
+    assert record == expected
+    if expected_error is None:
+        assert error is None
+    else:
+        assert (error['stage'], error['message']) == (
+            expected_error['stage'], expected_error['message'])
+
+
+@pytest.mark.parametrize('name', NOTICES)
+def test_handled_without_fallback(name):
+    # The valid fixtures never need the three steps
+    root = etree.parse(fixture(name)).getroot()
+    expected, _ = process(fixture(name))
+    assert extract_valid(root) == expected
+
+
+def test_empty_contract_value():
+    root = etree.parse(fixture('empty_months.xml')).getroot()
+    record = extract_valid(root)
+    assert record['CONTRACT']['CONTRACT_OBJECT']['CONTRACT_VALUE'] == {}
+
+
+def test_non_numeric_amounts():
+    record, error = process(fixture('non_numeric.xml'))
+    assert error is None
+    notice = record['CODED_DATA']['NOTICE_DATA']
+    assert notice['VALUES_LIST']['GLOBAL_VALUE']['VALUE'] == '4.062.859'
+    awards = record['CONTRACT']['AWARDS_OF_CONTRACT']
+    assert awards[0]['CONTRACT_VALUE']['ESTIMATE']['VALUE'] == 'see annex'
+    assert awards[1]['CONTRACT_VALUE']['NUMBER_OF_MONTHS'] == '2 1/2'
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+from benchmark import IMPORT_BUDGET, bench_import
+from conftest import ROOT
+
+
+def test_import_budget():
+    # Best of a few runs, the first one warms the disk cache
+    assert bench_import('validator', repeat=3) < IMPORT_BUDGET
+
+
+def test_import_is_lazy():
+    # The lookups and pandas are loaded on first use, not on import
+    code = ('import sys, validator; '
+            'print(sorted({"pandas", "numpy"} & set(sys.modules)))')
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    assert out.decode().strip() == '[]'
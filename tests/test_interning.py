@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+import export
+from batch import process_chunk
+from interning import (INTERNED, Dictionary, Strings, decode,
+                       encoded_columns, intern_record, string_hash)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NAMES = ['City Council of Madrid', 'Ville de Paris', 'Zürich', '']
+
+
+def test_string_hash():
+    assert string_hash('Zürich') == string_hash('Zürich')
+    assert string_hash('Zürich') != string_hash('Zurich')
+    assert -2 ** 63 <= string_hash('Zürich') < 2 ** 63
+
+
+def test_add_and_save(tmp_path):
+    path = str(tmp_path / 'strings.bin')
+    strings = Strings(path)
+    assert [strings.add(s) for s in NAMES + NAMES[:2]] == [0, 1, 2, 3, 0, 1]
+    assert not os.path.exists(path)
+
+    assert strings.save() == 4
+    dictionary = Dictionary(path)
+    assert list(dictionary) == NAMES and len(dictionary) == 4
+    assert [dictionary.find(s) for s in NAMES] == [0, 1, 2, 3]
+    assert dictionary.find('Unknown') is None
+    with pytest.raises(KeyError):
+        dictionary[4]
+    dictionary.close()
+
+
+def test_reopen_keeps_ids(tmp_path):
+    path = str(tmp_path / 'strings.bin')
+    strings = Strings(path)
+    for s in NAMES:
+        strings.add(s)
+    strings.save()
+
+    # A later run finds the IDs of the file and appends its new strings
+    strings = Strings(path)
+    assert strings.add('Oslo kommune') == 4
+    assert strings.add('Ville de Paris') == 1
+    assert strings.save() == 5
+    assert strings.save() == 5  # Nothing new
+    assert list(Dictionary(path)) == NAMES + ['Oslo kommune']
+
+
+def test_not_a_dictionary(tmp_path):
+    path = tmp_path / 'strings.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        Dictionary(str(path))
+
+
+def test_encode_decode(tmp_path):
+    pd = pytest.importorskip('pandas')
+    path = str(tmp_path / 'strings.bin')
+    df = pd.DataFrame({'DOC_ID': ['1-2015', '2-2015', '3-2015'],
+                       'TOWN': ['Zürich', None, 'Zürich'],
+                       'ADDRESS': ['Main Street 15', 'Rue 1', None]})
+
+    strings = Strings(path)
+    encoded = strings.encode(df.copy())
+    assert list(encoded.columns) == ['DOC_ID', 'TOWN_ID', 'ADDRESS_ID']
+    assert str(encoded['TOWN_ID'].dtype) == 'Int32'
+    assert encoded['TOWN_ID'].tolist() == [0, pd.NA, 0]
+    assert encoded['ADDRESS_ID'].tolist() == [1, 2, pd.NA]
+    strings.save()
+
+    dictionary = Dictionary(path)
+    decoded = decode(encoded, dictionary)
+    assert decoded.columns.tolist() == df.columns.tolist()
+    assert decoded.fillna('-').values.tolist() == \
+        df.fillna('-').values.tolist()
+    dictionary.close()
+
+
+def test_encoded_columns():
+    assert encoded_columns([('DOC_ID', 'str'), ('TOWN', 'str')]) == [
+        ('DOC_ID', 'str'), ('TOWN_ID', 'id')]
+
+
+def records():
+    names = ['award_en.xml', 'award_24.xml', 'award_range.xml']
+    return [record for _, record, _ in process_chunk(
+        ([os.path.join(FIXTURES, name) for name in names], {}))]
+
+
+def test_intern_record():
+    pool = {}
+    first, second, _ = [intern_record(record, pool) for record in records()]
+    # Regional Water Authority, in both notices
+    assert first['CONTRACT']['CONTRACTING_AUTHORITY'] is \
+        second['CONTRACT']['CONTRACTING_AUTHORITY']
+    assert first == records()[0]
+
+
+def test_saved_before_tables(tmp_path, monkeypatch):
+    pd = pytest.importorskip('pandas')
+    path = str(tmp_path / 'strings.bin')
+    strings = Strings(path)
+    written = []
+
+    def to_parquet(df, folder, **kwargs):
+        # Every ID of the table is in the file when the table is written
+        dictionary = Dictionary(path)
+        for column in INTERNED:
+            if column + '_ID' in df.columns:
+                for key in df[column + '_ID'].dropna().tolist():
+                    dictionary[key]
+        dictionary.close()
+        written.append(os.path.basename(folder))
+
+    # Only the order of the writes is checked: no Parquet file is written
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', to_parquet)
+    monkeypatch.setattr(export, 'arrow_schema', lambda columns: None)
+    export.write_chunk(records(), str(tmp_path / 'out'), strings=strings)
+    assert written == ['notices', 'awards', 'contractors']
+    assert strings.new == []
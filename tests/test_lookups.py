@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pytest
+
+import lookups
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = str(tmp_path / 'Lookups')
+    shutil.copytree(lookups.FOLDER, folder,
+                    ignore=shutil.ignore_patterns('*.pickle'))
+    return folder
+
+
+def test_cache_used(folder, monkeypatch):
+    cache = os.path.join(folder, 'lookups.pickle')
+    tables = lookups.load(folder, cache)
+    assert os.path.exists(cache)
+    assert tables == lookups.build(folder)
+
+    def build(folder):
+        raise AssertionError('cache not used')
+
+    monkeypatch.setattr(lookups, 'build', build)
+    assert lookups.load(folder, cache) == tables
+
+
+def test_cache_rebuilt(folder):
+    cache = os.path.join(folder, 'lookups.pickle')
+    assert '99' not in lookups.load(folder, cache)['codes']['PR_PROC']
+
+    with open(os.path.join(folder, 'PR_PROC.csv'), 'a',
+              encoding='utf-8') as f:
+        f.write('\r\n99,New procedure')
+    tables = lookups.load(folder, cache)
+    assert tables['descriptions']['PR_PROC']['99'] == 'New procedure'
+    assert lookups.load(folder, cache) == tables  # Cache written again
+
+
+def test_cache_unreadable(folder):
+    cache = os.path.join(folder, 'lookups.pickle')
+    with open(cache, 'wb') as f:
+        f.write(b'not a pickle')
+    assert lookups.load(folder, cache) == lookups.build(folder)
+    assert lookups.load(folder, None) == lookups.build(folder)
+
+
+def test_prefix():
+    assert lookups.prefix('ISO_COUNTRY', 'FR101') == 'FR'
+    assert lookups.prefix('ISO_COUNTRY', '!!') is None
+    assert lookups.description('ISO_COUNTRY', 'FR101') == \
+        lookups.description('ISO_COUNTRY', 'FR')
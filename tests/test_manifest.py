@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import pytest
+
+import manifest
+from manifest import Manifest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in ['award_en.xml', 'award_range.xml', 'invalid.xml']:
+        path = str(tmp_path / name)
+        shutil.copy(os.path.join(FIXTURES, name), path)
+        paths.append(path)
+    return paths
+
+
+def run(path, files, version='1.0', failed=()):
+    """
+    Process the stale files, as batch.iter_extract does
+    :return: files processed
+    """
+
+    db = Manifest(path, version)
+    selected = db.stale(files)
+    for name in selected:
+        db.done(name, 1 if name in failed else 0)
+    db.close()
+    return selected
+
+
+def test_unchanged(tmp_path, files):
+    path = str(tmp_path / 'manifest.sqlite')
+    assert run(path, files) == files
+    assert run(path, files) == []
+
+
+def test_touched_same_content(tmp_path, files, monkeypatch):
+    path = str(tmp_path / 'manifest.sqlite')
+    run(path, files)
+    stat = os.stat(files[0])
+    os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert run(path, files) == []
+
+    # The new modification time is recorded: the file is not hashed again
+    def file_hash(path):
+        raise AssertionError('hashed again: ' + path)
+
+    monkeypatch.setattr(manifest, 'file_hash', file_hash)
+    assert run(path, files) == []
+
+
+def test_changed_content(tmp_path, files):
+    path = str(tmp_path / 'manifest.sqlite')
+    run(path, files)
+    with open(files[1], 'ab') as f:
+        f.write(b'\n')
+    assert run(path, files) == files[1:2]
+
+
+def test_version_change(tmp_path, files):
+    path = str(tmp_path / 'manifest.sqlite')
+    run(path, files, manifest.version())
+    assert run(path, files, manifest.version()) == []
+    assert run(path, files, manifest.version(validate=False)) == files
+    assert run(path, files, manifest.version(prefilter=['7'])) == files
+
+
+def test_failed_retried(tmp_path, files):
+    path = str(tmp_path / 'manifest.sqlite')
+    run(path, files, failed=files[2:])
+    assert run(path, files, failed=files[2:]) == files[2:]
+    assert run(path, files) == files[2:]  # Fixed: no failure this time
+    assert run(path, files) == []
+
+
+def test_not_saved_without_commit(tmp_path, files):
+    path = str(tmp_path / 'manifest.sqlite')
+    db = Manifest(path, '1.0')
+    for name in db.stale(files):
+        db.done(name)
+    db.db.close()  # Crash before commit()
+    assert run(path, files) == files
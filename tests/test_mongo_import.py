@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import mongo_import
+from mongo_import import load_files, read_checkpoint
+
+
+class Result(object):
+
+    def __init__(self, upserted_count, matched_count):
+        self.upserted_count = upserted_count
+        self.matched_count = matched_count
+
+
+class FakeCollection(object):
+    """
+    In-memory stand-in for a pymongo collection: bulk_write of upserts on
+    DOC_ID, optionally failing after a number of batches
+    """
+
+    def __init__(self, fail_after=None):
+        self.documents = dict()
+        self.batches = 0
+        self.fail_after = fail_after
+
+    def bulk_write(self, requests, ordered=False):
+        if self.fail_after is not None and self.batches >= self.fail_after:
+            raise ConnectionError('lost connection')
+        self.batches += 1
+
+        inserted = replaced = 0
+        for doc_id, record in requests:
+            if doc_id in self.documents:
+                replaced += 1
+            else:
+                inserted += 1
+            self.documents[doc_id] = record
+        return Result(inserted, replaced)
+
+
+@pytest.fixture(autouse=True)
+def requests(monkeypatch):
+    # pymongo is optional: the fake collection takes (DOC_ID, record) pairs
+    monkeypatch.setattr(mongo_import, 'upserts', lambda batch: [
+        (record['DOC_ID'], record) for record in batch])
+
+
+def write_jsonl(path, doc_ids):
+    with open(str(path), 'w') as f:
+        for doc_id in doc_ids:
+            f.write(json.dumps({'DOC_ID': doc_id}) + '\n\n')
+    return str(path)
+
+
+def test_load(tmp_path):
+    path = write_jsonl(tmp_path / 'a.jsonl', range(10))
+    collection = FakeCollection()
+
+    stats = load_files([path], collection, batch_size=3)
+    assert stats['records'] == 10 and stats['inserted'] == 10
+    assert collection.batches == 4
+
+    stats = load_files([path], collection, batch_size=3)
+    assert stats['replaced'] == 10 and len(collection.documents) == 10
+
+
+def test_resume(tmp_path):
+    a = write_jsonl(tmp_path / 'a.jsonl', range(10))
+    b = write_jsonl(tmp_path / 'b.jsonl', range(10, 20))
+    checkpoint = str(tmp_path / 'load.checkpoint')
+
+    collection = FakeCollection(fail_after=2)
+    with pytest.raises(ConnectionError):
+        load_files([a, b], collection, batch_size=4, checkpoint=checkpoint)
+    assert len(collection.documents) == 8
+    assert list(read_checkpoint(checkpoint)) == [str(tmp_path / 'a.jsonl')]
+
+    # A file added in front does not shift the progress of the others
+    c = write_jsonl(tmp_path / 'c.jsonl', range(20, 25))
+    collection.fail_after = None
+    stats = load_files([c, a, b], collection, batch_size=4,
+                       checkpoint=checkpoint)
+    assert stats['resumed'] == 1
+    assert stats['records'] == 17 and stats['replaced'] == 0
+    assert sorted(collection.documents) == list(range(25))
+
+    # Everything is written: nothing is read again
+    stats = load_files([c, a, b], collection, checkpoint=checkpoint)
+    assert stats['records'] == 0 and stats['resumed'] == 3
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+from manifest import Manifest, version
+from pipeline import run
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'award_range.xml', 'award_defence.xml',
+           'award_no_preferred.xml', 'award_24.xml', 'empty_years.xml',
+           'empty_months.xml', 'oth_not.xml']
+
+
+class Buffered(object):
+    """
+    Sink keeping the records in memory until it is flushed
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.written = []
+
+    def write(self, record):
+        self.buffer.append(record)
+
+    def flush(self):
+        self.written.extend(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+class Recording(Manifest):
+    """
+    Manifest checking that the sink is flushed when it is saved
+    """
+
+    def __init__(self, path, sink):
+        super(Recording, self).__init__(path, version())
+        self.sink = sink
+        self.saved = []
+
+    def commit(self):
+        assert not self.sink.buffer
+        self.saved.append(len(self.sink.written))
+        super(Recording, self).commit()
+
+
+def test_flush_before_manifest(tmp_path):
+    for name in NOTICES:
+        shutil.copy(os.path.join(FIXTURES, name), str(tmp_path))
+
+    sink = Buffered()
+    manifest = Recording(str(tmp_path / 'manifest.sqlite'), sink)
+    counts = run([str(tmp_path)], [sink], workers=1, chunksize=2,
+                 manifest=manifest, sync=3)
+    manifest.close()
+
+    assert counts['records'] == len(NOTICES)
+    assert len(sink.written) == len(NOTICES)
+    # Saved every 2 units of work, once at least 3 records are written
+    assert manifest.saved == [4, 8]
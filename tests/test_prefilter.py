@@ -0,0 +1,105 @@
+import io
+import os
+from collections import Counter
+
+import pytest
+
+import batch
+from prefilter import DOCUMENT_TYPES, Skipped, parse
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'award_24.xml', 'oth_not.xml',
+           'contract_notice.xml', 'no_document_type.xml']
+
+
+def fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+def summary(results):
+    return [(path, record, error and (error['stage'], error['message']))
+            for path, record, error in results]
+
+
+@pytest.mark.parametrize('name, route', [
+    ('award_en.xml', 'full'), ('award_24.xml', 'full'),
+    ('oth_not.xml', 'head'), ('no_document_type.xml', 'full')])
+def test_parse(name, route):
+    root, parsed = parse(fixture(name), block_size=512)
+    assert parsed == route and root.get('DOC_ID')
+
+
+def test_skipped():
+    with pytest.raises(Skipped) as e:
+        parse(fixture('contract_notice.xml'))
+    assert str(e.value) == 'TD_DOCUMENT_TYPE 3'
+    root, _ = parse(fixture('contract_notice.xml'), ['3', '7'])
+    assert root.get('DOC_ID')
+
+
+class Counting(io.BytesIO):
+    """
+    Notice in memory, counting the bytes read
+    """
+
+    def __init__(self, content):
+        super(Counting, self).__init__(content)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super(Counting, self).read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def test_skipped_from_document_type():
+    with open(fixture('contract_notice.xml'), 'rb') as f:
+        content = f.read()
+    # About 200 kB of titles in the TRANSLATION_SECTION, before the form
+    title = content[content.index(b'<ML_TI_DOC'):
+                    content.index(b'</ML_TI_DOC>') + len(b'</ML_TI_DOC>')]
+    content = content.replace(b'<TRANSLATION_SECTION>',
+                              b'<TRANSLATION_SECTION>' + title * 2000)
+
+    assert len(content) > 150000
+
+    f = Counting(content)
+    with pytest.raises(Skipped):
+        parse(f, block_size=512)
+    # Read no further than the block of the TD_DOCUMENT_TYPE
+    assert f.bytes_read < content.index(b'</TD_DOCUMENT_TYPE>') + 512
+
+    f = Counting(content)
+    root, route = parse(f, ['3'], block_size=512)
+    assert route == 'full' and f.bytes_read == len(content)
+
+
+@pytest.mark.parametrize('name', ['award_en.xml', 'award_24.xml',
+                                  'oth_not.xml', 'no_document_type.xml'])
+@pytest.mark.parametrize('validate', [True, False])
+def test_same_as_full_parse(name, validate):
+    expected = batch.process(fixture(name), validate=validate)
+    record, error = batch.process(fixture(name), validate=validate,
+                                  prefilter=DOCUMENT_TYPES)
+    assert summary([(name, record, error)]) == summary([(name,) + expected])
+
+
+@pytest.mark.parametrize('validate', [True, False])
+def test_route(validate):
+    options = {'validate': validate, 'prefilter': DOCUMENT_TYPES}
+    results = batch.process_chunk(([fixture(name) for name in NOTICES],
+                                   options))
+    skipped = Counter()
+    kept = batch.route(results, skipped)
+
+    assert skipped == {'TD_DOCUMENT_TYPE 3': 1, 'OTH_NOT (head only)': 1}
+    assert [os.path.basename(path) for path, _, _ in kept] == [
+        'award_en.xml', 'award_24.xml', 'oth_not.xml',
+        'no_document_type.xml']
+    # A notice with no TD_DOCUMENT_TYPE is not skipped: the schema reports it
+    _, record, error = kept[-1]
+    if validate:
+        assert record is None and error['stage'] == 'validate'
+    else:
+        assert error is None
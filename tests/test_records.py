@@ -0,0 +1,32 @@
+import os
+import json
+import pickle
+
+import pytest
+
+import extractor
+import records
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_en.xml', 'award_range.xml', 'award_defence.xml',
+           'award_no_preferred.xml', 'award_24.xml', 'empty_years.xml',
+           'empty_months.xml', 'oth_not.xml']
+
+
+@pytest.mark.parametrize('name', NOTICES)
+@pytest.mark.parametrize('languages', [None, ['DE', 'EN']])
+def test_same_as_extractor(name, languages):
+    path = os.path.join(FIXTURES, name)
+    expected = extractor.extract(path, languages=languages)
+    record = records.extract(path, languages=languages).to_dict()
+
+    assert record == expected
+    assert json.dumps(record) == json.dumps(expected)  # Same key order
+
+
+def test_no_reference_to_the_document():
+    # Plain strings: the record does not keep the parsed document alive
+    record = records.extract(os.path.join(FIXTURES, 'award_en.xml'))
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert type(record.CONTRACT.CONTRACTING_AUTHORITY) is str
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+import pipeline
+import store
+from batch import process
+from store import Store, prefix_range
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+NOTICES = ['award_24.xml', 'award_defence.xml', 'award_en.xml',
+           'award_range.xml', 'oth_not.xml']
+
+
+def records():
+    return [process(os.path.join(FIXTURES, name))[0] for name in NOTICES]
+
+
+@pytest.fixture
+def stored(tmp_path):
+    db = Store(str(tmp_path / 'store.db'))
+    for record in records():
+        db.write(record)
+    db.commit()
+    yield db
+    db.close()
+
+
+def doc_ids(db, **criteria):
+    return [record['DOC_ID'] for record in db.query(**criteria)]
+
+
+def test_prefix_range():
+    assert prefix_range('45') == ('45', '46')
+    assert prefix_range('2015') == ('2015', '2016')
+
+
+def test_query(stored):
+    # By DS_DATE_DISPATCH
+    assert doc_ids(stored) == ['44498-2011', '273321-2012', '21226-2014',
+                               '254298-2015', '422939-2015']
+    assert doc_ids(stored, cpv='5') == ['44498-2011', '422939-2015']
+    assert doc_ids(stored, cpv='48017700') == ['273321-2012']
+    # Matched on both ORIGINAL_NUTS and NUTS, the notice listed once
+    assert doc_ids(stored, nuts='DE') == ['21226-2014']
+    assert doc_ids(stored, country='DE') == ['21226-2014', '422939-2015']
+    assert doc_ids(stored, date='2015') == ['254298-2015', '422939-2015']
+    assert doc_ids(stored, since='2012', until='2014') == [
+        '273321-2012', '21226-2014']
+    assert doc_ids(stored, authority='regional water authority') == [
+        '273321-2012', '254298-2015']
+    assert doc_ids(stored, contractor='DELTA IT SOLUTIONS') == [
+        '273321-2012', '422939-2015']
+    assert doc_ids(stored, country='PL',
+                   contractor='Nordic Supplies AB') == ['254298-2015']
+    assert doc_ids(stored, limit=2) == ['44498-2011', '273321-2012']
+    assert stored.count(cpv='5') == 2 and stored.count() == 5
+
+    record, = stored.query(cpv='48017700')
+    assert record == records()[2]
+
+
+@pytest.mark.parametrize('fts', [True, False])
+def test_text(tmp_path, monkeypatch, fts):
+    if not fts:
+        monkeypatch.setattr(store, 'FTS', 'CREATE VIRTUAL TABLE names '
+                                          'USING no_such_module (name)')
+    db = Store(str(tmp_path / 'store.db'))
+    for record in records():
+        db.write(record)
+    assert db.fts == fts
+
+    assert doc_ids(db, text='Linkgroup') == ['44498-2011']
+    assert doc_ids(db, text='water') == ['273321-2012', '254298-2015']
+    if fts:
+        assert doc_ids(db, text='nordic AND supplies') == ['254298-2015']
+    db.close()
+
+
+def test_write_replaces(stored):
+    record = records()[2]
+    record['CODED_DATA']['NOTICE_DATA']['ORIGINAL_CPV'] = ['45000000']
+    del record['CONTRACT']['CONTRACT_OBJECT']['CPV_MAIN']
+    record['CONTRACT']['AWARDS_OF_CONTRACT'] = []
+    stored.write(record)
+
+    assert stored.count() == 5
+    assert doc_ids(stored, cpv='48') == []
+    assert doc_ids(stored, cpv='45') == ['273321-2012']
+    assert doc_ids(stored, contractor='Omega Medical GmbH') == []
+    assert doc_ids(stored, text='Omega') == []
+    assert doc_ids(stored, text='water') == ['273321-2012', '254298-2015']
+
+
+@pytest.mark.parametrize('criteria, index', [
+    ({'cpv': '45'}, 'cpvs_cpv'),
+    ({'nuts': 'DE'}, 'nuts_nuts'),
+    ({'country': 'DE', 'date': '2015'}, 'notices_country'),
+    ({'since': '2015'}, 'notices_date'),
+    ({'authority': 'Regional Water Authority'}, 'notices_authority'),
+    ({'contractor': 'Delta IT Solutions'}, 'contractors_name'),
+])
+def test_indexes(stored, criteria, index):
+    sql, parameters = stored.where(**criteria)
+    plan = stored.db.execute('EXPLAIN QUERY PLAN SELECT record FROM notices'
+                             + sql, parameters).fetchall()
+    assert any(index in row[-1] for row in plan)
+
+
+def test_store_needs_validation(tmp_path):
+    with pytest.raises(SystemExit):
+        pipeline.main(['--store', str(tmp_path / 'store.db'),
+                       '--no-validate', FIXTURES])
+    assert not os.path.exists(str(tmp_path / 'store.db'))
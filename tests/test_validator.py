@@ -0,0 +1,86 @@
+import os
+import copy
+
+import pytest
+
+import extractor
+from validator import schema, validate_batch
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Values put in place of each field of the raw records: missing, several,
+# malformed numbers, unknown codes, and values not in the shape of extract()
+VALUES = [[], ['1 000,50'], ['abc'], ['X'], ['YES', 'NO'], None, {}]
+
+
+# Fixtures mutated: range values, empty durations and an OTH_NOT form
+MUTATED = ['award_range.xml', 'empty_years.xml', 'oth_not.xml']
+
+
+def raw_records(names=None):
+    names = names or sorted(name for name in os.listdir(FIXTURES)
+                            if name.endswith('.xml'))
+    return [extractor.extract(os.path.join(FIXTURES, name))
+            for name in names]
+
+
+def fields(obj, path=()):
+    """
+    List the paths to the fields of a record, down to the lists of strings
+    """
+
+    items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+    for key, value in items:
+        yield path + (key,)
+        if isinstance(value, dict) or (isinstance(value, list) and
+                                       value and
+                                       not isinstance(value[0], str)):
+            yield from fields(value, path + (key,))
+
+
+def mutations(record):
+    """
+    Copies of a record with one field replaced or removed. The awards
+    after the first one are left as they are
+    """
+
+    for path in list(fields(record)):
+        if any(isinstance(key, int) and key > 0 for key in path[:-1]):
+            continue
+        for value in VALUES + [KeyError]:
+            mutated = copy.deepcopy(record)
+            container = mutated
+            for key in path[:-1]:
+                container = container[key]
+            if value is not KeyError:
+                container[path[-1]] = copy.deepcopy(value)
+            elif isinstance(container, dict):
+                del container[path[-1]]
+            else:
+                continue
+            yield mutated
+
+
+def per_document(records):
+    data, errors = [], []
+    for i, record in enumerate(copy.deepcopy(records)):
+        try:
+            data.append(schema(record))
+        except Exception as e:
+            data.append(record)
+            errors.append((i, type(e), str(e)))
+    return data, errors
+
+
+@pytest.mark.parametrize('mutate', [False, True])
+def test_batch_same_as_schema(mutate):
+    records = raw_records()
+    if mutate:
+        records = [mutated for record in raw_records(MUTATED)
+                   for mutated in mutations(record)]
+    expected, expected_errors = per_document(records)
+
+    data, errors = validate_batch(copy.deepcopy(records))
+    assert data == expected
+    assert [(i, type(e), str(e)) for i, e in errors] == expected_errors
+    assert len(expected_errors) < len(records)
@@ -1,22 +1,12 @@
-import os
 import re
-import pandas as pd
-from extractor import extract
+from collections import defaultdict
+import lookups
 from voluptuous import (Schema, Required, All, Optional, Length, Any,
-                        MultipleInvalid, Match, Coerce)
-
-# Lookups
-iso_country = pd.read_csv('./Lookups/ISO_COUNTRY.csv', dtype='str',
-                          encoding='latin', keep_default_na=False)
-cpv = pd.read_csv('./Lookups/CPV.csv', dtype='str')
-ma = pd.read_csv('./Lookups/MA_MAIN_ACTIVITY.csv', dtype='str')
-td = pd.read_csv('./Lookups/TD_DOCUMENT_TYPE.csv', dtype='str')
-nc = pd.read_csv('./Lookups/NC_CONTRACT_NATURE.csv', dtype='str')
-aa = pd.read_csv('./Lookups/AA_AUTHORITY_TYPE.csv', dtype='str')
-pr = pd.read_csv('./Lookups/PR_PROC.csv', dtype='str')
-ty = pd.read_csv('./Lookups/TY_TYPE_BID.csv', dtype='str')
-ac = pd.read_csv('./Lookups/AC_AWARD_CRIT.csv', dtype='str')
-rp = pd.read_csv('./Lookups/RP_REGULATION.csv', dtype='str')
+                        Coerce, ValueInvalid, MatchInvalid)
+
+# Version of the validation, stored in the manifest of incremental runs:
+# bump it whenever the schema changes
+VERSION = '1.0'
 
 # Allowed Currencies
 currencies = ['EUR', 'BGN', 'CHF', 'USD', 'HRK', 'CZK', 'DKK', 'HUF', 'SEK',
@@ -26,7 +16,12 @@ currencies = ['EUR', 'BGN', 'CHF', 'USD', 'HRK', 'CZK', 'DKK', 'HUF', 'SEK',
 
 def number(s):
     n = re.sub(r'\s', '', s.replace(',', '.').replace('%', ''))
-    return float(n)
+    try:
+        return float(n)
+    except ValueError:
+        # Raised as Invalid: Coerce(number) fails with a TypeError on the
+        # ValueError of a function, instead of trying the next alternative
+        raise ValueInvalid('expected a number')
 
 
 def concatenate(lst):
@@ -36,6 +31,32 @@ def concatenate(lst):
 def flat(lst):
     return lst[0]
 
+
+def code(name):
+    """
+    Validator of the codes of a lookup, with a hash lookup
+    :param name: lookup name, see lookups.TABLES
+    """
+
+    def validate(s):
+        if s not in lookups.codes(name):  # Loaded on first use
+            raise ValueInvalid('not a valid value')
+        return s
+    return validate
+
+
+def starts_with(name):
+    """
+    Validator of strings starting with a code of a lookup, with a trie
+    :param name: lookup name, see lookups.PREFIXES
+    """
+
+    def validate(s):
+        if lookups.prefix(name, s) is None:
+            raise MatchInvalid('does not start with a code of ' + name)
+        return s
+    return validate
+
 # Sub Schemas
 value = Schema({
     Optional('CURRENCY'): All(str, Any(*currencies)),
@@ -56,24 +77,28 @@ contract_value = Schema({
 contractor = Schema({
     Optional(str): Any([], All(Coerce(flat), str)),
     Optional('COUNTRY'): Any([], All(Coerce(flat), str, Length(2),
-                                     Any(*iso_country.Code)))
+                                     code('ISO_COUNTRY')))
 })
 
-match_nuts = Match('^(' + '|'.join(iso_country.Code) + ')')
+match_nuts = starts_with('ISO_COUNTRY')
 
-match_cpv = Match('^(' + '|'.join(cpv.CODE) + ')')
+match_cpv = starts_with('CPV')
 
 
 # Document Schema
 schema = Schema({
     Required('DOC_ID'): str,
+    Optional('SOURCE'): {  # Notices read from a TED package
+        Required('ARCHIVE'): str,
+        Required('MEMBER'): str
+    },
     Required('CODED_DATA'): {
         Required('NOTICE_DATA'): {
             Required('NO_DOC_OJS'): All(Coerce(flat), str),
             Required('ORIGINAL_NUTS'): [All(str, match_nuts)],
             Required('ORIGINAL_CPV'): [All(str, match_cpv)],
             Required('ISO_COUNTRY'): All(Coerce(flat), str, Length(2),
-                                         Any(*iso_country.Code)),
+                                         code('ISO_COUNTRY')),
             Required('IA_URL_GENERAL'): Any([], All(Coerce(flat), str)),
             Required('REF_NOTICE'): [str],
             Required('VALUES_LIST'): {
@@ -84,16 +109,20 @@ schema = Schema({
         Required('CODIF_DATA'): {
             Required('DS_DATE_DISPATCH'): All(Coerce(flat), str),
             Required('TD_DOCUMENT_TYPE'): All(Coerce(flat), str,
-                                              Any(*td.CODE)),
+                                              code('TD_DOCUMENT_TYPE')),
             Required('AA_AUTHORITY_TYPE'): All(Coerce(flat), str,
-                                               Any(*aa.CODE)),
+                                               code('AA_AUTHORITY_TYPE')),
             Required('NC_CONTRACT_NATURE'): All(Coerce(flat), str,
-                                                Any(*nc.CODE)),
-            Required('PR_PROC'): All(Coerce(flat), str, Any(*pr.CODE)),
-            Required('RP_REGULATION'): All(Coerce(flat), str, Any(*rp.CODE)),
-            Required('TY_TYPE_BID'): All(Coerce(flat), str, Any(*ty.CODE)),
-            Required('AC_AWARD_CRIT'): All(Coerce(flat), str, Any(*ac.CODE)),
-            Required('MA_MAIN_ACTIVITIES'): [All(str, Any(*ma.CODE))]
+                                                code('NC_CONTRACT_NATURE')),
+            Required('PR_PROC'): All(Coerce(flat), str, code('PR_PROC')),
+            Required('RP_REGULATION'): All(Coerce(flat), str,
+                                           code('RP_REGULATION')),
+            Required('TY_TYPE_BID'): All(Coerce(flat), str,
+                                         code('TY_TYPE_BID')),
+            Required('AC_AWARD_CRIT'): All(Coerce(flat), str,
+                                           code('AC_AWARD_CRIT')),
+            Required('MA_MAIN_ACTIVITIES'): [All(str,
+                                                 code('MA_MAIN_ACTIVITY'))]
         }
     },
     Required('CONTRACT'): {
@@ -125,32 +154,457 @@ def prune(node):
             else:
                 del node[k]
 
+
+# Batch validation: same checks as the schema, gathered by column over a
+# batch of records and run with hash lookups and pandas vectorized operations
+
+# Column: lookup name (see lookups.TABLES), or set of codes
+CODES = {
+    'ISO_COUNTRY': 'ISO_COUNTRY',
+    'CURRENCY': frozenset(currencies),
+    'TD_DOCUMENT_TYPE': 'TD_DOCUMENT_TYPE',
+    'AA_AUTHORITY_TYPE': 'AA_AUTHORITY_TYPE',
+    'NC_CONTRACT_NATURE': 'NC_CONTRACT_NATURE',
+    'PR_PROC': 'PR_PROC',
+    'RP_REGULATION': 'RP_REGULATION',
+    'TY_TYPE_BID': 'TY_TYPE_BID',
+    'AC_AWARD_CRIT': 'AC_AWARD_CRIT',
+    'MA_MAIN_ACTIVITIES': 'MA_MAIN_ACTIVITY',
+    'YES_NO': frozenset(['YES', 'NO'])
+}
+
+# Codes which must start the value (match_nuts, match_cpv)
+PREFIXES = {
+    'NUTS': 'ISO_COUNTRY',
+    'CPV': 'CPV'
+}
+
+
+def codeset(column):
+    """
+    Codes allowed in a column of the batch, the lookups are loaded on first
+    use
+    :param column: key of CODES
+    :return: frozenset of codes
+    """
+
+    codes = CODES[column]
+    return lookups.codes(codes) if isinstance(codes, str) else codes
+
+
+def vectorized():
+    """
+    Import pandas on first use: it is only needed by the batch validation,
+    and is optional
+    :return: tuple (pandas, numpy), None if pandas is not installed
+    """
+
+    try:
+        import numpy
+        import pandas
+    except ImportError:
+        return None
+    return pandas, numpy
+
+
+class Fallback(Exception):
+    """
+    The record does not have the shape expected by the batch validation:
+    it is left to the schema
+    """
+
+
+class Columns(object):
+    """
+    Values of a batch of records to check or convert, by column.
+    Each value is stored with the index of its record
+    """
+
+    def __init__(self):
+        self.codes = defaultdict(lambda: ([], []))
+        self.prefixes = defaultdict(lambda: ([], []))
+        self.numbers = ([], [])  # Values are (container, key, string)
+
+    def code(self, i, lookup, s):
+        if not isinstance(s, str):
+            raise Fallback
+        self.codes[lookup][0].append(i)
+        self.codes[lookup][1].append(s)
+        return s
+
+    def prefix(self, i, lookup, s):
+        if not isinstance(s, str):
+            raise Fallback
+        self.prefixes[lookup][0].append(i)
+        self.prefixes[lookup][1].append(s)
+        return s
+
+    def number(self, i, container, key, s):
+        self.numbers[0].append(i)
+        self.numbers[1].append((container, key, s))
+
+
+def first(lst):
+    """
+    All(Coerce(flat), str)
+    """
+
+    if type(lst) is not list or not lst or not isinstance(lst[0], str):
+        raise Fallback
+    return lst[0]
+
+
+def strings(lst):
+    """
+    [str]
+    """
+
+    if type(lst) is not list or not all(isinstance(s, str) for s in lst):
+        raise Fallback
+    return list(lst)
+
+
+def coerce_value(i, node, columns):
+    """
+    value Sub Schema
+    """
+
+    if type(node) is not dict:
+        raise Fallback
+
+    obj = dict()
+    for key, item in node.items():
+        if key == 'CURRENCY':
+            obj[key] = columns.code(i, 'CURRENCY', item)
+        elif not isinstance(key, str):
+            raise Fallback
+        elif item == []:
+            obj[key] = []
+        else:
+            obj[key] = None
+            columns.number(i, obj, key, first(item))
+    return obj
+
+
+def coerce_contract_value(i, node, columns):
+    """
+    contract_value Sub Schema
+    """
+
+    if type(node) is not dict:
+        raise Fallback
+
+    obj = dict()
+    for key, item in node.items():
+        if key in ('NUMBER_OF_YEARS', 'NUMBER_OF_MONTHS'):
+            if item == []:
+                obj[key] = []
+            else:
+                obj[key] = None
+                columns.number(i, obj, key, first(item))
+        elif isinstance(key, str):
+            obj[key] = coerce_value(i, item, columns)
+        else:
+            raise Fallback
+    return obj
+
+
+def coerce_contractor(i, node, columns):
+    """
+    contractor Sub Schema
+    """
+
+    if type(node) is not dict:
+        raise Fallback
+
+    obj = dict()
+    for key, item in node.items():
+        if not isinstance(key, str):
+            raise Fallback
+        elif item == []:
+            obj[key] = []
+        elif key == 'COUNTRY':
+            obj[key] = columns.code(i, 'ISO_COUNTRY', first(item))
+        else:
+            obj[key] = first(item)
+    return obj
+
+
+def coerce_object(i, node, columns):
+    """
+    CONTRACT_OBJECT section of the schema
+    """
+
+    if type(node) is not dict:
+        raise Fallback
+
+    obj = dict()
+    for key, item in node.items():
+        if key == 'NUTS':
+            obj[key] = [columns.prefix(i, 'NUTS', s) for s in strings(item)]
+        elif key == 'NUTS_EXTRA':
+            obj[key] = concatenate(strings(item))
+        elif key == 'CPV_MAIN':
+            obj[key] = [] if item == [] else columns.prefix(i, 'CPV',
+                                                            first(item))
+        elif key == 'CONTRACT_VALUE':
+            obj[key] = coerce_contract_value(i, item, columns)
+        elif not isinstance(key, str):
+            raise Fallback
+        else:
+            obj[key] = [] if item == [] else columns.code(i, 'YES_NO',
+                                                          first(item))
+    return obj
+
+
+def coerce_section(i, node, required, fields, columns):
+    """
+    Coerce a section of the schema made of fixed keys
+    :param i: index of the record
+    :param node: section of the record
+    :param required: keys which must be in the section
+    :param fields: dictionary of key: function(i, item, columns)
+    :param columns: Columns of the batch
+    :return: coerced section
+    """
+
+    if type(node) is not dict or not required.issubset(node):
+        raise Fallback
+
+    obj = dict()
+    for key, item in node.items():
+        if key not in fields:
+            raise Fallback  # Extra keys are not allowed
+        obj[key] = fields[key](i, item, columns)
+    return obj
+
+
+def code_field(lookup):
+    return lambda i, item, columns: columns.code(i, lookup, first(item))
+
+
+def value_list(i, item, columns):
+    if type(item) is not list:
+        raise Fallback
+    return [coerce_value(i, node, columns) for node in item]
+
+
+def award_list(i, item, columns):
+    if type(item) is not list:
+        raise Fallback
+    return [coerce_section(i, node, AWARD_REQUIRED, AWARD_FIELDS, columns)
+            for node in item]
+
+
+NOTICE_DATA_FIELDS = {
+    'NO_DOC_OJS': lambda i, item, columns: first(item),
+    'ORIGINAL_NUTS': lambda i, item, columns: [
+        columns.prefix(i, 'NUTS', s) for s in strings(item)],
+    'ORIGINAL_CPV': lambda i, item, columns: [
+        columns.prefix(i, 'CPV', s) for s in strings(item)],
+    'ISO_COUNTRY': code_field('ISO_COUNTRY'),
+    'IA_URL_GENERAL': lambda i, item, columns: [] if item == [] else first(
+        item),
+    'REF_NOTICE': lambda i, item, columns: strings(item),
+    'VALUES_LIST': lambda i, item, columns: coerce_section(
+        i, item, frozenset(), VALUES_LIST_FIELDS, columns)
+}
+VALUES_LIST_FIELDS = {
+    'GLOBAL_VALUE': coerce_value,
+    'CONTRACTS_VALUE': value_list
+}
+CODIF_DATA_FIELDS = {
+    'DS_DATE_DISPATCH': lambda i, item, columns: first(item),
+    'TD_DOCUMENT_TYPE': code_field('TD_DOCUMENT_TYPE'),
+    'AA_AUTHORITY_TYPE': code_field('AA_AUTHORITY_TYPE'),
+    'NC_CONTRACT_NATURE': code_field('NC_CONTRACT_NATURE'),
+    'PR_PROC': code_field('PR_PROC'),
+    'RP_REGULATION': code_field('RP_REGULATION'),
+    'TY_TYPE_BID': code_field('TY_TYPE_BID'),
+    'AC_AWARD_CRIT': code_field('AC_AWARD_CRIT'),
+    'MA_MAIN_ACTIVITIES': lambda i, item, columns: [
+        columns.code(i, 'MA_MAIN_ACTIVITIES', s) for s in strings(item)]
+}
+CODED_DATA_FIELDS = {
+    'NOTICE_DATA': lambda i, item, columns: coerce_section(
+        i, item, frozenset(NOTICE_DATA_FIELDS), NOTICE_DATA_FIELDS, columns),
+    'CODIF_DATA': lambda i, item, columns: coerce_section(
+        i, item, frozenset(CODIF_DATA_FIELDS), CODIF_DATA_FIELDS, columns)
+}
+AWARD_REQUIRED = frozenset()
+AWARD_FIELDS = {
+    'CONTRACTOR': coerce_contractor,
+    'CONTRACT_VALUE': coerce_contract_value
+}
+CONTRACT_FIELDS = {
+    'OTH_NOT': code_field('YES_NO'),
+    'CONTRACTING_AUTHORITY': lambda i, item, columns: first(item),
+    'CONTRACT_OBJECT': coerce_object,
+    'AWARDS_OF_CONTRACT': award_list
+}
+SOURCE_FIELDS = {
+    'ARCHIVE': lambda i, item, columns: str_field(item),
+    'MEMBER': lambda i, item, columns: str_field(item)
+}
+RECORD_FIELDS = {
+    'DOC_ID': lambda i, item, columns: str_field(item),
+    'SOURCE': lambda i, item, columns: coerce_section(
+        i, item, frozenset(SOURCE_FIELDS), SOURCE_FIELDS, columns),
+    'CODED_DATA': lambda i, item, columns: coerce_section(
+        i, item, frozenset(CODED_DATA_FIELDS), CODED_DATA_FIELDS, columns),
+    'CONTRACT': lambda i, item, columns: coerce_section(
+        i, item, frozenset(['OTH_NOT']), CONTRACT_FIELDS, columns)
+}
+RECORD_REQUIRED = frozenset(['DOC_ID', 'CODED_DATA', 'CONTRACT'])
+
+
+def str_field(s):
+    if not isinstance(s, str):
+        raise Fallback
+    return s
+
+
+def check_codes(columns):
+    """
+    Check the codes of a batch against the lookups
+    :param columns: Columns of the batch
+    :return: set of indices of the records with an invalid code
+    """
+
+    modules = vectorized()
+    invalid = set()
+
+    for column, (index, values) in columns.codes.items():
+        codes = codeset(column)
+        if modules is None:
+            invalid.update(i for i, s in zip(index, values) if s not in codes)
+            continue
+        pd, np = modules
+        valid = pd.Series(values, dtype=object).isin(codes)
+        invalid.update(np.asarray(index)[~valid.to_numpy()])
+
+    for column, (index, values) in columns.prefixes.items():
+        name = PREFIXES[column]
+        if modules is None:
+            invalid.update(i for i, s in zip(index, values)
+                           if lookups.prefix(name, s) is None)
+            continue
+        pd, np = modules
+        values = pd.Series(values, dtype=object)
+        valid = np.zeros(len(values), dtype=bool)
+        codes = lookups.codes(name)
+        for length in set(map(len, codes)):
+            valid |= values.str[:length].isin(codes).to_numpy()
+        invalid.update(np.asarray(index)[~valid])
+
+    return invalid
+
+
+def convert_numbers(columns):
+    """
+    Convert the numbers of a batch, as number() does, and write them in
+    the coerced records
+    :param columns: Columns of the batch
+    :return: set of indices of the records with a value which is not a
+             number
+    """
+
+    index, numbers = columns.numbers
+    if not numbers:
+        return set()
+
+    invalid = set()
+    modules = vectorized()
+
+    if modules is None:
+        for i, (container, key, s) in zip(index, numbers):
+            try:
+                container[key] = number(s)
+            except ValueInvalid:
+                invalid.add(i)
+        return invalid
+
+    pd, np = modules
+    values = pd.Series([s for _, _, s in numbers], dtype=object)
+    values = values.str.replace(',', '.', regex=False) \
+                   .str.replace('%', '', regex=False) \
+                   .str.replace(r'\s', '', regex=True).to_numpy()
+
+    try:
+        floats = values.astype(float)  # float() on each string
+    except ValueError:
+        floats = np.full(len(values), np.nan)
+        for n, s in enumerate(values):
+            try:
+                floats[n] = float(s)
+            except ValueError:
+                invalid.add(index[n])
+
+    for (container, key, _), f in zip(numbers, floats.tolist()):
+        container[key] = f
+
+    return invalid
+
+
+def validate_batch(records):
+    """
+    Validate a batch of records at once.
+    Records are flattened into columns of codes and numbers, which are
+    checked and converted for the whole batch. Records which are not valid,
+    or not in the shape produced by extract(), go through the schema to get
+    the same output and errors as the per-document validation
+    :param records: list of raw records, as returned by extract()
+    :return: tuple (data, errors):
+        - data: list of records, coerced by the schema, or unchanged if not
+                valid
+        - errors: list of (index of the record, exception raised by the
+                  schema)
+    """
+
+    columns = Columns()
+    coerced = []
+    invalid = set()
+
+    for i, record in enumerate(records):
+        try:
+            coerced.append(coerce_section(i, record, RECORD_REQUIRED,
+                                          RECORD_FIELDS, columns))
+        except Fallback:
+            coerced.append(None)
+            invalid.add(i)
+
+    invalid |= check_codes(columns)
+    invalid |= convert_numbers(columns)
+
+    data = []
+    errors = []
+    for i, record in enumerate(records):
+        if i not in invalid:
+            data.append(coerced[i])
+            continue
+        try:
+            data.append(schema(record))
+        except Exception as e:
+            data.append(record)
+            errors.append((i, e))
+
+    return data, errors
+
+
 if __name__ == "__main__":
 
-    Y = '2013'
-    M = '01'
+    from batch import month_folders
+    from pipeline import run, JsonLines
 
     years = ['2013', '2014', '2015', '2016']
     months = ['01', '02', '03', '04', '05', '06', '07', '08',
               '09', '10', '11', '12']
 
-    collection = []
+    # Records are written as they are validated, rather than collected in
+    # memory: see pipeline.py
     for Y in years:
         print(Y)
-        for M in months:
-            print(M)
-            # Folder containing xml files
-            DIR = os.path.join('/Volumes/WD/S8', Y + '-' + M)
-            # List xml files
-            files = os.listdir(DIR)
-            for f in files:
-                # Extract data from xml file
-                file_path = os.path.join(DIR, f)
-                data = extract(file_path)
-                try:
-                    data = schema(data)
-                except MultipleInvalid as e:
-                    print(str(e) + ' ---- file: ' + file_path)
-
-                prune(data)
-                collection.append(data)
+        counts = run(month_folders('/Volumes/WD/S8', [Y], months),
+                     [JsonLines('awards_' + Y + '.jsonl')],
+                     JsonLines('errors_' + Y + '.jsonl'))
+        print('{records} notices, {failed} failed'.format(**counts))